@@ -0,0 +1,916 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""In-process fake GitHub server.
+
+Serves the subset of the REST and GraphQL APIs used by the tools
+on localhost, with the layout of GitHub Enterprise (`/api/v3`)
+so that `github3.GitHubEnterprise` can talk to it.
+State is kept in memory and changed by write requests,
+hence a 2nd run against the same server sees the result of the 1st one.
+
+Latency and rate limit are configurable. Requests are counted by endpoint.
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from oca_repo_maintainer.tools import gh_state
+
+API_PREFIX = "/api/v3"
+# github3 builds the GraphQL url on top of the REST one
+GRAPHQL_PATHS = ("/api/graphql", API_PREFIX + "/graphql")
+PER_PAGE = 30
+# to avoid a 2nd copy of each object in responses
+DATE = "2024-01-01T00:00:00Z"
+
+
+class FakeTeam:
+    def __init__(self, id_, slug, members=None, pending=None, repos=None):
+        self.id = id_
+        self.slug = slug
+        # login: role
+        self.members = dict(members or {})
+        # login: role, invitations sent w/o role are for members
+        self.pending = (
+            dict(pending)
+            if isinstance(pending, dict)
+            else dict.fromkeys(pending or (), "member")
+        )
+        # repo name: permission
+        self.repos = dict(repos or {})
+
+
+class FakeRepo:
+    def __init__(
+        self,
+        id_,
+        name,
+        default_branch=None,
+        branches=(),
+        collaborators=(),
+        invited=(),
+        pushed_at=DATE,
+    ):
+        self.id = id_
+        self.name = name
+        self.pushed_at = pushed_at
+        self.default_branch = default_branch
+        self.branches = set(branches)
+        self.collaborators = set(collaborators)
+        # login: invitation id
+        self.invitations = {login: i for i, login in enumerate(sorted(invited), 1)}
+
+
+class FakeOrg:
+    """State of the fake organization."""
+
+    def __init__(self, login="OCA"):
+        self.login = login
+        self.teams = {}
+        self.repos = {}
+        self._ids = itertools.count(1000)
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add_team(self, slug, **kw):
+        self.teams[slug] = FakeTeam(self.next_id(), slug, **kw)
+        return self.teams[slug]
+
+    def add_repo(self, name, **kw):
+        self.repos[name] = FakeRepo(self.next_id(), name, **kw)
+        return self.repos[name]
+
+    def team_by_id(self, id_):
+        for team in self.teams.values():
+            if team.id == int(id_):
+                return team
+        return None
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message="Not Found"):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class FakeGitHub:
+    """Fake GitHub server running in a background thread.
+
+    `latency` (seconds) is added to each request.
+    `rate_limit` is the amount of requests allowed: when exhausted
+    403 responses are returned, like GitHub does.
+    """
+
+    def __init__(self, org=None, latency=0.0, rate_limit=5000):
+        self.org = org or FakeOrg()
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_used = 0
+        self.rate_reset = int(time.time()) + 3600
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._routes = self._make_routes()
+
+    # Server lifecycle
+
+    def start(self):
+        handler = type("Handler", (_RequestHandler,), {"fake": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return self.url + API_PREFIX
+
+    def reset_stats(self):
+        with self._stats_lock:
+            stats = Counter(self.stats)
+            self.stats.clear()
+        return stats
+
+    # Request handling
+
+    def _make_routes(self):
+        org = r"/orgs/(?P<org>[^/]+)"
+        team = r"/organizations/\d+/team/(?P<team>\d+)"
+        repo = r"/repos/(?P<org>[^/]+)/(?P<repo>[^/]+)"
+        routes = [
+            ("GET", "/user", self.get_user),
+            ("GET", org, self.get_org),
+            ("GET", org + r"/teams", self.list_teams),
+            ("GET", org + r"/teams/(?P<slug>[^/]+)", self.get_team),
+            ("POST", org + r"/teams", self.create_team),
+            ("GET", org + r"/repos", self.list_org_repos),
+            ("POST", org + r"/repos", self.create_repo),
+            ("GET", team + r"/members", self.list_team_members),
+            ("GET", team + r"/invitations", self.list_team_invitations),
+            ("GET", team + r"/repos", self.list_team_repos),
+            ("GET", team + r"/memberships/(?P<user>[^/]+)", self.get_membership),
+            ("PUT", team + r"/memberships/(?P<user>[^/]+)", self.set_membership),
+            ("DELETE", team + r"/memberships/(?P<user>[^/]+)", self.del_membership),
+            (
+                "PUT",
+                team + r"/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)",
+                self.add_team_repo,
+            ),
+            ("GET", repo, self.get_repo),
+            ("PATCH", repo, self.edit_repo),
+            ("GET", repo + r"/branches", self.list_branches),
+            ("GET", repo + r"/collaborators", self.list_collaborators),
+            (
+                "PUT",
+                repo + r"/collaborators/(?P<user>[^/]+)",
+                self.add_collaborator,
+            ),
+            (
+                "DELETE",
+                repo + r"/collaborators/(?P<user>[^/]+)",
+                self.del_collaborator,
+            ),
+            ("GET", repo + r"/invitations", self.list_repo_invitations),
+            ("DELETE", repo + r"/invitations/(?P<id>\d+)", self.del_repo_invitation),
+            ("PUT", repo + r"/contents/(?P<path>.+)", self.create_file),
+            ("POST", repo + r"/git/trees", self.create_tree),
+            ("POST", repo + r"/git/commits", self.create_commit),
+            ("POST", repo + r"/git/refs", self.create_ref),
+            ("GET", repo + r"/git/refs?/heads/(?P<branch>.+)", self.get_ref),
+            ("PATCH", repo + r"/git/refs/heads/(?P<branch>.+)", self.update_ref),
+        ]
+        return [
+            (method, re.compile(f"^{pattern}$"), pattern, func)
+            for method, pattern, func in routes
+        ]
+
+    def _endpoint(self, method, path):
+        """Return the name of the endpoint and the function serving it."""
+        if path in GRAPHQL_PATHS and method == "POST":
+            return "POST /graphql", self.graphql, {}
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX) :]
+            for route_method, regex, pattern, func in self._routes:
+                match = regex.match(path)
+                if match and route_method == method:
+                    name = re.sub(r"\(\?P<(\w+)>[^)]+\)", r"{\1}", pattern)
+                    name = name.replace(r"\d+", "{id}").replace("refs?", "ref")
+                    return f"{method} {name}", func, match.groupdict()
+        return f"{method} (unknown)", None, {}
+
+    def handle(self, method, raw_path, headers, body):
+        """Return status, headers and body of the response."""
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(raw_path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        name, func, kwargs = self._endpoint(method, parsed.path)
+        with self._stats_lock:
+            self.stats[name] += 1
+            self.rate_used += 1
+            remaining = max(0, self.rate_limit - self.rate_used)
+        response_headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(self.rate_reset),
+            "X-RateLimit-Used": str(self.rate_used),
+            "X-RateLimit-Resource": "graphql" if func == self.graphql else "core",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+        if self.rate_used > self.rate_limit:
+            return 403, response_headers, {"message": "API rate limit exceeded"}
+        if func is None:
+            return 404, response_headers, {"message": "Not Found"}
+        data = json.loads(body) if body else {}
+        request = {
+            "path": parsed.path[len(API_PREFIX) :],
+            "query": query,
+            "data": data,
+            "headers": headers,
+        }
+        try:
+            with self.org.lock:
+                status, result, extra_headers = self._call(func, request, kwargs)
+        except HTTPError as err:
+            return err.status, response_headers, {"message": err.message}
+        response_headers.update(extra_headers)
+        if method == "GET" and status == 200:
+            etag = '"%s"' % hashlib.md5(json.dumps(result).encode()).hexdigest()
+            response_headers["ETag"] = etag
+            if headers.get("If-None-Match") == etag:
+                # not counted against the rate limit on GitHub
+                with self._stats_lock:
+                    self.rate_used -= 1
+                return 304, response_headers, None
+        return status, response_headers, result
+
+    def _call(self, func, request, kwargs):
+        result = func(request, **kwargs)
+        status = 200
+        headers = {}
+        if isinstance(result, tuple):
+            status, result = result
+        if isinstance(result, _Page):
+            headers = result.headers
+            result = result.items
+        return status, result, headers
+
+    def _paginate(self, request, items):
+        query = request["query"]
+        per_page = int(query.get("per_page", PER_PAGE))
+        page = int(query.get("page", 1))
+        start = (page - 1) * per_page
+        result = _Page(items[start : start + per_page])
+        if start + per_page < len(items):
+            next_query = dict(query, page=page + 1, per_page=per_page)
+            url = f"{self.api_url}{request['path']}?{urlencode(next_query)}"
+            result.headers["Link"] = f'<{url}>; rel="next"'
+        return result
+
+    # JSON builders
+
+    def _urls(self, base, *names):
+        return {f"{name}_url": f"{base}/{name}" for name in names}
+
+    def user_json(self, login):
+        base = f"{self.api_url}/users/{login}"
+        data = {
+            "login": login,
+            "id": int(hashlib.md5(login.encode()).hexdigest()[:6], 16),
+            "url": base,
+            "html_url": f"https://github.com/{login}",
+            "gravatar_id": "",
+            "type": "User",
+            "avatar_url": "",
+            "starred_url": f"{base}/starred{{/owner}}{{/repo}}",
+            "following_url": f"{base}/following{{/other_user}}",
+            "gists_url": f"{base}/gists{{/gist_id}}",
+        }
+        data.update(
+            self._urls(
+                base,
+                "events",
+                "followers",
+                "organizations",
+                "received_events",
+                "repos",
+                "subscriptions",
+            )
+        )
+        return data
+
+    def org_json(self):
+        base = f"{self.api_url}/orgs/{self.org.login}"
+        data = {
+            "login": self.org.login,
+            "id": 1,
+            "url": base,
+            "html_url": f"https://github.com/{self.org.login}",
+            "avatar_url": "",
+            "description": "",
+            "created_at": DATE,
+            "followers": 0,
+            "following": 0,
+            "public_repos": len(self.org.repos),
+            "members_url": f"{base}/members{{/member}}",
+            "public_members_url": f"{base}/public_members{{/member}}",
+        }
+        data.update(self._urls(base, "events", "hooks", "issues", "repos"))
+        return data
+
+    def team_json(self, team):
+        base = f"{self.api_url}/organizations/1/team/{team.id}"
+        return {
+            "id": team.id,
+            "slug": team.slug,
+            "name": team.slug,
+            "description": None,
+            "url": base,
+            "permission": "pull",
+            "members_url": f"{base}/members{{/member}}",
+            "repositories_url": f"{base}/repos",
+            "created_at": DATE,
+            "updated_at": DATE,
+            "members_count": len(team.members),
+            "repos_count": len(team.repos),
+            "organization": self.org_json(),
+        }
+
+    def repo_json(self, repo, permission=None):
+        base = f"{self.api_url}/repos/{self.org.login}/{repo.name}"
+        data = {
+            "id": repo.id,
+            "name": repo.name,
+            "full_name": f"{self.org.login}/{repo.name}",
+            "owner": self.user_json(self.org.login),
+            "private": False,
+            "fork": False,
+            "description": repo.name,
+            "url": base,
+            "html_url": f"https://github.com/{self.org.login}/{repo.name}",
+            "default_branch": repo.default_branch,
+            "archived": False,
+            "clone_url": f"https://github.com/{self.org.login}/{repo.name}.git",
+            "git_url": f"git://github.com/{self.org.login}/{repo.name}.git",
+            "ssh_url": f"git@github.com:{self.org.login}/{repo.name}.git",
+            "svn_url": f"https://github.com/{self.org.login}/{repo.name}",
+            "mirror_url": None,
+            "homepage": None,
+            "language": None,
+            "created_at": DATE,
+            "updated_at": DATE,
+            "pushed_at": repo.pushed_at,
+            "size": 0,
+        }
+        for key in (
+            "forks_count",
+            "network_count",
+            "open_issues_count",
+            "stargazers_count",
+            "subscribers_count",
+            "watchers_count",
+        ):
+            data[key] = 0
+        for key in ("has_downloads", "has_issues", "has_pages", "has_projects"):
+            data[key] = False
+        data["has_wiki"] = False
+        data.update(
+            self._urls(
+                base,
+                "archive",
+                "assignees",
+                "blobs",
+                "branches",
+                "collaborators",
+                "comments",
+                "commits",
+                "compare",
+                "contents",
+                "contributors",
+                "deployments",
+                "downloads",
+                "events",
+                "forks",
+                "git_commits",
+                "git_refs",
+                "git_tags",
+                "hooks",
+                "issue_comment",
+                "issue_events",
+                "issues",
+                "keys",
+                "labels",
+                "languages",
+                "merges",
+                "milestones",
+                "notifications",
+                "pulls",
+                "releases",
+                "stargazers",
+                "statuses",
+                "subscribers",
+                "subscription",
+                "tags",
+                "teams",
+                "trees",
+            )
+        )
+        if permission:
+            data["permissions"] = {
+                x: gh_state.PERMISSIONS.index(x)
+                >= gh_state.PERMISSIONS.index(permission)
+                for x in gh_state.PERMISSIONS
+            }
+        return data
+
+    def _get_team(self, team_id):
+        team = self.org.team_by_id(team_id)
+        if team is None:
+            raise HTTPError(404)
+        return team
+
+    def _get_repo(self, name):
+        repo = self.org.repos.get(name)
+        if repo is None:
+            raise HTTPError(404)
+        return repo
+
+    def _sha(self, *parts):
+        return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+
+    # REST endpoints
+
+    def get_user(self, request):
+        # the authenticated user, as read by `gh.me()`
+        return dict(
+            self.user_json("bench-bot"),
+            name="Bench Bot",
+            email=None,
+            bio=None,
+            blog="",
+            company=None,
+            location=None,
+            hireable=None,
+            followers=0,
+            following=0,
+            public_gists=0,
+            public_repos=0,
+            created_at=DATE,
+            updated_at=DATE,
+            disk_usage=0,
+            owned_private_repos=0,
+            total_private_repos=0,
+            private_gists=0,
+            collaborators=0,
+            two_factor_authentication=False,
+            plan=None,
+        )
+
+    def get_org(self, request, org):
+        return self.org_json()
+
+    def list_teams(self, request, org):
+        teams = [self.team_json(x) for x in self.org.teams.values()]
+        return self._paginate(request, teams)
+
+    def get_team(self, request, org, slug):
+        team = self.org.teams.get(slug)
+        if team is None:
+            raise HTTPError(404)
+        return self.team_json(team)
+
+    def create_team(self, request, org):
+        slug = request["data"]["name"]
+        if slug in self.org.teams:
+            raise HTTPError(422, "Name must be unique for this org")
+        return 201, self.team_json(self.org.add_team(slug))
+
+    def list_org_repos(self, request, org):
+        repos = [self.repo_json(x) for x in self.org.repos.values()]
+        return self._paginate(request, repos)
+
+    def create_repo(self, request, org):
+        name = request["data"]["name"]
+        if name in self.org.repos:
+            raise HTTPError(422, "name already exists on this account")
+        repo = self.org.add_repo(name)
+        team_id = request["data"].get("team_id")
+        if team_id:
+            self._get_team(team_id).repos[name] = "pull"
+        return 201, self.repo_json(repo)
+
+    def list_team_members(self, request, team):
+        team = self._get_team(team)
+        role = request["query"].get("role", "all")
+        logins = sorted(
+            login for login, x in team.members.items() if role in ("all", x)
+        )
+        return self._paginate(request, [self.user_json(x) for x in logins])
+
+    def list_team_invitations(self, request, team):
+        team = self._get_team(team)
+        invitations = [
+            {
+                "id": i,
+                "login": login,
+                "email": None,
+                "created_at": DATE,
+                "inviter": self.user_json("bench-bot"),
+            }
+            for i, login in enumerate(sorted(team.pending), 1)
+        ]
+        return self._paginate(request, invitations)
+
+    def list_team_repos(self, request, team):
+        team = self._get_team(team)
+        repos = [
+            self.repo_json(self.org.repos[name], permission=permission)
+            for name, permission in sorted(team.repos.items())
+            if name in self.org.repos
+        ]
+        return self._paginate(request, repos)
+
+    def set_membership(self, request, team, user):
+        team = self._get_team(team)
+        role = request["data"].get("role", "member")
+        if user in team.members or not user.startswith("new-"):
+            state = "active"
+            team.members[user] = role
+        else:
+            # users not in the org yet get invited
+            state = "pending"
+            team.pending[user] = role
+        return self._membership_json(team, user, role, state)
+
+    def _membership_json(self, team, user, role, state):
+        return {
+            "url": f"{self.api_url}/organizations/1/team/{team.id}/memberships/{user}",
+            "role": role,
+            "state": state,
+        }
+
+    def get_membership(self, request, team, user):
+        team = self._get_team(team)
+        if user in team.members:
+            return self._membership_json(team, user, team.members[user], "active")
+        if user in team.pending:
+            return self._membership_json(team, user, team.pending[user], "pending")
+        raise HTTPError(404)
+
+    def del_membership(self, request, team, user):
+        team = self._get_team(team)
+        team.members.pop(user, None)
+        team.pending.pop(user, None)
+        return 204, None
+
+    def add_team_repo(self, request, team, owner, repo):
+        team = self._get_team(team)
+        self._get_repo(repo)
+        team.repos[repo] = request["data"].get("permission", "push")
+        return 204, None
+
+    def get_repo(self, request, org, repo):
+        return self.repo_json(self._get_repo(repo))
+
+    def edit_repo(self, request, org, repo):
+        repo = self._get_repo(repo)
+        branch = request["data"].get("default_branch")
+        if branch:
+            if branch not in repo.branches:
+                raise HTTPError(422, "Validation Failed")
+            repo.default_branch = branch
+        return self.repo_json(repo)
+
+    def list_branches(self, request, org, repo):
+        repo = self._get_repo(repo)
+        branches = [
+            {
+                "name": name,
+                "commit": {
+                    "sha": self._sha(repo.name, name),
+                    "url": f"{self.api_url}/repos/{org}/{repo.name}/commits/x",
+                },
+                "protected": False,
+            }
+            for name in sorted(repo.branches)
+        ]
+        return self._paginate(request, branches)
+
+    def list_collaborators(self, request, org, repo):
+        repo = self._get_repo(repo)
+        users = [
+            dict(self.user_json(x), permissions={"admin": False, "push": True})
+            for x in sorted(repo.collaborators)
+        ]
+        return self._paginate(request, users)
+
+    def add_collaborator(self, request, org, repo, user):
+        repo = self._get_repo(repo)
+        if user in repo.collaborators:
+            return 204, None
+        repo.invitations.setdefault(user, self.org.next_id())
+        return 201, {"id": repo.invitations[user]}
+
+    def del_collaborator(self, request, org, repo, user):
+        self._get_repo(repo).collaborators.discard(user)
+        return 204, None
+
+    def list_repo_invitations(self, request, org, repo):
+        repo = self._get_repo(repo)
+        invitations = [
+            {
+                "id": id_,
+                "created_at": DATE,
+                "html_url": "",
+                "url": f"{self.api_url}/repos/{org}/{repo.name}/invitations/{id_}",
+                "invitee": self.user_json(login),
+                "inviter": self.user_json("bench-bot"),
+                "permissions": "write",
+                "repository": self.repo_json(repo),
+            }
+            for login, id_ in sorted(repo.invitations.items())
+        ]
+        return self._paginate(request, invitations)
+
+    def del_repo_invitation(self, request, org, repo, id):
+        repo = self._get_repo(repo)
+        for login, id_ in list(repo.invitations.items()):
+            if id_ == int(id):
+                del repo.invitations[login]
+        return 204, None
+
+    def create_file(self, request, org, repo, path):
+        repo = self._get_repo(repo)
+        branch = request["data"].get("branch") or repo.default_branch or "main"
+        repo.branches.add(branch)
+        if repo.default_branch is None:
+            repo.default_branch = branch
+        sha = self._sha(repo.name, path, branch)
+        base = f"{self.api_url}/repos/{org}/{repo.name}"
+        return 201, {
+            "content": {
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "sha": sha,
+                "size": 0,
+                "type": "file",
+                "url": f"{base}/contents/{path}",
+                "git_url": f"{base}/git/blobs/{sha}",
+                "html_url": "",
+                "download_url": "",
+                "_links": {},
+            },
+            "commit": self._commit_json(base, sha, "Initialize repository", sha),
+        }
+
+    def _commit_json(self, base, sha, message, tree_sha):
+        author = {"name": "Bench Bot", "email": "bench@example.com", "date": DATE}
+        return {
+            "sha": sha,
+            "url": f"{base}/git/commits/{sha}",
+            "message": message,
+            "author": author,
+            "committer": author,
+            "tree": {"sha": tree_sha, "url": f"{base}/git/trees/{tree_sha}"},
+            "parents": [],
+            "verification": {"verified": False},
+        }
+
+    def create_tree(self, request, org, repo):
+        repo = self._get_repo(repo)
+        tree = request["data"]["tree"]
+        sha = self._sha(repo.name, json.dumps(tree, sort_keys=True))
+        return 201, {
+            "sha": sha,
+            "url": f"{self.api_url}/repos/{org}/{repo.name}/git/trees/{sha}",
+            "tree": [
+                {
+                    "path": x["path"],
+                    "mode": x["mode"],
+                    "type": x["type"],
+                    "sha": x.get("sha") or self._sha(x.get("content")),
+                }
+                for x in tree
+            ],
+        }
+
+    def create_commit(self, request, org, repo):
+        repo = self._get_repo(repo)
+        data = request["data"]
+        sha = self._sha(repo.name, data["tree"], data["message"])
+        base = f"{self.api_url}/repos/{org}/{repo.name}"
+        return 201, self._commit_json(base, sha, data["message"], data["tree"])
+
+    def _ref_json(self, org, repo, branch, sha):
+        base = f"{self.api_url}/repos/{org}/{repo.name}"
+        return {
+            "ref": f"refs/heads/{branch}",
+            "url": f"{base}/git/refs/heads/{branch}",
+            "object": {"type": "commit", "sha": sha, "url": f"{base}/git/commits/x"},
+        }
+
+    def create_ref(self, request, org, repo):
+        repo = self._get_repo(repo)
+        branch = request["data"]["ref"][len("refs/heads/") :]
+        if branch in repo.branches:
+            raise HTTPError(422, "Reference already exists")
+        repo.branches.add(branch)
+        if repo.default_branch is None:
+            repo.default_branch = branch
+        return 201, self._ref_json(org, repo, branch, request["data"]["sha"])
+
+    def get_ref(self, request, org, repo, branch):
+        repo = self._get_repo(repo)
+        if branch not in repo.branches:
+            raise HTTPError(404)
+        return self._ref_json(org, repo, branch, self._sha(repo.name, branch))
+
+    def update_ref(self, request, org, repo, branch):
+        repo = self._get_repo(repo)
+        if branch not in repo.branches:
+            raise HTTPError(422, "Reference does not exist")
+        return self._ref_json(org, repo, branch, request["data"]["sha"])
+
+    # GraphQL
+
+    def graphql(self, request):
+        query = request["data"]["query"]
+        variables = request["data"].get("variables") or {}
+        resolvers = {
+            gh_state.REPOSITORIES_QUERY: self._gql_repositories,
+            gh_state.REPOSITORY_BRANCHES_QUERY: self._gql_repository_branches,
+            gh_state.REPOSITORY_COLLABORATORS_QUERY: (
+                self._gql_repository_collaborators
+            ),
+            gh_state.TEAMS_QUERY: self._gql_teams,
+            gh_state.TEAM_MEMBERS_QUERY: self._gql_team_members,
+            gh_state.TEAM_REPOSITORIES_QUERY: self._gql_team_repositories,
+            gh_state.TEAM_INVITATIONS_QUERY: self._gql_team_invitations,
+        }
+        resolver = resolvers.get(query)
+        if resolver is None:
+            return {"errors": [{"message": "Unsupported query"}]}
+        return {"data": {"organization": resolver(variables)}}
+
+    def _connection(self, items, first, after=None, key="nodes"):
+        start = int(after or 0)
+        end = start + first
+        return {
+            "pageInfo": {
+                "hasNextPage": end < len(items),
+                "endCursor": str(end) if end < len(items) else None,
+            },
+            key: items[start:end],
+        }
+
+    def _gql_refs(self, repo, after=None):
+        return self._connection(
+            [{"name": x} for x in sorted(repo.branches)], 100, after
+        )
+
+    def _gql_collaborators(self, repo, after=None):
+        return self._connection(
+            [{"login": x} for x in sorted(repo.collaborators)], 100, after
+        )
+
+    def _gql_repositories(self, variables):
+        nodes = [
+            {
+                "name": repo.name,
+                "defaultBranchRef": (
+                    {"name": repo.default_branch} if repo.default_branch else None
+                ),
+                "refs": self._gql_refs(repo),
+                "collaborators": self._gql_collaborators(repo),
+            }
+            for repo in self.org.repos.values()
+        ]
+        return {"repositories": self._connection(nodes, 100, variables.get("after"))}
+
+    def _gql_repository_branches(self, variables):
+        repo = self._get_repo(variables["name"])
+        return {"repository": {"refs": self._gql_refs(repo, variables.get("after"))}}
+
+    def _gql_repository_collaborators(self, variables):
+        repo = self._get_repo(variables["name"])
+        return {
+            "repository": {
+                "collaborators": self._gql_collaborators(repo, variables.get("after"))
+            }
+        }
+
+    def _gql_members(self, team, after=None):
+        edges = [
+            {"role": role.upper(), "node": {"login": login}}
+            for login, role in sorted(team.members.items())
+        ]
+        return self._connection(edges, 100, after, key="edges")
+
+    def _gql_repos(self, team, after=None):
+        permissions = {v: k for k, v in gh_state.GRAPHQL_PERMISSIONS.items()}
+        edges = [
+            {"permission": permissions[permission], "node": {"name": name}}
+            for name, permission in sorted(team.repos.items())
+        ]
+        return self._connection(edges, 100, after, key="edges")
+
+    def _gql_invitations(self, team, after=None):
+        nodes = [{"invitee": {"login": x}} for x in sorted(team.pending)]
+        return self._connection(nodes, 100, after)
+
+    def _gql_teams(self, variables):
+        nodes = [
+            {
+                "slug": team.slug,
+                "members": self._gql_members(team),
+                "repositories": self._gql_repos(team),
+                "invitations": self._gql_invitations(team),
+            }
+            for team in self.org.teams.values()
+        ]
+        return {"teams": self._connection(nodes, 50, variables.get("after"))}
+
+    def _gql_team(self, variables):
+        for team in self.org.teams.values():
+            if team.slug == variables["slug"]:
+                return team
+        raise HTTPError(404)
+
+    def _gql_team_members(self, variables):
+        team = self._gql_team(variables)
+        return {"team": {"members": self._gql_members(team, variables.get("after"))}}
+
+    def _gql_team_repositories(self, variables):
+        team = self._gql_team(variables)
+        return {"team": {"repositories": self._gql_repos(team, variables.get("after"))}}
+
+    def _gql_team_invitations(self, variables):
+        team = self._gql_team(variables)
+        return {
+            "team": {"invitations": self._gql_invitations(team, variables.get("after"))}
+        }
+
+
+class _Page:
+    """Items of a paginated response w/ their headers."""
+
+    def __init__(self, items):
+        self.items = items
+        self.headers = {}
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # set by `FakeGitHub.start`
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, result = self.fake.handle(
+            self.command, self.path, self.headers, body.decode() or None
+        )
+        payload = b"" if result is None else json.dumps(result).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+    def log_message(self, format, *args):
+        # keep benchmark output clean
+        pass
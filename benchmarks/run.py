@@ -0,0 +1,190 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Benchmark the tools against a synthetic organization served locally.
+
+Run it from the root of the repository:
+
+    python -m benchmarks.run --repos 300 --branches 15 --teams 200
+
+For each tool wall time, requests by endpoint and peak memory
+(as traced by `tracemalloc`, the fake server included) are reported.
+"""
+
+import json
+import logging
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import click
+import github3
+
+from oca_repo_maintainer.tools.conf_file_manager import ConfFileManager
+from oca_repo_maintainer.tools.gh_pages import GHPageGenerator
+from oca_repo_maintainer.tools.manager import RepoManager
+
+from .fake_github import FakeGitHub
+from .synthetic import generate_conf, make_org, make_template
+
+TOKEN = "ghp_fake_benchmark_token"
+
+
+@contextmanager
+def fake_login(server):
+    """Make tools log in to `server` instead of GitHub."""
+
+    def login(username=None, password=None, token=None, **kw):
+        return github3.GitHubEnterprise(server.url, token=token)
+
+    with mock.patch.object(github3, "login", login):
+        yield
+
+
+def pages(conf_dir, org, pages_dir):
+    GHPageGenerator(conf_dir.as_posix(), org, pages_dir.as_posix()).run()
+
+
+def measure(name, func, server):
+    """Run `func` and return its metrics."""
+    server.reset_stats()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        func()
+    finally:
+        wall_time = time.perf_counter() - start
+        __, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    endpoints = server.reset_stats()
+    return {
+        "tool": name,
+        "wall_time": round(wall_time, 3),
+        "requests": sum(endpoints.values()),
+        "peak_memory": peak,
+        "endpoints": dict(endpoints.most_common()),
+    }
+
+
+def run_benchmarks(
+    work_dir,
+    repos=300,
+    branches=15,
+    teams=200,
+    members=8,
+    drift=0.1,
+    latency=0.0,
+    rate_limit=1000000,
+    jobs=1,
+    state_backend="graphql",
+    render_cache=False,
+    http_cache=False,
+    seed=0,
+):
+    """Generate an organization in `work_dir` and benchmark each tool on it."""
+    work_dir = Path(work_dir)
+    conf_dir = work_dir / "conf"
+    template = make_template(work_dir / "template")
+    conf = generate_conf(
+        conf_dir,
+        template,
+        repos=repos,
+        branches=branches,
+        teams=teams,
+        members=members,
+        seed=seed,
+    )
+    org = make_org(conf, drift=drift, seed=seed)
+    cache_dir = (work_dir / "cache").as_posix() if http_cache else None
+    org_name = conf["global"]["org"]
+
+    def manage(force=False):
+        RepoManager(
+            conf_dir.as_posix(),
+            org_name,
+            TOKEN,
+            force=force,
+            cache_dir=cache_dir,
+            state_backend=state_backend,
+            jobs=jobs,
+            branch_backend="api",
+            render_cache=render_cache,
+        ).run()
+
+    results = []
+    server = FakeGitHub(org, latency=latency, rate_limit=rate_limit)
+    with server, fake_login(server):
+        results.append(measure("manage", manage, server))
+        # everything is in sync now: only the state is read
+        results.append(measure("manage (in sync)", lambda: manage(force=True), server))
+        results.append(
+            measure(
+                "pages", lambda: pages(conf_dir, org_name, work_dir / "pages"), server
+            )
+        )
+        results.append(
+            measure(
+                "add-branch",
+                lambda: ConfFileManager(conf_dir.as_posix()).add_branch("19.0"),
+                server,
+            )
+        )
+    return results
+
+
+def format_results(results, details=False):
+    lines = [f"{'Tool':<20} {'Wall time (s)':>14} {'Requests':>9} {'Peak MB':>8}"]
+    for res in results:
+        lines.append(
+            f"{res['tool']:<20} {res['wall_time']:>14.3f} {res['requests']:>9} "
+            f"{res['peak_memory'] / 1024 / 1024:>8.1f}"
+        )
+        if details:
+            for endpoint, count in res["endpoints"].items():
+                lines.append(f"    {count:>6}  {endpoint}")
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option("--repos", default=300, show_default=True)
+@click.option("--branches", default=15, show_default=True, help="Branches per repo.")
+@click.option("--teams", default=200, show_default=True)
+@click.option("--members", default=8, show_default=True, help="Members per team.")
+@click.option(
+    "--drift",
+    default=0.1,
+    show_default=True,
+    help="Ratio of the org state that does not match the conf.",
+)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Seconds added to each request."
+)
+@click.option("--rate-limit", default=1000000, show_default=True)
+@click.option("--jobs", default=1, show_default=True)
+@click.option(
+    "--state-backend",
+    type=click.Choice(sorted(RepoManager.state_fetchers)),
+    default="graphql",
+    show_default=True,
+)
+@click.option("--render-cache/--no-render-cache", default=False, show_default=True)
+@click.option("--http-cache/--no-http-cache", default=False, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+@click.option("--details", is_flag=True, help="Show requests by endpoint.")
+@click.option("--json-output", type=click.Path(), help="Save results as JSON.")
+@click.option("--verbose", is_flag=True, help="Show logs of the tools.")
+def main(json_output=None, details=False, verbose=False, **options):
+    logging.getLogger().setLevel(logging.INFO if verbose else logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="oca-bench-") as work_dir:
+        results = run_benchmarks(work_dir, **options)
+    click.echo(format_results(results, details=details))
+    if json_output:
+        with open(json_output, "w") as fd:
+            json.dump({"options": options, "results": results}, fd, indent=2)
+
+
+if __name__ == "__main__":
+    main()
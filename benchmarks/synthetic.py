@@ -0,0 +1,177 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Generate a synthetic organization: conf files and matching GitHub state."""
+
+import random
+from pathlib import Path
+
+import yaml
+
+from .fake_github import FakeOrg
+
+CATEGORIES = (
+    "accounting",
+    "connector",
+    "hr",
+    "l10n",
+    "project",
+    "sale",
+    "server",
+    "stock",
+    "tools",
+    "website",
+)
+OWNER = "board"
+TEAM_MAINTAINERS = "core-maintainers"
+# always added to every team
+GLOBAL_MAINTAINERS = ("oca-bot", "oca-admin")
+
+COPIER_YML = """
+repo_name:
+  type: str
+repo_slug:
+  type: str
+repo_description:
+  type: str
+odoo_version:
+  type: str
+_subdirectory: template
+"""
+
+TEMPLATE_FILES = {
+    "README.md.jinja": "# {{ repo_name }}\n\n{{ repo_description }}\n",
+    ".pre-commit-config.yaml.jinja": "# Odoo {{ odoo_version }}\nrepos: []\n",
+    "setup/README": "Setup for addons\n",
+    "LICENSE": "AGPL-3\n",
+}
+
+
+def make_template(dest_dir):
+    """Write a minimal copier template in `dest_dir` and return its path."""
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    (dest_dir / "copier.yml").write_text(COPIER_YML)
+    for name, content in TEMPLATE_FILES.items():
+        path = dest_dir / "template" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return dest_dir.as_posix()
+
+
+def generate_conf(
+    conf_dir,
+    template,
+    org="OCA",
+    repos=300,
+    branches=15,
+    teams=200,
+    members=8,
+    maintainers=3,
+    seed=0,
+):
+    """Write a synthetic conf in `conf_dir`.
+
+    Teams and repos are spread across categories, one file per category.
+    Return the conf as a dict w/ `global`, `psc` and `repo` keys.
+    """
+    rng = random.Random(seed)
+    conf_dir = Path(conf_dir)
+    users = [f"user-{i:04d}" for i in range(max(50, teams * 3))]
+    versions = [f"{x}.0" for x in range(18 - branches + 1, 19)]
+    conf_global = {
+        "org": org,
+        "owner": OWNER,
+        "template": template,
+        "team_maintainers": [TEAM_MAINTAINERS],
+        "maintainers": list(GLOBAL_MAINTAINERS),
+    }
+    conf_psc = {}
+    for i in range(teams):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        team_members = rng.sample(users, members)
+        conf_psc[f"{category}-{i:03d}-maintainers"] = {
+            "name": f"{category.capitalize()} maintainers {i}",
+            "members": team_members,
+            "representatives": team_members[: rng.randint(1, 2)],
+        }
+    team_slugs = list(conf_psc)
+    conf_repo = {}
+    for i in range(repos):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        slug = f"{category}-repo-{i:03d}"
+        conf_repo[slug] = {
+            "name": f"{category.capitalize()} repo {i}",
+            "description": f"Synthetic repo {i}",
+            "category": category.capitalize(),
+            "psc": rng.choice(team_slugs),
+            "maintainers": rng.sample(users, rng.randint(0, maintainers)),
+            "branches": list(versions),
+            "default_branch": versions[-1],
+        }
+    _write(conf_dir / "global.yml", conf_global)
+    for name, conf in (("psc", conf_psc), ("repo", conf_repo)):
+        by_category = {}
+        for slug, data in conf.items():
+            by_category.setdefault(slug.split("-")[0], {})[slug] = data
+        for category, data in by_category.items():
+            _write(conf_dir / name / f"{category}.yml", data)
+    return {"global": conf_global, "psc": conf_psc, "repo": conf_repo}
+
+
+def _write(filepath, data):
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with filepath.open("w") as fd:
+        yaml.safe_dump(data, fd, sort_keys=False)
+
+
+def make_org(conf, drift=0.1, seed=0):
+    """Return a `FakeOrg` matching `conf`, except for a `drift` ratio of changes.
+
+    Drift includes missing teams and repos, missing or extra members,
+    pending invitations, missing branches and collaborators.
+    """
+    rng = random.Random(seed)
+    org = FakeOrg(conf["global"]["org"])
+    org.add_team(OWNER, members={"oca-admin": "maintainer"})
+    org.add_team(TEAM_MAINTAINERS, members={"oca-bot": "maintainer"})
+
+    def drifted():
+        return rng.random() < drift
+
+    for slug, data in conf["psc"].items():
+        if drifted():
+            continue
+        roles = {x: "member" for x in data["members"] + list(GLOBAL_MAINTAINERS)}
+        roles.update({x: "maintainer" for x in data["representatives"]})
+        pending = {}
+        for login in list(roles):
+            if drifted():
+                role = roles.pop(login)
+                if drifted():
+                    pending[login] = role
+            elif drifted():
+                roles[login] = (
+                    "member" if roles[login] == "maintainer" else "maintainer"
+                )
+        if drifted():
+            roles[f"former-{slug}"] = "member"
+        org.add_team(slug, members=roles, pending=pending)
+    for name, data in conf["repo"].items():
+        if drifted():
+            continue
+        branches = [x for x in data["branches"] if not drifted()]
+        default_branch = data["default_branch"]
+        if default_branch not in branches or drifted():
+            default_branch = branches[0] if branches else None
+        org.add_repo(
+            name,
+            default_branch=default_branch,
+            branches=branches,
+            collaborators=[x for x in data["maintainers"] if not drifted()],
+        )
+        for team in conf["global"]["team_maintainers"]:
+            org.teams[team].repos[name] = "admin"
+        if data["psc"] in org.teams and not drifted():
+            org.teams[data["psc"]].repos[name] = "push"
+    return org
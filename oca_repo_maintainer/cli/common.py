@@ -0,0 +1,81 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Options shared by all the commands."""
+
+import contextlib
+
+import click
+
+from ..tools.cache import default_cache_dir
+from ..tools.metrics import Metrics
+from ..tools.validator import ConfValidator
+
+
+def cache_options(func):
+    """Add options to control on-disk caches.
+
+    The decorated command receives a `cache_dir` argument
+    which is None when caching is disabled.
+    """
+
+    def disable_cache(ctx, param, value):
+        # eager: processed before `--cache-dir`
+        ctx.meta["no_cache"] = value
+        return value
+
+    def get_cache_dir(ctx, param, value):
+        if ctx.meta.get("no_cache"):
+            return None
+        return value
+
+    func = click.option(
+        "--no-cache",
+        is_flag=True,
+        expose_value=False,
+        is_eager=True,
+        callback=disable_cache,
+        help="Bypass on-disk caches.",
+    )(func)
+    func = click.option(
+        "--cache-dir",
+        envvar="OCA_REPO_MAINTAINER_CACHE_DIR",
+        default=lambda: str(default_cache_dir()),
+        show_default="~/.cache/oca-repo-maintainer",
+        callback=get_cache_dir,
+        help="Folder where caches are stored.",
+    )(func)
+    return func
+
+
+def metrics_options(func):
+    """Add an option to write a report of the run.
+
+    The decorated command receives a `metrics` argument: a `Metrics` instance
+    written to `--metrics-out` when the command completes, even on failure.
+    """
+
+    def get_metrics(ctx, param, value):
+        metrics = Metrics(command=ctx.info_name)
+        if value:
+            ctx.call_on_close(lambda: metrics.write(value))
+        return metrics
+
+    return click.option(
+        "--metrics-out",
+        "metrics",
+        type=click.Path(dir_okay=False),
+        callback=get_metrics,
+        help="Write timings and GitHub API usage of the run as JSON to this file.",
+    )(func)
+
+
+def check_conf(conf_dir, cache_dir=None, metrics=None):
+    """Stop the command if the configuration in `conf_dir` is not valid."""
+    phase = metrics.phase("validate") if metrics else contextlib.nullcontext()
+    with phase:
+        problems = ConfValidator(conf_dir, cache_dir=cache_dir).validate()
+    if problems:
+        raise click.ClickException(
+            "Invalid configuration:\n" + "\n".join(str(x) for x in problems)
+        )
@@ -5,9 +5,11 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 import click
+import yaml
 
-from ..tools.conf_file_manager import ConfFileManager
+from ..tools.conf_file_manager import ConfFileManager, EditError
 from ..tools.manager import RepoManager
+from .common import cache_options, check_conf, metrics_options
 
 
 @click.command()
@@ -21,9 +23,82 @@ from ..tools.manager import RepoManager
     prompt="Your organization",
     help="The organizattion.",
 )
-def manage(conf_dir, org, token):
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Print the operations to perform and their cost without applying them.",
+)
+@click.option(
+    "--state-backend",
+    type=click.Choice(sorted(RepoManager.state_fetchers)),
+    default="graphql",
+    show_default=True,
+    help="How to read the state of the organization.",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="How many independent operations (and state reads) can run in parallel.",
+)
+@click.option(
+    "--branch-backend",
+    type=click.Choice(RepoManager.branch_backends),
+    default="git",
+    show_default=True,
+    help="Push new branches w/ git commands or w/ the Git Data API.",
+)
+@click.option(
+    "--render-cache/--no-render-cache",
+    default=False,
+    show_default=True,
+    help="Render the new repo template once per version and reuse it for all repos.",
+)
+@click.option(
+    "--prune-collaborators",
+    is_flag=True,
+    help="Remove direct collaborators and invitations not matching repo maintainers.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the work completed by the last interrupted run.",
+)
+@cache_options
+@metrics_options
+def manage(
+    conf_dir,
+    org,
+    token,
+    dry_run=False,
+    state_backend="graphql",
+    jobs=1,
+    branch_backend="git",
+    render_cache=False,
+    prune_collaborators=False,
+    resume=False,
+    cache_dir=None,
+    metrics=None,
+):
     """Setup and update repositories and teams."""
-    RepoManager(conf_dir, org, token).run()
+    check_conf(conf_dir, cache_dir=cache_dir, metrics=metrics)
+    manager = RepoManager(
+        conf_dir,
+        org,
+        token,
+        cache_dir=cache_dir,
+        state_backend=state_backend,
+        jobs=jobs,
+        branch_backend=branch_backend,
+        render_cache=render_cache,
+        prune_collaborators=prune_collaborators,
+        resume=resume,
+        metrics=metrics,
+    )
+    plan = manager.run(dry_run=dry_run)
+    if dry_run:
+        click.echo(plan.render())
 
 
 @click.command()
@@ -33,14 +108,41 @@ def manage(conf_dir, org, token):
     "--default/--no-default", default=True, help="Set default branch as default."
 )
 @click.option("--repo-whitelist", help="CSV list of repo names to update")
-def add_branch(conf_dir, branch, default=True, repo_whitelist=None):
+@cache_options
+@metrics_options
+def add_branch(
+    conf_dir, branch, default=True, repo_whitelist=None, cache_dir=None, metrics=None
+):
     """Add a branch to all repositories in the configuration."""
     if repo_whitelist:
         repo_whitelist = [x.strip() for x in repo_whitelist.split(",") if x.strip()]
-    ConfFileManager(conf_dir).add_branch(
+    ConfFileManager(conf_dir, cache_dir=cache_dir, metrics=metrics).add_branch(
         branch, default=default, repo_whitelist=repo_whitelist
     )
 
 
+@click.command()
+@click.option("--conf-dir", required=True, help="Folder where configuration is stored")
+@click.option(
+    "--batch",
+    "batch_file",
+    required=True,
+    type=click.File(),
+    help="YAML file listing the operations to apply.",
+)
+@cache_options
+@metrics_options
+def edit(conf_dir, batch_file, cache_dir=None, metrics=None):
+    """Apply a batch of operations to repositories in the configuration."""
+    operations = yaml.safe_load(batch_file) or []
+    if not isinstance(operations, list):
+        raise click.ClickException("The batch file must hold a list of operations")
+    manager = ConfFileManager(conf_dir, cache_dir=cache_dir, metrics=metrics)
+    try:
+        manager.edit(operations)
+    except EditError as err:
+        raise click.ClickException(str(err)) from err
+
+
 if __name__ == "__main__":
     manage()
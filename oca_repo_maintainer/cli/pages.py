@@ -7,6 +7,7 @@
 import click
 
 from ..tools.gh_pages import GHPageGenerator
+from .common import cache_options, check_conf, metrics_options
 
 
 @click.command()
@@ -18,8 +19,52 @@ from ..tools.gh_pages import GHPageGenerator
     prompt="Your organization",
     help="The organizattion.",
 )
-def pages(conf_dir, org, path):
-    GHPageGenerator(conf_dir, org, path).run()
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="How many category pages can be rendered in parallel.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running and rebuild pages affected by conf changes.",
+)
+@click.option(
+    "--search-index",
+    is_flag=True,
+    help="Write a JSON index of repos, teams and users for client-side search.",
+)
+@cache_options
+@metrics_options
+def pages(
+    conf_dir,
+    org,
+    path,
+    jobs=1,
+    watch=False,
+    search_index=False,
+    cache_dir=None,
+    metrics=None,
+):
+    check_conf(conf_dir, cache_dir=cache_dir, metrics=metrics)
+    generator = GHPageGenerator(
+        conf_dir,
+        org,
+        path,
+        cache_dir=cache_dir,
+        metrics=metrics,
+        jobs=jobs,
+        search_index=search_index,
+    )
+    if not watch:
+        generator.run()
+        return
+    try:
+        generator.watch()
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import click
+
+from ..tools.validator import ConfValidator
+from .common import cache_options, metrics_options
+
+
+@click.command()
+@click.option("--conf-dir", required=True, help="Folder where configuration is stored")
+@cache_options
+@metrics_options
+def validate(conf_dir, cache_dir=None, metrics=None):
+    """Check the configuration and report all the problems found."""
+    with metrics.phase("validate"):
+        problems = ConfValidator(conf_dir, cache_dir=cache_dir).validate()
+    for problem in problems:
+        click.echo(str(problem), err=True)
+    if problems:
+        raise click.exceptions.Exit(1)
+
+
+if __name__ == "__main__":
+    validate()
@@ -0,0 +1,141 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from pathlib import Path
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def default_cache_dir():
+    """Return the default root folder for all the caches."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "oca-repo-maintainer"
+
+
+class DiskCache:
+    """Size bounded on-disk cache of pickled values.
+
+    Each value is stored in its own file named after its key and
+    the cache version. When the cache grows over `max_size`, entries
+    of other versions are dropped first, then the least recently used ones.
+    The same cache can be used by many threads, entries can be dropped
+    by other processes at any time.
+    """
+
+    suffix = ".pickle"
+
+    def __init__(self, cache_dir, namespace, version, max_size=DEFAULT_MAX_SIZE):
+        self.path = Path(cache_dir) / namespace
+        self.version = str(version)
+        self.max_size = max_size
+        self._size = None
+        # guards `_size` and pruning
+        self._lock = threading.RLock()
+
+    def _entry_path(self, key):
+        return self.path / f"{self.version}-{key}{self.suffix}"
+
+    def get(self, key, default=None):
+        entry_path = self._entry_path(key)
+        try:
+            with entry_path.open("rb") as fd:
+                value = pickle.load(fd)
+        except FileNotFoundError:
+            return default
+        except Exception as err:
+            _logger.warning("Dropping broken cache entry %s: %s", entry_path, err)
+            self._remove(entry_path)
+            return default
+        # keep track of usage for LRU eviction
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        self.path.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        entry_path = self._entry_path(key)
+        # write atomically: concurrent runs must never read partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        with self._lock:
+            # an overwritten entry does not add up
+            old_size = self._stat_size(entry_path)
+            os.replace(tmp_path, entry_path)
+            if self._size is not None:
+                self._size += len(data) - old_size
+            if self.size() > self.max_size:
+                self.prune()
+
+    def delete(self, key):
+        self._remove(self._entry_path(key))
+
+    def _remove(self, entry_path):
+        with self._lock:
+            try:
+                size = entry_path.stat().st_size
+                entry_path.unlink()
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _stat_size(self, entry_path):
+        """Return the size of the entry, 0 if it's gone."""
+        try:
+            return entry_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self):
+        if not self.path.exists():
+            return []
+        return [x for x in self.path.iterdir() if x.suffix == self.suffix]
+
+    def size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(self._stat_size(x) for x in self._entries())
+            return self._size
+
+    def prune(self, max_size=None):
+        """Evict entries until the cache fits in `max_size`."""
+        max_size = self.max_size if max_size is None else max_size
+        current = f"{self.version}-"
+        with self._lock:
+            entries = []
+            for entry_path in self._entries():
+                try:
+                    stat = entry_path.stat()
+                except FileNotFoundError:
+                    # dropped meanwhile
+                    continue
+                is_current = entry_path.name.startswith(current)
+                # other versions first, then least recently used
+                entries.append((is_current, stat.st_mtime, stat.st_size, entry_path))
+            entries.sort()
+            size = sum(x[2] for x in entries)
+            for is_current, __, entry_size, entry_path in entries:
+                # entries of other versions are useless: they are always dropped
+                if is_current and size <= max_size:
+                    break
+                try:
+                    entry_path.unlink()
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+            self._size = size
+
+    def clear(self):
+        self.prune(max_size=0)
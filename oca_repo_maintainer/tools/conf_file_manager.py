@@ -5,6 +5,9 @@
 import logging
 import sys
 
+from .conf_index import ConfIndex
+from .conf_model import build_model
+from .metrics import Metrics
 from .utils import ConfLoader
 
 handler = logging.StreamHandler(sys.stdout)
@@ -16,38 +19,183 @@ logging.basicConfig(level=logging.INFO, handlers=[handler])
 _logger = logging.getLogger(__name__)
 
 
+class EditError(ValueError):
+    """Invalid edit operation."""
+
+
 class ConfFileManager:
-    """Update existing configuration files."""
+    """Update existing configuration files.
+
+    Changes are described as edit operations, see `edit`.
+    """
+
+    # Edit actions and their mandatory params
+    edit_actions = {
+        "add_branch": ("branch",),
+        "remove_branch": ("branch",),
+        "set_default_branch": ("branch",),
+        "set_psc": ("psc",),
+    }
+    # Params filtering the repos an operation applies to
+    edit_filters = ("repos", "categories", "psc_in")
+    # Actions not applied to repos w/ `manual_branch_mgmt`
+    branch_actions = ("add_branch", "remove_branch", "set_default_branch")
 
-    def __init__(self, conf_dir):
+    def __init__(self, conf_dir, cache_dir=None, metrics=None):
         self.conf_dir = conf_dir
-        self.conf_loader = ConfLoader(self.conf_dir)
-        self.conf_repo = self.conf_loader.load_conf(
-            "repo", checksum=False, by_filepath=True
-        )
+        self.conf_loader = ConfLoader(self.conf_dir, cache_dir=cache_dir)
+        self.metrics = metrics or Metrics()
+        with self.metrics.phase("load_conf"):
+            self.conf_repo = self.conf_loader.load_conf(
+                "repo", checksum=False, by_filepath=True
+            )
+            self.index = ConfIndex(
+                self.conf_loader.load_model("psc", checksum=False),
+                build_model("repo", self.conf_loader.full_conf("repo")),
+            )
 
     def add_branch(self, branch, default=True, repo_whitelist=None):
         """Add a branch to all repositories in the configuration."""
+        with self.metrics.phase("add_branch"):
+            self._edit(
+                [
+                    {
+                        "action": "add_branch",
+                        "branch": branch,
+                        "default": default,
+                        "repos": repo_whitelist,
+                    }
+                ]
+            )
+
+    def edit(self, operations):
+        """Apply edit `operations` to all repositories in one pass.
+
+        Each operation is a dict w/ an `action` (see `edit_actions`), its params
+        and optional filters: `repos` (slugs), `categories` and `psc_in` (teams).
+        Operations are applied in order to each repo, each changed file
+        is saved once. Return the amount of repos changed by each operation.
+        """
+        with self.metrics.phase("edit"):
+            return self._edit(operations)
+
+    def _edit(self, operations):
+        operations = self._check_operations(operations)
+        selections = [
+            self.index.select_repos(
+                repos=op.get("repos"), categories=op.get("categories")
+            )
+            for op in operations
+        ]
+        counts = [0] * len(operations)
+        changed_confs = []
         for filepath, repo in self.conf_repo.items():
             changed = False
             for repo_slug, repo_data in repo.items():
-                if repo_whitelist and repo_slug not in repo_whitelist:
-                    continue
-                if self._has_manual_branch_mgmt(repo_data):
-                    _logger.info(
-                        "Skipping repo %s as manual_branch_mgmt is enabled.",
-                        filepath.as_posix(),
-                    )
-                    continue
-                if self._can_add_new_branch(branch, repo_data):
-                    repo_data["branches"].append(branch)
-                    changed = True
-                if default and self._can_change_default_branch(repo_data):
-                    repo_data["default_branch"] = branch
-                    changed = True
+                for i, op in enumerate(operations):
+                    if repo_slug not in selections[i]:
+                        continue
+                    if not self._edit_applies(op, repo_slug, repo_data):
+                        continue
+                    if self._has_manual_branch_mgmt(repo_data) and (
+                        op["action"] in self.branch_actions
+                    ):
+                        _logger.info(
+                            "Skipping repo %s as manual_branch_mgmt is enabled.",
+                            repo_slug,
+                        )
+                        continue
+                    if getattr(self, f"_edit_{op['action']}")(repo_slug, repo_data, op):
+                        counts[i] += 1
+                        changed = True
             if changed:
-                self.conf_loader.save_conf(filepath, repo)
-                _logger.info("Branch %s added to %s.", branch, filepath.as_posix())
+                changed_confs.append((filepath, repo))
+        # files are saved all together, possibly in parallel
+        for filepath in self.conf_loader.save_confs(changed_confs):
+            _logger.info("%s updated.", filepath.as_posix())
+        for op, count in zip(operations, counts):
+            _logger.info("%s: %s repos changed", self._describe(op), count)
+        return counts
+
+    def _check_operations(self, operations):
+        checked = []
+        for op in operations:
+            if not isinstance(op, dict) or op.get("action") not in self.edit_actions:
+                raise EditError(f"Invalid operation: {op}")
+            for param in self.edit_actions[op["action"]]:
+                if not op.get(param):
+                    raise EditError(f"{self._describe(op)}: missing {param}")
+            op = dict(op)
+            for key in ("branch",):
+                if op.get(key) is not None:
+                    # versions are often written as floats
+                    op[key] = str(op[key])
+            for key in self.edit_filters:
+                if op.get(key) and not isinstance(op[key], list):
+                    op[key] = [op[key]]
+            if op["action"] == "set_psc":
+                if not any(op.get(x) for x in self.edit_filters):
+                    raise EditError(f"{self._describe(op)}: filter repos to move")
+                # w/o teams in the conf there's nothing to check against
+                if self.index.teams and op["psc"] not in self.index.teams:
+                    raise EditError(f"{self._describe(op)}: unknown team")
+            checked.append(op)
+        return checked
+
+    def _describe(self, op):
+        params = " ".join(f"{k}={v}" for k, v in op.items() if k != "action" and v)
+        return f"{op.get('action')} {params}".strip()
+
+    def _edit_applies(self, op, repo_slug, repo_data):
+        # `repos` and `categories` are resolved via the index, the team is checked
+        # on the data being edited as `set_psc` can change it in the same batch
+        if op.get("psc_in") and repo_data.get("psc") not in op["psc_in"]:
+            return False
+        return True
+
+    def _edit_add_branch(self, repo_slug, repo_data, op):
+        branch = op["branch"]
+        changed = False
+        if self._can_add_new_branch(branch, repo_data):
+            repo_data["branches"].append(branch)
+            changed = True
+        if op.get("default", True) and self._can_change_default_branch(repo_data):
+            if repo_data["default_branch"] != branch:
+                repo_data["default_branch"] = branch
+                changed = True
+        return changed
+
+    def _edit_remove_branch(self, repo_slug, repo_data, op):
+        branch = op["branch"]
+        if branch not in repo_data.get("branches", []):
+            return False
+        if repo_data.get("default_branch") == branch:
+            _logger.warning(
+                "Cannot remove %s from %s: it's the default branch.", branch, repo_slug
+            )
+            return False
+        repo_data["branches"].remove(branch)
+        return True
+
+    def _edit_set_default_branch(self, repo_slug, repo_data, op):
+        branch = op["branch"]
+        if not self._can_change_default_branch(repo_data):
+            return False
+        if branch not in repo_data.get("branches", []):
+            _logger.warning(
+                "Cannot set default branch %s on %s: unknown branch.", branch, repo_slug
+            )
+            return False
+        if repo_data["default_branch"] == branch:
+            return False
+        repo_data["default_branch"] = branch
+        return True
+
+    def _edit_set_psc(self, repo_slug, repo_data, op):
+        if repo_data.get("psc") == op["psc"]:
+            return False
+        repo_data["psc"] = op["psc"]
+        return True
 
     def _has_manual_branch_mgmt(self, repo_data):
         return repo_data.get("manual_branch_mgmt")
@@ -0,0 +1,91 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Cross-reference index of the configuration.
+
+Built once, in a single pass over the loaded teams and repos,
+it answers questions like "which repos belong to this team?"
+or "what is this user involved in?" w/o scanning the whole conf.
+"""
+
+
+class ConfIndex:
+    """Lookups over teams (`conf_psc`) and repos (`conf_repo`) models.
+
+    All the lookups map a key to the sorted list of matching slugs.
+    Repos w/o category are indexed under the `None` category.
+    """
+
+    def __init__(self, conf_psc=None, conf_repo=None):
+        self.teams = conf_psc or {}
+        self.repos = conf_repo or {}
+        self.repos_by_psc = {}
+        self.repos_by_psc_rep = {}
+        self.repos_by_category = {}
+        self.repos_by_maintainer = {}
+        self.teams_by_member = {}
+        self.teams_by_representative = {}
+        self._build()
+
+    def _build(self):
+        for slug, data in self.teams.items():
+            for login in data.members:
+                self.teams_by_member.setdefault(login, []).append(slug)
+            for login in data.representatives:
+                self.teams_by_representative.setdefault(login, []).append(slug)
+        for slug, data in self.repos.items():
+            if data.psc:
+                self.repos_by_psc.setdefault(data.psc, []).append(slug)
+            if data.psc_rep:
+                self.repos_by_psc_rep.setdefault(data.psc_rep, []).append(slug)
+            self.repos_by_category.setdefault(data.category, []).append(slug)
+            for login in dict.fromkeys(data.maintainers):
+                self.repos_by_maintainer.setdefault(login, []).append(slug)
+        for lookup in (
+            self.repos_by_psc,
+            self.repos_by_psc_rep,
+            self.repos_by_category,
+            self.repos_by_maintainer,
+            self.teams_by_member,
+            self.teams_by_representative,
+        ):
+            for slugs in lookup.values():
+                slugs.sort()
+
+    def team_name(self, slug):
+        """Return the name of team `slug`, None if the team is unknown."""
+        team = self.teams.get(slug)
+        return team.name if team is not None else None
+
+    def users(self):
+        """Return the sorted logins of all the users in the conf."""
+        return sorted(
+            set(self.repos_by_maintainer)
+            | set(self.teams_by_member)
+            | set(self.teams_by_representative)
+        )
+
+    def user_roles(self, login):
+        """Return what user `login` is involved in."""
+        return {
+            "maintains": list(self.repos_by_maintainer.get(login, ())),
+            "member_of": list(self.teams_by_member.get(login, ())),
+            "represents": list(self.teams_by_representative.get(login, ())),
+        }
+
+    def select_repos(self, repos=None, categories=None, psc_in=None):
+        """Return the set of repo slugs matching all the given filters."""
+        selected = set(self.repos)
+        if repos:
+            selected.intersection_update(repos)
+        if categories:
+            selected.intersection_update(
+                slug
+                for categ in categories
+                for slug in self.repos_by_category.get(categ, ())
+            )
+        if psc_in:
+            selected.intersection_update(
+                slug for team in psc_in for slug in self.repos_by_psc.get(team, ())
+            )
+        return selected
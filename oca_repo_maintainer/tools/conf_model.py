@@ -0,0 +1,139 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Typed read-only model of the configuration.
+
+Conf entries are turned into slotted objects once, when loaded.
+Missing lists default to empty tuples and repeated strings
+(logins, branches, slugs...) are interned.
+"""
+
+import sys
+
+
+def _str(value):
+    return None if value is None else sys.intern(str(value))
+
+
+def _strs(values):
+    return tuple(sys.intern(str(x)) for x in values or ())
+
+
+def _bool(value):
+    return None if value is None else bool(value)
+
+
+class ConfModel:
+    """Base class for conf entries.
+
+    `fields` maps attribute names to the function converting raw values.
+    Keys not covered by fields are kept in `extra`.
+    """
+
+    __slots__ = ("slug", "extra")
+    fields = {}
+
+    def __init__(self, slug=None, extra=None, **values):
+        self.slug = _str(slug)
+        self.extra = extra or {}
+        for name, convert in self.fields.items():
+            setattr(self, name, convert(values.get(name)))
+
+    @classmethod
+    def from_dict(cls, data, slug=None):
+        data = data or {}
+        values = {k: v for k, v in data.items() if k in cls.fields}
+        extra = {k: v for k, v in data.items() if k not in cls.fields}
+        return cls(slug=slug, extra=extra, **values)
+
+    def to_dict(self):
+        """Return the entry as raw conf data, w/o unset values."""
+        data = dict(self.extra)
+        for name in self.fields:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            data[name] = list(value) if isinstance(value, tuple) else value
+        return data
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, x) == getattr(other, x)
+            for x in ("slug", "extra") + tuple(self.fields)
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self.slug is None:
+            return f"<{self.__class__.__name__}>"
+        return f"<{self.__class__.__name__} {self.slug}>"
+
+
+class GlobalConf(ConfModel):
+    __slots__ = ("org", "owner", "template", "team_maintainers", "maintainers")
+    fields = {
+        "org": _str,
+        "owner": _str,
+        "template": _str,
+        "team_maintainers": _strs,
+        "maintainers": _strs,
+    }
+
+
+class TeamConf(ConfModel):
+    __slots__ = ("name", "members", "representatives")
+    fields = {
+        "name": _str,
+        "members": _strs,
+        "representatives": _strs,
+    }
+
+
+class RepoConf(ConfModel):
+    __slots__ = (
+        "name",
+        "description",
+        "category",
+        "psc",
+        "psc_rep",
+        "maintainers",
+        "branches",
+        "default_branch",
+        "manual_branch_mgmt",
+    )
+    fields = {
+        "name": _str,
+        "description": _str,
+        "category": _str,
+        "psc": _str,
+        "psc_rep": _str,
+        "maintainers": _strs,
+        "branches": _strs,
+        "default_branch": _str,
+        "manual_branch_mgmt": _bool,
+    }
+
+
+# conf name: model of its entries
+MODELS = {
+    "psc": TeamConf,
+    "repo": RepoConf,
+}
+
+
+def build_model(name, conf):
+    """Turn raw `conf` of `name` into model objects.
+
+    The global conf becomes a `GlobalConf`, other confs
+    a dict of entries by slug.
+    """
+    if name == "global":
+        return GlobalConf.from_dict(conf)
+    model = MODELS[name]
+    return {
+        sys.intern(slug): model.from_dict(data, slug=slug)
+        for slug, data in conf.items()
+    }
@@ -0,0 +1,136 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Apply operations concurrently, respecting their dependencies."""
+
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_logger = logging.getLogger(__name__)
+
+
+class _UnitLogCapture(logging.Filter):
+    """Hold back log records emitted while a unit is running in a worker."""
+
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def filter(self, record):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            return True
+        # the same record goes through this filter once per handler
+        if not buffer or buffer[-1] is not record:
+            buffer.append(record)
+        return False
+
+
+class Executor:
+    """Apply operations w/ bounded concurrency.
+
+    Operations of the same unit (see `Operation.unit`) are applied
+    sequentially in plan order, operations of different units in parallel
+    as soon as the operations they require are done.
+
+    When running in parallel, logs of each unit are emitted together
+    when the unit is done, following the order of the units in the plan.
+    """
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, jobs)
+
+    def run(self, operations, func):
+        """Call `func` on each operation.
+
+        The first error stops the execution: running operations are completed,
+        no new one is started and the error is raised.
+        """
+        if self.jobs == 1:
+            for op in operations:
+                func(op)
+            return
+        self._run_parallel(list(operations), func)
+
+    def _dependencies(self, operations):
+        by_key = {op.key: op for op in operations}
+        last_by_unit = {}
+        deps = {}
+        for op in operations:
+            op_deps = {by_key[x] for x in op.requires if x in by_key}
+            if op.unit in last_by_unit:
+                op_deps.add(last_by_unit[op.unit])
+            last_by_unit[op.unit] = op
+            deps[op] = op_deps
+        return deps
+
+    def _run_parallel(self, operations, func):
+        deps = self._dependencies(operations)
+        position = {op: i for i, op in enumerate(operations)}
+        dependents = {op: [] for op in operations}
+        for op, op_deps in deps.items():
+            for dep in op_deps:
+                dependents[dep].append(op)
+        pending_deps = {op: len(op_deps) for op, op_deps in deps.items()}
+        # units in plan order, each w/ its amount of operations still to apply
+        units = {}
+        for op in operations:
+            units[op.unit] = units.get(op.unit, 0) + 1
+        capture = _UnitLogCapture()
+        unit_logs = {unit: [] for unit in units}
+        handlers = logging.getLogger().handlers
+        for handler in handlers:
+            handler.addFilter(capture)
+
+        def apply(op):
+            capture.local.buffer = unit_logs[op.unit]
+            try:
+                func(op)
+            finally:
+                capture.local.buffer = None
+
+        error = None
+        flushed = 0
+        unit_names = list(units)
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                ready = [op for op in operations if not pending_deps[op]]
+                running = {}
+                while ready or running:
+                    while ready and error is None:
+                        op = ready.pop(0)
+                        running[pool.submit(apply, op)] = op
+                    if not running:
+                        break
+                    done, __ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in sorted(done, key=lambda x: position[running[x]]):
+                        op = running.pop(future)
+                        units[op.unit] -= 1
+                        if future.exception() is not None:
+                            error = error or future.exception()
+                            continue
+                        for dependent in dependents[op]:
+                            pending_deps[dependent] -= 1
+                            if not pending_deps[dependent]:
+                                ready.append(dependent)
+                    ready.sort(key=position.get)
+                    flushed = self._flush(unit_names, units, unit_logs, flushed)
+        finally:
+            for handler in handlers:
+                handler.removeFilter(capture)
+            # flush whatever is left, even for units that could not complete
+            self._flush(unit_names, units, unit_logs, flushed, force=True)
+        if error is not None:
+            raise error
+
+    def _flush(self, unit_names, units, unit_logs, flushed, force=False):
+        """Emit logs of completed units following units' order."""
+        while flushed < len(unit_names):
+            unit = unit_names[flushed]
+            if units[unit] and not force:
+                break
+            for record in unit_logs.pop(unit):
+                logging.getLogger(record.name).handle(record)
+            flushed += 1
+        return flushed
@@ -0,0 +1,48 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""HTTP transport shared by the tools calling the GitHub API.
+
+All the calls of a tool go through one session: connections to GitHub
+are kept alive and pooled, so that concurrent requests (see `jobs`)
+reuse a few connections instead of opening new ones.
+"""
+
+import github3
+from requests.adapters import HTTPAdapter
+
+from .http_cache import install_http_cache
+
+# Connections kept open, at least (same as requests' default)
+MIN_POOL_SIZE = 10
+
+
+def github_login(token, jobs=1, cache_dir=None, metrics=None):
+    """Return a github3 client logged in w/ `token`.
+
+    `jobs` is the amount of requests sent concurrently, `cache_dir`
+    enables the HTTP cache (see `http_cache`), `metrics` counts requests.
+    """
+    gh = github3.login(token=token)
+    setup_session(gh.session, jobs=jobs, cache_dir=cache_dir)
+    if metrics is not None:
+        metrics.install(gh.session)
+    return gh
+
+
+def setup_session(session, jobs=1, cache_dir=None):
+    """Mount on `session` an adapter pooling connections for `jobs` requests.
+
+    W/o a big enough pool, connections opened by concurrent requests
+    are closed right after being used.
+    """
+    pool_size = max(MIN_POOL_SIZE, jobs)
+    # one pool per host: api.github.com and uploads at most
+    adapter_kw = dict(pool_connections=2, pool_maxsize=pool_size)
+    if cache_dir:
+        install_http_cache(session, cache_dir, **adapter_kw)
+    else:
+        adapter = HTTPAdapter(**adapter_kw)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return session
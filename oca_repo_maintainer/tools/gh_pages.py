@@ -4,11 +4,34 @@
 # @author: Simone Orsi
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 """Script to generate gh pages
+
+Each page is built once in memory and written only if its content changed,
+so that unchanged pages keep their modification time.
+
+Pages record a digest of the conf data they depend on: a page is rebuilt
+only when this data changes. Digests are kept in the cache between runs.
 """
 
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from .utils import ConfLoader
+from .cache import DiskCache
+from .conf_index import ConfIndex
+from .conf_model import ConfModel
+from .metrics import Metrics
+from .utils import ConfLoader, write_if_changed
+from .watcher import ConfWatcher
+
+_logger = logging.getLogger(__name__)
+
+# Bump this when the content of pages changes, to rebuild them all
+PAGES_VERSION = "1"
+SEARCH_INDEX_FILENAME = "search-index.json"
+# Bump this when the structure of the search index changes
+SEARCH_INDEX_VERSION = 1
 
 INDEX_HEADER = """
 OCA repositories
@@ -17,20 +40,107 @@ OCA repositories
 
 
 class GHPageGenerator:
-    def __init__(self, conf_dir, org, page_folder):
+    """Generate rst pages for teams and repositories.
+
+    Pages are written in `page_folder`, category pages are rendered
+    by up to `jobs` threads. Only pages whose conf changed since
+    the last run are rebuilt, see `watch` to rebuild them while editing.
+    When `search_index` is enabled, a JSON index for client-side search
+    is written along with pages, see `_build_search_index`.
+    """
+
+    def __init__(
+        self,
+        conf_dir,
+        org,
+        page_folder,
+        cache_dir=None,
+        metrics=None,
+        jobs=1,
+        search_index=False,
+    ):
         self.conf_dir = conf_dir
-        self.conf_loader = ConfLoader(conf_dir)
+        self.cache_dir = cache_dir
         self.org = org
-        self.conf_global = self.conf_loader.load_conf("global", checksum=False)
-        self.conf_psc = self.conf_loader.load_conf("psc", checksum=False)
-        self.conf_repo = self.conf_loader.load_conf("repo", checksum=False)
+        self.metrics = metrics or Metrics()
+        self.jobs = max(1, jobs)
+        self.search_index = search_index
         self.page_folder = page_folder
+        self.cache = DiskCache(cache_dir, "pages", PAGES_VERSION) if cache_dir else None
+        self._cache_key = hashlib.md5(
+            Path(page_folder).resolve().as_posix().encode()
+        ).hexdigest()
+        # page filename: digest of the conf it's been built from
+        self._digests = self.cache.get(self._cache_key, {}) if self.cache else {}
+        self._current_digests = {}
+        # filenames of the pages rebuilt by the last run
+        self.rebuilt = []
+        self.load_conf()
+
+    def load_conf(self):
+        self.conf_loader = ConfLoader(self.conf_dir, cache_dir=self.cache_dir)
+        with self.metrics.phase("load_conf"):
+            self.conf_global = self.conf_loader.load_model("global", checksum=False)
+            self.conf_psc = self.conf_loader.load_model("psc", checksum=False)
+            self.conf_repo = self.conf_loader.load_model("repo", checksum=False)
+            self.index = ConfIndex(self.conf_psc, self.conf_repo)
 
     def run(self):
         # repo_index = self._generate_repo_index()
         # self.write(repo_index)
-        self._generate_psc_pages()
-        self._generate_repo_pages()
+        self._current_digests = {}
+        self.rebuilt = []
+        with self.metrics.phase("psc_pages"):
+            self._generate_psc_pages()
+        with self.metrics.phase("repo_pages"):
+            self._generate_repo_pages()
+        if self.search_index:
+            with self.metrics.phase("search_index"):
+                self._generate_search_index()
+        for filename in sorted(set(self._digests) - set(self._current_digests)):
+            # eg: all the repos of a category are gone
+            _logger.info("Removing page %s", filename)
+            self._page_path(filename).unlink(missing_ok=True)
+        self._digests = self._current_digests
+        if self.cache:
+            self.cache.set(self._cache_key, self._digests)
+        _logger.info(
+            "%s of %s pages rebuilt", len(self.rebuilt), len(self._current_digests)
+        )
+
+    def watch(self, interval=None, stop=None):
+        """Rebuild pages each time the conf changes.
+
+        Run until interrupted or until the `stop` event is set.
+        """
+        self.run()
+        for changes in ConfWatcher(self.conf_dir, interval=interval).changes(stop):
+            _logger.info("Conf changed: %s", ", ".join(sorted(changes)))
+            try:
+                self.load_conf()
+                self.run()
+            except Exception as err:
+                # eg: invalid yaml while editing
+                _logger.error("Cannot build pages: %s", err)
+
+    def _is_outdated(self, filename, *inputs):
+        """Tell whether page `filename` must be rebuilt.
+
+        `inputs` is the conf data the page depends on.
+        """
+        digest = hashlib.md5(
+            json.dumps(inputs, sort_keys=True, default=self._json_default).encode()
+        ).hexdigest()
+        self._current_digests[filename] = digest
+        return (
+            self._digests.get(filename) != digest
+            or not self._page_path(filename).exists()
+        )
+
+    def _json_default(self, value):
+        if isinstance(value, ConfModel):
+            return value.to_dict()
+        return str(value)
 
     def _repo_by_category(self):
         """Group repos by category.
@@ -39,53 +149,43 @@ class GHPageGenerator:
         to generate pages by category.
         """
         res = {}
-        for repo_slug, data in self.conf_repo.items():
-            cat = data.get("category") or "Uncategorized"
-            res.setdefault(cat, []).append((repo_slug, data))
+        for categ, slugs in self.index.repos_by_category.items():
+            res.setdefault(categ or "Uncategorized", []).extend(
+                (slug, self.conf_repo[slug]) for slug in slugs
+            )
         for categ, repos in res.items():
             res[categ] = sorted(repos)
         return res
 
     def _generate_repo_pages(self):
         """Generate one page per category."""
-        org = self.conf_global["org"]
         repo_by_category = self._repo_by_category()
-        for categ, repos in repo_by_category.items():
-            header = categ
-            section = [header, len(header) * "="]
-            for repo_slug, data in repos:
-                repo_name = data["name"]
-                if repo_name is None:
-                    continue
-                section.append(repo_name)
-                section.append("*" * len(repo_name))
-                section.append("")
-                section.append(f"https://github.com/{org}/{repo_slug}")
-                section.append("")
-                if data.get("psc", False):
-                    team_slug = data["psc"]
-                    team = self.conf_psc[team_slug]["name"]
-                    section.append(f"Team: `{team} <teams.html#{team_slug}>`_")
-                    section.append("")
-                if data.get("psc_rep", False):
-                    team_slug = data["psc_rep"]
-                    team = self.conf_psc[team_slug]["name"]
-                    section.append(
-                        f"Team representatives: `{team} <teams.html#{team_slug}>`_"
-                    )
-                    section.append("")
-                if data.get("maintainers"):
-                    section.append("Members")
-                    section.append("-------")
-                    section.append("")
-                    for member in self._link_users(*data["maintainers"]):
-                        section.append("* " + member)
-                    section.append("")
-                if repo_slug != repos[-1][0]:
-                    # add horiz separator except for the last one
-                    section.append("\n----\n")
-                content = "\n".join(section)
-                self.write(content, Path(f"docsource/{categ.lower()}.rst"))
+
+        org = self.conf_global.org or self.org
+
+        def generate(categ):
+            filename = f"{categ.lower()}.rst"
+            repos = repo_by_category[categ]
+            # the page shows names of the teams
+            teams = {
+                slug: self.index.team_name(slug)
+                for __, data in repos
+                for slug in (data.psc, data.psc_rep)
+                if slug
+            }
+            if not self._is_outdated(filename, org, repos, teams):
+                return
+            content = self._render_category(categ, repos, org)
+            if content is not None:
+                self.write(content, self._page_path(filename))
+
+        if self.jobs == 1:
+            for categ in repo_by_category:
+                generate(categ)
+        else:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                # consume results to raise errors
+                list(executor.map(generate, repo_by_category))
 
         content = """
 Repositories
@@ -102,14 +202,62 @@ Repositories
             categories.remove(no_cat)
             categories.append(no_cat)
 
+        if not self._is_outdated("repos.rst", categories):
+            return
         for categ in categories:
             content += f"   {categ.lower()}.rst\n"
-        self.write(content, Path("docsource/repos.rst"))
+        self.write(content, self._page_path("repos.rst"))
+
+    def _render_category(self, categ, repos, org):
+        """Return the content of the page of `categ`.
+
+        Return None if no repo has a name.
+        """
+        header = categ
+        section = [header, len(header) * "="]
+        named = False
+        for repo_slug, data in repos:
+            repo_name = data.name
+            if repo_name is None:
+                continue
+            named = True
+            section.append(repo_name)
+            section.append("*" * len(repo_name))
+            section.append("")
+            section.append(f"https://github.com/{org}/{repo_slug}")
+            section.append("")
+            if data.psc:
+                team_slug = data.psc
+                team = self.index.team_name(team_slug)
+                section.append(f"Team: `{team} <teams.html#{team_slug}>`_")
+                section.append("")
+            if data.psc_rep:
+                team_slug = data.psc_rep
+                team = self.index.team_name(team_slug)
+                section.append(
+                    f"Team representatives: `{team} <teams.html#{team_slug}>`_"
+                )
+                section.append("")
+            if data.maintainers:
+                section.append("Members")
+                section.append("-------")
+                section.append("")
+                for member in self._link_users(*data.maintainers):
+                    section.append("* " + member)
+                section.append("")
+            if repo_slug != repos[-1][0]:
+                # add horiz separator except for the last one
+                section.append("\n----\n")
+        if not named:
+            return None
+        return "\n".join(section)
 
     def _generate_psc_pages(self):
+        if not self._is_outdated("teams.rst", self.conf_psc):
+            return
         section = ["Teams", "====="]
         psc_data = sorted(
-            [(data["name"], slug, data) for slug, data in self.conf_psc.items()]
+            [(data.name, slug, data) for slug, data in self.conf_psc.items()]
         )
         for psc_name, ___, data in psc_data:
             section.append(psc_name)
@@ -118,29 +266,99 @@ Repositories
             section.append("Members")
             section.append("-------")
             section.append("")
-            for member in self._link_users(*data["members"]):
+            for member in self._link_users(*data.members):
                 section.append("* " + member)
             section.append("")
             section.append("Representatives")
             section.append("---------------")
             section.append("")
-            for member in self._link_users(*data["representatives"]):
+            for member in self._link_users(*data.representatives):
                 section.append("* " + member)
             if psc_name != psc_data[-1][0]:
                 # add horiz separator except for the last one
                 section.append("\n----\n")
         content = "\n".join(section)
-        self.write(content, Path("docsource/teams.rst"))
+        self.write(content, self._page_path("teams.rst"))
+
+    def _generate_search_index(self):
+        org = self.conf_global.org or self.org
+        if not self._is_outdated(
+            SEARCH_INDEX_FILENAME,
+            SEARCH_INDEX_VERSION,
+            org,
+            self.conf_psc,
+            self.conf_repo,
+        ):
+            return
+        content = json.dumps(
+            self._build_search_index(org), sort_keys=True, separators=(",", ":")
+        )
+        self.write(content, self._page_path(SEARCH_INDEX_FILENAME))
+
+    def _build_search_index(self, org):
+        """Return the search index of repos, teams and users.
+
+        Besides repos by category and teams, it holds inverted lookups:
+        repos by team and, for each user, the repos they maintain
+        and the teams they belong to or represent.
+        Repos link to the page of their category.
+        """
+        repos = {}
+        categories = {}
+        for categ, categ_repos in sorted(self._repo_by_category().items()):
+            for slug, data in categ_repos:
+                if data.name is None:
+                    # not shown in pages
+                    continue
+                categories.setdefault(categ, []).append(slug)
+                repo = repos[slug] = {
+                    "name": data.name,
+                    "category": categ,
+                    "url": f"https://github.com/{org}/{slug}",
+                    "page": f"{categ.lower()}.html",
+                    "maintainers": list(data.maintainers),
+                }
+                for key in ("psc", "psc_rep"):
+                    if getattr(data, key):
+                        repo[key] = getattr(data, key)
+        teams = {}
+        for slug, data in sorted(self.conf_psc.items()):
+            team_repos = set(self.index.repos_by_psc.get(slug, ()))
+            team_repos.update(self.index.repos_by_psc_rep.get(slug, ()))
+            teams[slug] = {
+                "name": data.name,
+                "members": list(data.members),
+                "representatives": list(data.representatives),
+                "repos": sorted(team_repos.intersection(repos)),
+            }
+        users = {}
+        for login in self.index.users():
+            roles = self.index.user_roles(login)
+            roles["maintains"] = [x for x in roles["maintains"] if x in repos]
+            if any(roles.values()):
+                users[login] = roles
+        return {
+            "version": SEARCH_INDEX_VERSION,
+            "org": org,
+            "repos": repos,
+            "categories": categories,
+            "teams": teams,
+            "users": users,
+        }
 
     def _make_link(self, txt, href):
         return f"{txt} <{href}>"
 
     def _make_psc_path(self, psc_slug):
-        return Path(f"docsource/{psc_slug}.rst")
+        return self._page_path(f"{psc_slug}.rst")
+
+    def _page_path(self, filename):
+        return Path(self.page_folder) / filename
 
     def _link_users(self, *users):
         return [f"`{x} <https://github.com/{x}>`_" for x in users]
 
     def write(self, content, path):
-        with path.open("w") as fd:
-            fd.write(content)
+        self.rebuilt.append(path.name)
+        if write_if_changed(content, path):
+            _logger.info("Page %s updated", path.as_posix())
@@ -0,0 +1,95 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Identity map of the GitHub objects used during a run.
+
+Each team, repository and the current user are loaded once
+and the same object is handed to the state fetcher and to the operations.
+When many objects are missing they are read from org's listings
+instead of one request each.
+"""
+
+import threading
+
+# Below this amount of missing objects, single reads are cheaper than listings
+LISTING_THRESHOLD = 10
+
+
+class GHRegistry:
+    """GitHub objects of organization `gh_org`, by team slug and repo name."""
+
+    def __init__(self, gh, gh_org):
+        self.gh = gh
+        self.gh_org = gh_org
+        self._lock = threading.Lock()
+        self._me = None
+        self._teams = {}
+        self._repos = {}
+        self._repos_listed = False
+        self._teams_listed = False
+
+    def me(self):
+        """Return the authenticated user."""
+        if self._me is None:
+            gh_user = self.gh.me()
+            with self._lock:
+                if self._me is None:
+                    self._me = gh_user
+        return self._me
+
+    def register_team(self, gh_team):
+        """Register `gh_team` and return the registered object."""
+        with self._lock:
+            return self._teams.setdefault(gh_team.slug, gh_team)
+
+    def register_repo(self, gh_repo):
+        """Register `gh_repo` and return the registered object."""
+        with self._lock:
+            return self._repos.setdefault(gh_repo.name, gh_repo)
+
+    def team(self, slug):
+        """Return the team `slug`.
+
+        Raise `github3.exceptions.NotFoundError` if it does not exist.
+        """
+        gh_team = self._teams.get(slug)
+        if gh_team is None:
+            gh_team = self.register_team(self.gh_org.team_by_name(slug))
+        return gh_team
+
+    def repository(self, name):
+        """Return the repository `name`.
+
+        Raise `github3.exceptions.NotFoundError` if it does not exist.
+        """
+        gh_repo = self._repos.get(name)
+        if gh_repo is None:
+            gh_repo = self.register_repo(self.gh.repository(self.gh_org.login, name))
+        return gh_repo
+
+    def repositories(self):
+        """Return all org's repositories by name, listed once."""
+        if not self._repos_listed:
+            for gh_repo in self.gh_org.repositories():
+                self.register_repo(gh_repo)
+            self._repos_listed = True
+        return dict(self._repos)
+
+    def teams(self):
+        """Return all org's teams by slug, listed once."""
+        if not self._teams_listed:
+            for gh_team in self.gh_org.teams():
+                self.register_team(gh_team)
+            self._teams_listed = True
+        return dict(self._teams)
+
+    def prefetch(self, teams=(), repos=()):
+        """Load the given teams and repos ahead of their use.
+
+        Listings are read only when enough objects are missing, others
+        are loaded on demand.
+        """
+        if len(set(teams).difference(self._teams)) >= LISTING_THRESHOLD:
+            self.teams()
+        if len(set(repos).difference(self._repos)) >= LISTING_THRESHOLD:
+            self.repositories()
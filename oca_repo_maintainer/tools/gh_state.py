@@ -0,0 +1,539 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Actual state of the organization on GitHub."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from github3.exceptions import NotFoundError
+from github3.orgs import Invitation
+from github3.repos.invitation import Invitation as RepoInvitation
+from github3.users import Collaborator
+
+from .gh_registry import GHRegistry
+
+_logger = logging.getLogger(__name__)
+
+# From the highest to the lowest
+PERMISSIONS = ("admin", "maintain", "push", "triage", "pull")
+GRAPHQL_PERMISSIONS = {
+    "ADMIN": "admin",
+    "MAINTAIN": "maintain",
+    "WRITE": "push",
+    "TRIAGE": "triage",
+    "READ": "pull",
+}
+
+
+def _set_or_none(values):
+    return set(values) if values is not None else None
+
+
+def _pending_or_none(pending):
+    if pending is None:
+        return None
+    # w/o roles, logins are invited w/ an unknown (None) role
+    return dict(pending) if isinstance(pending, dict) else dict.fromkeys(pending)
+
+
+class TeamState:
+    """State of a team.
+
+    Members (logins by role), pending invitations and repos
+    are None when not fetched yet.
+    `pending` maps invited logins to the role they are invited with,
+    None when not known yet.
+    `repos` maps repository names to team's permission on them.
+    """
+
+    def __init__(
+        self,
+        slug,
+        gh_team=None,
+        members=None,
+        maintainers=None,
+        repos=None,
+        pending=None,
+    ):
+        self.slug = slug
+        self.gh_team = gh_team
+        self.members = _set_or_none(members)
+        self.maintainers = _set_or_none(maintainers)
+        self.pending = _pending_or_none(pending)
+        self.repos = dict(repos) if repos is not None else None
+
+    @property
+    def roles(self):
+        """Map active members' logins to their role in the team."""
+        roles = {login: "member" for login in self.members}
+        roles.update({login: "maintainer" for login in self.maintainers})
+        return roles
+
+
+class RepoState:
+    """State of a repository.
+
+    `branches`, direct `collaborators` and pending `invitations`
+    are None when they have not been fetched.
+    `invitations` maps invited logins to the id of their invitation.
+    """
+
+    def __init__(
+        self,
+        name,
+        gh_repo=None,
+        default_branch=None,
+        branches=None,
+        collaborators=None,
+        invitations=None,
+    ):
+        self.name = name
+        self.gh_repo = gh_repo
+        self.default_branch = default_branch
+        self.branches = _set_or_none(branches)
+        self.collaborators = _set_or_none(collaborators)
+        self.invitations = dict(invitations) if invitations is not None else None
+
+
+class OrgState:
+    """Snapshot of the organization."""
+
+    def __init__(self):
+        # slug: TeamState, None if the team does not exist
+        self.teams = {}
+        # name: RepoState, None until repositories are listed
+        self.repos = None
+
+
+class RestStateFetcher:
+    """Fetch the actual state of the organization via REST calls.
+
+    Data is fetched lazily, only when it's needed, and kept for the whole run.
+    GitHub objects are shared w/ the rest of the run via `registry`.
+    """
+
+    def __init__(self, gh, gh_org, registry=None):
+        self.gh = gh
+        self.gh_org = gh_org
+        self.registry = registry or GHRegistry(gh, gh_org)
+        self.state = OrgState()
+
+    def team(self, slug, members=False, repos=False):
+        """Return team's state or None if the team does not exist."""
+        if slug not in self.state.teams:
+            try:
+                gh_team = self.registry.team(slug)
+            except NotFoundError:
+                gh_team = None
+            self.state.teams[slug] = (
+                TeamState(slug, gh_team=gh_team) if gh_team else None
+            )
+        team = self.state.teams[slug]
+        if team is None:
+            return team
+        if members and team.members is None:
+            team.members = {x.login for x in team.gh_team.members(role="member")}
+            team.maintainers = {
+                x.login for x in team.gh_team.members(role="maintainer")
+            }
+            team.pending = {
+                x.login: self._pending_role(team.gh_team, x.login)
+                for x in self._team_invitations(team.gh_team)
+            }
+        if repos and team.repos is None:
+            team.repos = {
+                x.name: self._repo_permission(x) for x in team.gh_team.repositories()
+            }
+        return team
+
+    def prefetch(self, teams=(), team_repos=(), repos=(), collaborators=(), jobs=1):
+        """Read the state of many teams and repos w/ up to `jobs` concurrent requests.
+
+        `teams` are read w/ their members, `team_repos` w/ their repos,
+        `repos` w/ their branches and `collaborators` w/ their direct collaborators.
+        W/ a single job nothing is done: data is read when it's needed.
+        """
+        if jobs < 2:
+            return
+        existing = self.repositories()
+        reads = [
+            partial(self.team, slug, members=slug in teams, repos=slug in team_repos)
+            for slug in sorted(set(teams).union(team_repos))
+        ]
+        reads += [
+            partial(
+                self.repository,
+                name,
+                branches=name in repos,
+                collaborators=name in collaborators,
+            )
+            for name in sorted(set(repos).union(collaborators))
+            if name in existing
+        ]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for future in [executor.submit(x) for x in reads]:
+                # raise errors
+                future.result()
+
+    def _team_invitations(self, gh_team):
+        # not covered by github3
+        url = gh_team._build_url("invitations", base_url=gh_team._api)
+        # invitations sent by email have no login
+        return [x for x in gh_team._iter(-1, url, Invitation) if x.login]
+
+    def _pending_role(self, gh_team, login):
+        """Return the role `login` is invited with in the team.
+
+        The `role` of team invitations is the role in the organization:
+        the one in the team comes w/ the (pending) membership.
+        """
+        return gh_team.membership_for(login).get("role")
+
+    def _repo_permission(self, gh_repo):
+        permissions = gh_repo.as_dict().get("permissions") or {}
+        for permission in PERMISSIONS:
+            if permissions.get(permission):
+                return permission
+        return None
+
+    def repositories(self):
+        """Return the state of all org's repositories by name."""
+        if self.state.repos is None:
+            self.state.repos = {
+                gh_repo.name: RepoState(
+                    gh_repo.name,
+                    gh_repo=gh_repo,
+                    default_branch=gh_repo.as_dict().get("default_branch"),
+                )
+                for gh_repo in self.registry.repositories().values()
+            }
+        return self.state.repos
+
+    def repository(self, name, branches=False, collaborators=False):
+        """Return repository's state or None if the repository does not exist."""
+        repo = self.repositories().get(name)
+        if repo is None:
+            return repo
+        if branches and repo.branches is None:
+            repo.branches = {x.name for x in repo.gh_repo.branches()}
+        if collaborators and repo.collaborators is None:
+            repo.collaborators = {
+                x.login
+                for x in self._iter_repo(
+                    name, "collaborators", Collaborator, affiliation="direct"
+                )
+            }
+        return repo
+
+    def repo_invitations(self, name):
+        """Return pending invitations to collaborate on repository `name`."""
+        repo = self.repositories()[name]
+        if repo.invitations is None:
+            repo.invitations = {
+                x.invitee.login: x.id
+                for x in self._iter_repo(name, "invitations", RepoInvitation)
+            }
+        return repo.invitations
+
+    def _iter_repo(self, name, path, cls, **params):
+        # works w/o loading the repository
+        url = self.gh._build_url("repos", self.gh_org.login, name, path)
+        return self.gh._iter(-1, url, cls, params=params or None)
+
+
+class GraphQLError(Exception):
+    """Errors returned by the GraphQL API."""
+
+
+_PAGE_INFO = "pageInfo { hasNextPage endCursor }"
+
+REPOSITORIES_QUERY = """
+query($org: String!, $after: String) {
+  organization(login: $org) {
+    repositories(first: 100, after: $after) {
+      %(page_info)s
+      nodes {
+        name
+        defaultBranchRef { name }
+        refs(refPrefix: "refs/heads/", first: 100) {
+          %(page_info)s
+          nodes { name }
+        }
+        collaborators(affiliation: DIRECT, first: 100) {
+          %(page_info)s
+          nodes { login }
+        }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+REPOSITORY_BRANCHES_QUERY = """
+query($org: String!, $name: String!, $after: String) {
+  organization(login: $org) {
+    repository(name: $name) {
+      refs(refPrefix: "refs/heads/", first: 100, after: $after) {
+        %(page_info)s
+        nodes { name }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+REPOSITORY_COLLABORATORS_QUERY = """
+query($org: String!, $name: String!, $after: String) {
+  organization(login: $org) {
+    repository(name: $name) {
+      collaborators(affiliation: DIRECT, first: 100, after: $after) {
+        %(page_info)s
+        nodes { login }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+TEAMS_QUERY = """
+query($org: String!, $after: String) {
+  organization(login: $org) {
+    teams(first: 50, after: $after) {
+      %(page_info)s
+      nodes {
+        slug
+        members(first: 100) {
+          %(page_info)s
+          edges { role node { login } }
+        }
+        repositories(first: 100) {
+          %(page_info)s
+          edges { permission node { name } }
+        }
+        invitations(first: 100) {
+          %(page_info)s
+          nodes { invitee { login } }
+        }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+TEAM_MEMBERS_QUERY = """
+query($org: String!, $slug: String!, $after: String) {
+  organization(login: $org) {
+    team(slug: $slug) {
+      members(first: 100, after: $after) {
+        %(page_info)s
+        edges { role node { login } }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+TEAM_REPOSITORIES_QUERY = """
+query($org: String!, $slug: String!, $after: String) {
+  organization(login: $org) {
+    team(slug: $slug) {
+      repositories(first: 100, after: $after) {
+        %(page_info)s
+        edges { permission node { name } }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+
+TEAM_INVITATIONS_QUERY = """
+query($org: String!, $slug: String!, $after: String) {
+  organization(login: $org) {
+    team(slug: $slug) {
+      invitations(first: 100, after: $after) {
+        %(page_info)s
+        nodes { invitee { login } }
+      }
+    }
+  }
+}
+""" % {
+    "page_info": _PAGE_INFO
+}
+
+
+class GraphQLStateFetcher(RestStateFetcher):
+    """Fetch a snapshot of the whole organization via GraphQL.
+
+    Repositories with their branches and collaborators and teams with their members,
+    pending invitations and repositories are read in a few paginated queries.
+    GitHub objects needed to apply changes are not loaded:
+    `gh_team` and `gh_repo` are None, use the registry to get them.
+    """
+
+    def __init__(self, gh, gh_org, registry=None):
+        super().__init__(gh, gh_org, registry=registry)
+        self._teams_loaded = False
+
+    def prefetch(self, *args, **kw):
+        """Nothing to do: the snapshot is read at once."""
+
+    def team(self, slug, members=False, repos=False):
+        self._load_teams()
+        team = self.state.teams.get(slug)
+        if members and team is not None and None in team.pending.values():
+            # not part of the snapshot, read only for the teams needing them
+            gh_team = self.registry.team(slug)
+            for login, role in team.pending.items():
+                if role is None:
+                    team.pending[login] = self._pending_role(gh_team, login)
+        return team
+
+    def repositories(self):
+        if self.state.repos is None:
+            self.state.repos = {}
+            for node in self._paginate(REPOSITORIES_QUERY, ("repositories",)):
+                branches = self._connection_nodes(
+                    node["refs"],
+                    REPOSITORY_BRANCHES_QUERY,
+                    ("repository", "refs"),
+                    name=node["name"],
+                )
+                collaborators = None
+                # null when the token can't read them
+                if node["collaborators"] is not None:
+                    collaborators = [
+                        x["login"]
+                        for x in self._connection_nodes(
+                            node["collaborators"],
+                            REPOSITORY_COLLABORATORS_QUERY,
+                            ("repository", "collaborators"),
+                            name=node["name"],
+                        )
+                    ]
+                default_branch = node["defaultBranchRef"]
+                self.state.repos[node["name"]] = RepoState(
+                    node["name"],
+                    default_branch=default_branch and default_branch["name"],
+                    branches=[x["name"] for x in branches],
+                    collaborators=collaborators,
+                )
+        return self.state.repos
+
+    def repository(self, name, branches=False, collaborators=False):
+        repo = self.repositories().get(name)
+        if repo is not None and collaborators and repo.collaborators is None:
+            # fallback to REST
+            return super().repository(name, collaborators=True)
+        return repo
+
+    def _load_teams(self):
+        if self._teams_loaded:
+            return
+        for node in self._paginate(TEAMS_QUERY, ("teams",)):
+            slug = node["slug"]
+            member_edges = self._connection_edges(
+                node["members"], TEAM_MEMBERS_QUERY, ("team", "members"), slug=slug
+            )
+            repo_edges = self._connection_edges(
+                node["repositories"],
+                TEAM_REPOSITORIES_QUERY,
+                ("team", "repositories"),
+                slug=slug,
+            )
+            invitations = self._connection_nodes(
+                node["invitations"],
+                TEAM_INVITATIONS_QUERY,
+                ("team", "invitations"),
+                slug=slug,
+            )
+            self.state.teams[slug] = TeamState(
+                slug,
+                members=[
+                    x["node"]["login"] for x in member_edges if x["role"] == "MEMBER"
+                ],
+                maintainers=[
+                    x["node"]["login"]
+                    for x in member_edges
+                    if x["role"] == "MAINTAINER"
+                ],
+                repos={
+                    x["node"]["name"]: GRAPHQL_PERMISSIONS.get(x["permission"])
+                    for x in repo_edges
+                },
+                # invitations sent by email have no invitee
+                pending=[x["invitee"]["login"] for x in invitations if x["invitee"]],
+            )
+        self._teams_loaded = True
+
+    def query(self, query, **variables):
+        variables["org"] = self.gh_org.login
+        response = self.gh._post(
+            self.gh._build_url("graphql"),
+            data={"query": query, "variables": variables},
+        )
+        response.raise_for_status()
+        result = response.json()
+        errors = [x for x in result.get("errors") or () if not self._is_tolerated(x)]
+        if errors:
+            raise GraphQLError("; ".join(x.get("message", str(x)) for x in errors))
+        return result["data"]["organization"]
+
+    def _is_tolerated(self, error):
+        """Return True if `error` only hides the collaborators of a repo.
+
+        Those are left empty (None) in the partial data
+        and read via REST when needed.
+        """
+        path = error.get("path") or ()
+        if error.get("type") == "FORBIDDEN" and path and path[-1] == "collaborators":
+            _logger.debug("Collaborators not readable via GraphQL: %s", path)
+            return True
+        return False
+
+    def _get_path(self, data, path):
+        for key in path:
+            data = data[key]
+        return data
+
+    def _paginate(self, query, path, **variables):
+        """Return all the nodes of the connection at `path` in `query`."""
+        connection = self._get_path(self.query(query, after=None, **variables), path)
+        return self._connection_items(connection, "nodes", query, path, **variables)
+
+    def _connection_items(self, connection, key, query, path, **variables):
+        """Return all the items of a connection.
+
+        The 1st page is the one given, next ones are fetched
+        running `query` which must return the same connection at `path`.
+        """
+        items = list(connection[key])
+        page_info = connection["pageInfo"]
+        while page_info["hasNextPage"]:
+            next_connection = self._get_path(
+                self.query(query, after=page_info["endCursor"], **variables), path
+            )
+            items.extend(next_connection[key])
+            page_info = next_connection["pageInfo"]
+        return items
+
+    def _connection_nodes(self, connection, query, path, **variables):
+        return self._connection_items(connection, "nodes", query, path, **variables)
+
+    def _connection_edges(self, connection, query, path, **variables):
+        return self._connection_items(connection, "edges", query, path, **variables)
@@ -0,0 +1,103 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Conditional requests cache for GitHub API reads.
+
+Responses to GET requests are stored on disk with their validators
+(ETag, Last-Modified). Next time the same resource is requested
+the validators are sent and a 304 response, which GitHub does not count
+against the rate limit, is served from the cache.
+"""
+
+import hashlib
+import logging
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .cache import DiskCache
+
+_logger = logging.getLogger(__name__)
+
+HTTP_CACHE_VERSION = "1"
+HTTP_CACHE_MAX_SIZE = 256 * 1024 * 1024
+# Headers that differ between requests of the same resource
+VARY_HEADERS = ("Accept", "Authorization")
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    """HTTP adapter revalidating GET responses stored in a `DiskCache`."""
+
+    def __init__(self, cache, **kw):
+        super().__init__(**kw)
+        self.cache = cache
+
+    def _cache_key(self, request):
+        parts = [request.url] + [request.headers.get(x, "") for x in VARY_HEADERS]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def send(self, request, **kw):
+        if request.method != "GET":
+            return super().send(request, **kw)
+        key = self._cache_key(request)
+        entry = self.cache.get(key)
+        if entry:
+            if entry.get("etag"):
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+        response = super().send(request, **kw)
+        if response.status_code == 304 and entry:
+            _logger.debug("Cache hit: %s", request.url)
+            return self._cached_response(request, response, entry)
+        if response.status_code == 200:
+            self._store(key, response)
+        return response
+
+    def _store(self, key, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return
+        self.cache.set(
+            key,
+            {
+                "etag": etag,
+                "last_modified": last_modified,
+                "headers": dict(response.headers),
+                # reading content here is fine: github3 never streams API calls
+                "content": response.content,
+            },
+        )
+
+    def _cached_response(self, request, not_modified, entry):
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        headers = CaseInsensitiveDict(entry["headers"])
+        # keep fresh values for rate limit and co.
+        for name, value in not_modified.headers.items():
+            if name.lower().startswith("x-ratelimit") or name.lower() == "date":
+                headers[name] = value
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response._content = entry["content"]
+        response.from_cache = True
+        return response
+
+
+def install_http_cache(session, cache_dir, max_size=HTTP_CACHE_MAX_SIZE, **adapter_kw):
+    """Make `session` use the conditional requests cache stored in `cache_dir`.
+
+    `adapter_kw` are passed to the HTTP adapter, eg: the size of its pool.
+    """
+    cache = DiskCache(cache_dir, "http", HTTP_CACHE_VERSION, max_size=max_size)
+    adapter = CachingHTTPAdapter(cache, **adapter_kw)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return cache
@@ -0,0 +1,91 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Record the work completed during a run, to resume it if interrupted."""
+
+import json
+import logging
+import threading
+from pathlib import Path
+
+_logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "journal.jsonl"
+
+
+class Journal:
+    """Append-only record of completed operations and conf entries.
+
+    Each line is a JSON object, either `{"op": <operation key>}`
+    or `{"checksum": <conf entry key>, "md5": <entry checksum>}`
+    once all the operations of a conf entry are applied.
+    Lines are flushed right away so that they survive a crash.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # keys of operations already applied
+        self.done = set()
+        # checksums of conf entries completely synced
+        self.checksum = {}
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the records of a previous run, if any."""
+        if not self.path.exists():
+            return self
+        with self.path.open() as fd:
+            for line in fd:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last line of a run killed while writing
+                    _logger.warning("Skipping invalid journal line: %s", line)
+                    continue
+                if "op" in record:
+                    self.done.add(record["op"])
+                elif "checksum" in record:
+                    self.checksum[record["checksum"]] = record["md5"]
+        _logger.info(
+            "Journal: %s operations and %s entries already done",
+            len(self.done),
+            len(self.checksum),
+        )
+        return self
+
+    def open(self, resume=False):
+        """Start recording, after previous records when `resume` is enabled."""
+        self._fd = self.path.open("a" if resume else "w")
+        if resume and self._fd.tell():
+            with self.path.open("rb") as fd:
+                fd.seek(-1, 2)
+                if fd.read() != b"\n":
+                    # do not append to a truncated line
+                    self._fd.write("\n")
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def discard(self):
+        """Drop the journal, once the run is completed."""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def record_operation(self, op):
+        self.done.add(op.key)
+        self._write({"op": op.key})
+
+    def record_checksum(self, key, md5):
+        self.checksum[key] = md5
+        self._write({"checksum": key, "md5": md5})
+
+    def _write(self, record):
+        if self._fd is None:
+            return
+        with self._lock:
+            self._fd.write(json.dumps(record) + "\n")
+            self._fd.flush()
@@ -4,17 +4,27 @@
 # @author: Simone Orsi
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import base64
 import logging
+import os
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+from pathlib import Path
 from subprocess import CalledProcessError
 
 import copier
-import github3
-from github3.exceptions import NotFoundError
 
+from .executor import Executor
+from .gh_client import github_login
+from .gh_registry import GHRegistry
+from .gh_state import GraphQLStateFetcher, RepoState, RestStateFetcher, TeamState
+from .journal import JOURNAL_FILENAME, Journal
+from .metrics import Metrics
+from .planner import REPO_TARGET_OPERATIONS, TEAM_TARGET_OPERATIONS, Plan, Planner
+from .template_cache import TemplateCache
 from .utils import ConfLoader
 
 handler = logging.StreamHandler(sys.stdout)
@@ -48,30 +58,105 @@ def check_call(cmd, cwd=None, log_error=True, extra_cmd_args=False, env=None):
 class RepoManager:
     """Setup and update repositories and teams."""
 
-    def __init__(self, conf_dir, org, token, force=False):
+    state_fetchers = {
+        "rest": RestStateFetcher,
+        "graphql": GraphQLStateFetcher,
+    }
+    # How new branches are pushed: w/ git commands or w/ the Git Data API
+    branch_backends = ("git", "api")
+
+    def __init__(
+        self,
+        conf_dir,
+        org,
+        token,
+        force=False,
+        cache_dir=None,
+        state_backend="graphql",
+        jobs=1,
+        branch_backend="git",
+        render_cache=False,
+        prune_collaborators=False,
+        resume=False,
+        metrics=None,
+    ):
         self.conf_dir = conf_dir
-        self.conf_loader = ConfLoader(self.conf_dir)
+        self.conf_loader = ConfLoader(self.conf_dir, cache_dir=cache_dir)
+        self.cache_dir = cache_dir
         self.token = token
         self.org = org
         self.force = force
-        self.conf_global = self.conf_loader.load_conf("global", checksum=False)
-        self.conf_psc = self.conf_loader.load_conf("psc", checksum=not force)
-        self.conf_repo = self.conf_loader.load_conf("repo", checksum=not force)
-        self.new_repo_template = self.conf_global.get("template")
-
-    def run(self):
-        self._setup_gh()
-        self._process_psc()
-        self._process_repositories()
+        self.state_backend = state_backend
+        self.jobs = jobs
+        self.branch_backend = branch_backend
+        self.render_cache = render_cache
+        self.prune_collaborators = prune_collaborators
+        self.resume = resume
+        self.metrics = metrics or Metrics()
+        self.journal = Journal(Path(conf_dir) / JOURNAL_FILENAME)
+        if resume:
+            # entries completed by the interrupted run are not loaded again
+            self.conf_loader.checksum.update(self.journal.load().checksum)
+        # conf entry key: amount of operations still to apply
+        self._pending_entries = {}
+        self._journal_lock = threading.Lock()
+        self._template_cache = None
+        # GitHub objects, see `_setup_gh`
+        self.registry = None
+        # initialization of empty repositories, see `_ensure_not_empty`
+        self._repo_init_lock = threading.Lock()
+        # copier changes the current working dir: renders can't run in parallel
+        self._render_lock = threading.Lock()
+        with self.metrics.phase("load_conf"):
+            self.conf_global = self.conf_loader.load_model("global", checksum=False)
+            self.conf_psc = self.conf_loader.load_model("psc", checksum=not force)
+            self.conf_repo = self.conf_loader.load_model("repo", checksum=not force)
+        self.new_repo_template = self.conf_global.template
+
+    def run(self, dry_run=False):
+        """Sync GitHub with the configuration.
+
+        When `dry_run` is enabled nothing is changed on GitHub.
+        Return the plan of the operations.
+        """
+        with self.metrics.phase("setup_gh"):
+            self._setup_gh()
+        plan = self.plan()
+        _logger.info("Plan: %s operations, ~%s API calls", len(plan), plan.api_calls)
+        if dry_run:
+            return plan
+        self.journal.open(resume=self.resume)
+        try:
+            with self.metrics.phase("apply"):
+                self.apply(plan)
+        finally:
+            self.journal.close()
+            if self._template_cache is not None:
+                self._template_cache.cleanup()
+                self._template_cache = None
         self._save_checksum()
+        self.journal.discard()
+        return plan
 
     def _setup_gh(self):
-        self.gh = github3.login(token=self.token)
+        self.gh = github_login(
+            self.token, jobs=self.jobs, cache_dir=self.cache_dir, metrics=self.metrics
+        )
         self.gh_org = self.gh.organization(self.org)
+        # GitHub objects shared by all the phases of the run
+        self.registry = GHRegistry(self.gh, self.gh_org)
+        self.fetcher = self.state_fetchers[self.state_backend](
+            self.gh, self.gh_org, registry=self.registry
+        )
+        self.planner = Planner(
+            self.conf_global,
+            self.fetcher,
+            prune_collaborators=self.prune_collaborators,
+        )
 
     def _setup_user(self, clone_dir):
         """Ensure user is properly configured on current repo."""
-        gh_user = self.gh.me()
+        gh_user = self.registry.me()
         try:
             name = subprocess.check_output("git config user.name".split(" ")).strip()
         except CalledProcessError:
@@ -91,91 +176,211 @@ class RepoManager:
                 cwd=clone_dir,
             )
 
-    def _process_psc(self):
+    def plan(self):
+        """Compute the operations needed to sync GitHub with the configuration.
+
+        The state of GitHub is read, but nothing is changed.
+        """
+        plan = self._new_plan()
+        if self.jobs > 1:
+            with self.metrics.phase("prefetch_state"):
+                self._prefetch_state()
+        self._plan_psc(plan)
+        self._plan_repositories(plan)
+        return plan
+
+    def _prefetch_state(self):
+        """Read the state needed by the plan w/ concurrent requests."""
+        self.fetcher.prefetch(
+            teams=self.conf_psc,
+            team_repos={data.psc for data in self.conf_repo.values() if data.psc},
+            repos=self.conf_repo,
+            collaborators=[
+                slug
+                for slug, data in self.conf_repo.items()
+                if data.maintainers or self.prune_collaborators
+            ],
+            jobs=self.jobs,
+        )
+
+    def _new_plan(self):
+        costs = {}
+        if self.branch_backend == "api":
+            # tree (text files are inlined), commit and ref
+            costs["create_branch"] = 3
+        return Plan(costs=costs)
+
+    def _plan_psc(self, plan):
         if not self.conf_psc:
             _logger.info("No team to process")
-            return
-        for team, data in self.conf_psc.items():
-            _logger.info("Processing team %s" % team)
-            try:
-                gh_team = self.gh_org.team_by_name(team)
-            except NotFoundError:
-                gh_team = self.gh_org.create_team(team, privacy="closed")
-            members = data.get("members", []) + self.conf_global["maintainers"]
-            representatives = data.get("representatives", [])
-            done_members = []
-            done_representatives = []
-            for member in gh_team.members(role="member"):
-                if member.login not in members:
-                    if member.login not in representatives:
-                        _logger.info("Revoking membership for %s" % member.login)
-                        gh_team.revoke_membership(member.login)
-                else:
-                    done_members.append(member.login)
-            for member in gh_team.members(role="maintainer"):
-                if member.login not in representatives:
-                    if member.login not in members:
-                        _logger.info("Revoking membership for %s" % member.login)
-                        gh_team.revoke_membership(member.login)
-                else:
-                    done_representatives.append(member.login)
-            for member in members:
-                if member not in done_members:
-                    _logger.info("Adding membership to %s" % member)
-                    gh_team.add_or_update_membership(member, role="member")
-            for member in representatives:
-                if member not in done_representatives:
-                    _logger.info("Adding membership to %s" % member)
-                    gh_team.add_or_update_membership(member, role="maintainer")
+            return plan
+        with self.metrics.phase("plan_psc"):
+            return self.planner.plan_teams(plan, self.conf_psc)
 
-    def _process_repositories(self):
+    def _plan_repositories(self, plan):
         if not self.conf_repo:
             _logger.info("No repo to process")
+            return plan
+        with self.metrics.phase("plan_repositories"):
+            return self.planner.plan_repositories(plan, self.conf_repo)
+
+    def apply(self, plan):
+        operations = [op for op in plan if op.key not in self.journal.done]
+        if len(operations) < len(plan):
+            _logger.info(
+                "Skipping %s operations already applied",
+                len(plan) - len(operations),
+            )
+        self._pending_entries = {}
+        for op in operations:
+            self._pending_entries[op.entry] = self._pending_entries.get(op.entry, 0) + 1
+        for entry in plan.entries:
+            if entry not in self._pending_entries:
+                self._entry_done(entry)
+        if self.registry is not None:
+            self._prefetch_gh_objects(operations)
+        Executor(jobs=self.jobs).run(operations, self._apply_operation)
+
+    def _apply_operation(self, op):
+        getattr(self, f"_apply_{op.kind}")(op)
+        self.journal.record_operation(op)
+        if op.entry not in self._pending_entries:
             return
-        repositories = self.gh_org.repositories()
-        repo_keys = [repo.name for repo in repositories]
-        gh_admin_team = self.gh_org.team_by_name(self.conf_global.get("owner"))
-        gh_maintainer_teams = [
-            self.gh_org.team_by_name(maintainer_team)
-            for maintainer_team in self.conf_global.get("team_maintainers")
-        ]
-        team_repos = {}
-        for repo, repo_data in self.conf_repo.items():
-            if repo not in repo_keys:
-                gh_repo = self.gh_org.create_repository(
-                    repo, repo, team_id=gh_admin_team.id
-                )
-                for gh_maintainer_team in gh_maintainer_teams:
-                    gh_maintainer_team.add_repository(
-                        "{}/{}".format(self.org, repo), "admin"
-                    )
-                repo_branches = []
-            else:
-                gh_repo = self.gh.repository(self.org, repo)
-                repo_branches = [branch.name for branch in gh_repo.branches()]
-            if repo_data["psc"] not in team_repos:
-                gh_team = self.gh_org.team_by_name(repo_data["psc"])
-                team_repos[repo_data["psc"]] = {
-                    "team": gh_team,
-                    "repos": [repo.name for repo in gh_team.repositories()],
-                }
-            if repo not in team_repos[repo_data["psc"]]["repos"]:
-                team_repos[repo_data["psc"]]["team"].add_repository(
-                    "{}/{}".format(self.org, repo), "push"
-                )
-            for member in repo_data.get("maintainers", []):
-                gh_repo.add_collaborator(member)
-            for branch in sorted(repo_data.get("branches")):
-                if str(branch) not in repo_branches:
-                    self._create_branch(gh_repo, str(branch))
-            branch = repo_data.get("default_branch")
-            if branch and gh_repo.default_branch != branch:
-                gh_repo.edit(name=gh_repo.name, default_branch=branch)
+        with self._journal_lock:
+            self._pending_entries[op.entry] -= 1
+            entry_done = not self._pending_entries[op.entry]
+        if entry_done:
+            self._entry_done(op.entry)
+
+    def _entry_done(self, entry):
+        """Record the checksum of conf `entry` once it's synced."""
+        md5 = self.conf_loader.checksum.get(entry)
+        if md5:
+            self.journal.record_checksum(entry, md5)
+
+    def _process_psc(self):
+        with self.metrics.phase("process_psc"):
+            self.apply(self._plan_psc(self._new_plan()))
+
+    def _process_repositories(self):
+        with self.metrics.phase("process_repositories"):
+            self.apply(self._plan_repositories(self._new_plan()))
+
+    def _get_gh_team(self, slug):
+        # snapshots do not include GitHub objects: always go through the registry
+        return self.registry.team(slug)
+
+    def _get_gh_repo(self, name):
+        return self.registry.repository(name)
+
+    def _prefetch_gh_objects(self, operations):
+        """Load GitHub objects needed by `operations` in as few requests as possible."""
+        teams = set()
+        repos = set()
+        for op in operations:
+            if op.kind in TEAM_TARGET_OPERATIONS:
+                teams.add(op.target)
+            elif op.kind in REPO_TARGET_OPERATIONS:
+                repos.add(op.target)
+            elif op.kind == "create_repo":
+                teams.add(self.conf_global.owner)
+        # objects created by the run do not exist yet
+        teams.difference_update(x.target for x in operations if x.kind == "create_team")
+        repos.difference_update(x.target for x in operations if x.kind == "create_repo")
+        self.registry.prefetch(teams=teams, repos=repos)
+
+    def _apply_create_team(self, op):
+        _logger.info("Creating team %s" % op.target)
+        gh_team = self.registry.register_team(
+            self.gh_org.create_team(op.target, privacy="closed")
+        )
+        self.fetcher.state.teams[op.target] = TeamState(
+            op.target,
+            gh_team=gh_team,
+            members=[],
+            maintainers=[],
+            repos={},
+            pending=[],
+        )
+
+    def _apply_revoke_membership(self, op):
+        _logger.info("Revoking membership for %s" % op.params["user"])
+        self._get_gh_team(op.target).revoke_membership(op.params["user"])
+
+    def _apply_add_membership(self, op):
+        _logger.info("Adding membership to %s" % op.params["user"])
+        self._get_gh_team(op.target).add_or_update_membership(
+            op.params["user"], role=op.params["role"]
+        )
+
+    def _apply_change_membership_role(self, op):
+        _logger.info("Changing role of %s to %s", op.params["user"], op.params["role"])
+        self._get_gh_team(op.target).add_or_update_membership(
+            op.params["user"], role=op.params["role"]
+        )
+
+    def _apply_create_repo(self, op):
+        _logger.info("Creating repository %s" % op.target)
+        gh_admin_team = self._get_gh_team(self.conf_global.owner)
+        gh_repo = self.registry.register_repo(
+            self.gh_org.create_repository(
+                op.target, op.target, team_id=gh_admin_team.id
+            )
+        )
+        self.fetcher.repositories()[op.target] = RepoState(
+            op.target,
+            gh_repo=gh_repo,
+            default_branch=gh_repo.default_branch,
+            branches=[],
+            collaborators=[],
+            invitations={},
+        )
+
+    def _apply_add_team_repo(self, op):
+        repo = op.params["repo"]
+        _logger.info(
+            "Granting %s access to %s on %s", op.params["permission"], op.target, repo
+        )
+        self._get_gh_team(op.target).add_repository(
+            "{}/{}".format(self.org, repo), op.params["permission"]
+        )
+
+    def _apply_add_collaborator(self, op):
+        _logger.info("Inviting collaborator %s to %s", op.params["user"], op.target)
+        self._get_gh_repo(op.target).add_collaborator(op.params["user"])
+
+    def _apply_remove_collaborator(self, op):
+        _logger.info("Removing collaborator %s from %s", op.params["user"], op.target)
+        self._get_gh_repo(op.target).remove_collaborator(op.params["user"])
+
+    def _apply_cancel_invitation(self, op):
+        _logger.info("Canceling invitation of %s to %s", op.params["user"], op.target)
+        gh_repo = self._get_gh_repo(op.target)
+        # not covered by github3
+        url = gh_repo._build_url(
+            "invitations", str(op.params["invitation"]), base_url=gh_repo._api
+        )
+        gh_repo._boolean(gh_repo._delete(url), 204, 404)
+
+    def _apply_create_branch(self, op):
+        _logger.info("Creating branch %s on %s", op.params["branch"], op.target)
+        self._create_branch(self._get_gh_repo(op.target), op.params["branch"])
+        repo_state = self.fetcher.repository(op.target)
+        if repo_state is not None and repo_state.branches is not None:
+            repo_state.branches.add(op.params["branch"])
+
+    def _apply_set_default_branch(self, op):
+        gh_repo = self._get_gh_repo(op.target)
+        gh_repo.edit(name=gh_repo.name, default_branch=op.params["branch"])
 
     def _create_branch(self, gh_repo, version):
         clone_dir = tempfile.mkdtemp()
         try:
-            self._init_branch(clone_dir, gh_repo, version)
+            with self.metrics.phase("create_branch"):
+                if self.branch_backend == "api":
+                    self._init_branch_via_api(clone_dir, gh_repo, version)
+                else:
+                    self._init_branch(clone_dir, gh_repo, version)
         except CalledProcessError:
             _logger.error("Something failed when the new repo was being created")
             raise
@@ -183,18 +388,8 @@ class RepoManager:
             shutil.rmtree(clone_dir)
 
     def _init_branch(self, clone_dir, gh_repo, version):
-        copier.run_copy(
-            self.new_repo_template,
-            clone_dir,
-            defaults=True,
-            unsafe=True,
-            data={
-                "repo_name": gh_repo.name,
-                "repo_slug": gh_repo.name,
-                "repo_description": gh_repo.name,
-                "odoo_version": version,
-            },
-        )
+        with self._render_lock:
+            self._render_template(clone_dir, gh_repo, version)
         self._run_cmd(
             ["git", "init"],
             cwd=clone_dir,
@@ -232,8 +427,103 @@ class RepoManager:
             cwd=clone_dir,
         )
 
+    def _init_branch_via_api(self, clone_dir, gh_repo, version):
+        """Create the branch w/ the Git Data API.
+
+        No git command is run: rendered files are uploaded as a tree,
+        a root commit is created and the branch points to it.
+        """
+        with self._render_lock:
+            self._render_template(clone_dir, gh_repo, version)
+        ref_exists = self._ensure_not_empty(gh_repo, version)
+        tree = gh_repo.create_tree(self._make_tree(gh_repo, clone_dir))
+        commit = gh_repo.create_commit("Initial commit", tree.sha, [])
+        if ref_exists:
+            gh_repo.ref(f"heads/{version}").update(commit.sha, force=True)
+        else:
+            gh_repo.create_ref(f"refs/heads/{version}", commit.sha)
+
+    def _ensure_not_empty(self, gh_repo, version):
+        """Make the Git Data API usable on empty repositories.
+
+        The API does not work until the repository has at least one commit.
+        Empty repositories get a placeholder commit on `version` branch,
+        which is then replaced. Return True if the branch has been created.
+        """
+        with self._repo_init_lock:
+            repo_state = self.fetcher.repository(gh_repo.name)
+            if repo_state is None or repo_state.branches is None:
+                return False
+            if repo_state.branches:
+                return False
+            _logger.info("Initializing empty repository %s", gh_repo.name)
+            # github3 sends nothing when content is empty
+            gh_repo.create_file(
+                ".gitkeep", "Initialize repository", b"\n", branch=version
+            )
+            repo_state.branches.add(version)
+            return True
+
+    def _make_tree(self, gh_repo, root):
+        """Return tree entries for all the files in `root`.
+
+        Text files are sent inline, binary ones are uploaded as blobs.
+        """
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in list(dirnames):
+                if name == ".git":
+                    dirnames.remove(name)
+                elif os.path.islink(os.path.join(dirpath, name)):
+                    # not followed by os.walk: handle it as a file
+                    dirnames.remove(name)
+                    filenames.append(name)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                entry = {
+                    "path": os.path.relpath(path, root).replace(os.sep, "/"),
+                    "type": "blob",
+                }
+                if os.path.islink(path):
+                    entry["mode"] = "120000"
+                    entry["content"] = os.readlink(path)
+                    entries.append(entry)
+                    continue
+                entry["mode"] = "100755" if os.access(path, os.X_OK) else "100644"
+                with open(path, "rb") as fd:
+                    data = fd.read()
+                try:
+                    entry["content"] = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    entry["sha"] = gh_repo.create_blob(
+                        base64.b64encode(data).decode(), "base64"
+                    )
+                entries.append(entry)
+        return sorted(entries, key=lambda x: x["path"])
+
+    def _render_template(self, dest_dir, gh_repo, version):
+        data = {
+            "repo_name": gh_repo.name,
+            "repo_slug": gh_repo.name,
+            "repo_description": gh_repo.name,
+            "odoo_version": version,
+        }
+        if self.render_cache:
+            if self._template_cache is None:
+                self._template_cache = TemplateCache(self.new_repo_template)
+            self._template_cache.render(dest_dir, data)
+            return
+        copier.run_copy(
+            self.new_repo_template,
+            dest_dir,
+            defaults=True,
+            unsafe=True,
+            data=data,
+        )
+
     def _run_cmd(self, cmd, cwd, **kw):
         check_call(cmd, cwd, **kw)
 
     def _save_checksum(self):
-        self.conf_loader.save_checksum()
+        with self.metrics.phase("save_checksum"):
+            self.conf_loader.save_checksum()
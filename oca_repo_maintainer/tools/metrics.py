@@ -0,0 +1,197 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Collect timings and GitHub API usage of a run.
+
+Requests are counted via a response hook installed on the HTTP session,
+by method and endpoint (ids and names replaced by placeholders).
+Phases are timed explicitly by the tools, see `Metrics.phase`.
+The report is a JSON document meant to be charted over time.
+"""
+
+import contextlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+METRICS_VERSION = 1
+
+# Path segments followed by parameters and the placeholders replacing them
+ENDPOINT_PARAMS = {
+    "repos": ("{owner}", "{repo}"),
+    "orgs": ("{org}",),
+    "organizations": ("{org_id}",),
+    "team": ("{team_id}",),
+    "teams": ("{team}",),
+    "users": ("{user}",),
+    "members": ("{user}",),
+    "memberships": ("{user}",),
+    "collaborators": ("{user}",),
+    "invitations": ("{invitation}",),
+    "branches": ("{branch}",),
+    "commits": ("{sha}",),
+    "trees": ("{sha}",),
+    "blobs": ("{sha}",),
+}
+# Path segments followed by a parameter which can contain slashes
+ENDPOINT_PATH_PARAMS = {
+    "ref": "{ref}",
+    "refs": "{ref}",
+    "contents": "{path}",
+}
+
+
+def endpoint_template(url):
+    """Return the path of `url` w/ parameters replaced by placeholders.
+
+    Eg: `https://api.github.com/repos/OCA/web/branches/16.0`
+    becomes `/repos/{owner}/{repo}/branches/{branch}`.
+    """
+    path = urlsplit(url).path
+    if path.startswith("/api/v3/"):
+        # GitHub Enterprise
+        path = path[len("/api/v3") :]
+    segments = [x for x in path.split("/") if x]
+    result = []
+    i = 0
+    while i < len(segments):
+        segment = segments[i]
+        result.append(segment)
+        i += 1
+        if segment in ENDPOINT_PATH_PARAMS and i < len(segments):
+            result.append(ENDPOINT_PATH_PARAMS[segment])
+            break
+        for placeholder in ENDPOINT_PARAMS.get(segment, ()):
+            if i >= len(segments):
+                break
+            result.append(placeholder)
+            i += 1
+    return "/" + "/".join(result)
+
+
+class _Timing:
+    """Amount, total and max duration of something."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.max_time = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "time": round(self.time, 6),
+            "max_time": round(self.max_time, 6),
+        }
+
+
+class Metrics:
+    """Collect metrics of a command run by `command`."""
+
+    def __init__(self, command=None):
+        self.command = command
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # (method, endpoint): timing
+        self.requests = {}
+        # (method, endpoint): count
+        self.errors = {}
+        self.cached = {}
+        self.retries = 0
+        self.rate_limit = {}
+        self.phases = {}
+
+    def install(self, session):
+        """Count requests sent via `session`."""
+        session.hooks["response"].append(self._on_response)
+        return session
+
+    def _on_response(self, response, *args, **kw):
+        key = (response.request.method, endpoint_template(response.request.url))
+        retries = getattr(getattr(response.raw, "retries", None), "history", ())
+        with self._lock:
+            self.requests.setdefault(key, _Timing()).add(
+                response.elapsed.total_seconds()
+            )
+            if getattr(response, "from_cache", False):
+                self.cached[key] = self.cached.get(key, 0) + 1
+            if response.status_code >= 400:
+                self.errors[key] = self.errors.get(key, 0) + 1
+            self.retries += len(retries)
+            self._update_rate_limit(response.headers)
+        return response
+
+    def _update_rate_limit(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        remaining = int(remaining)
+        self.rate_limit["remaining"] = remaining
+        self.rate_limit["min_remaining"] = min(
+            remaining, self.rate_limit.get("min_remaining", remaining)
+        )
+        for name, header in (
+            ("limit", "X-RateLimit-Limit"),
+            ("reset", "X-RateLimit-Reset"),
+        ):
+            if headers.get(header) is not None:
+                self.rate_limit[name] = int(headers[header])
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the phase `name`. Phases run several times are summed up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.phases.setdefault(name, _Timing()).add(duration)
+
+    def report(self):
+        endpoints = []
+        with self._lock:
+            for key, timing in sorted(self.requests.items()):
+                endpoints.append(
+                    dict(
+                        method=key[0],
+                        endpoint=key[1],
+                        errors=self.errors.get(key, 0),
+                        cached=self.cached.get(key, 0),
+                        **timing.to_dict(),
+                    )
+                )
+            return {
+                "version": METRICS_VERSION,
+                "command": self.command,
+                "started_at": self.started_at.isoformat(),
+                "duration": round(time.perf_counter() - self._start, 6),
+                "requests": {
+                    "total": sum(x["count"] for x in endpoints),
+                    "errors": sum(self.errors.values()),
+                    "cached": sum(self.cached.values()),
+                    "retries": self.retries,
+                    "time": round(sum(x["time"] for x in endpoints), 6),
+                    "endpoints": endpoints,
+                },
+                "rate_limit": dict(self.rate_limit),
+                "phases": {
+                    name: timing.to_dict() for name, timing in self.phases.items()
+                },
+            }
+
+    def write(self, path):
+        """Write the report as JSON to `path`."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w") as fd:
+            json.dump(self.report(), fd, indent=2)
@@ -0,0 +1,300 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Compute the operations needed to sync GitHub with the configuration."""
+
+# Estimated amount of API calls needed to apply each kind of operation
+API_CALLS = {
+    "create_team": 1,
+    "revoke_membership": 1,
+    "add_membership": 1,
+    "change_membership_role": 1,
+    "create_repo": 1,
+    "add_team_repo": 1,
+    "add_collaborator": 1,
+    "remove_collaborator": 1,
+    "cancel_invitation": 1,
+    # the push is done via git, only the current user is read
+    "create_branch": 1,
+    "set_default_branch": 1,
+}
+
+
+TEAM_OPERATIONS = (
+    "create_team",
+    "revoke_membership",
+    "add_membership",
+    "change_membership_role",
+)
+# Operations changing an existing team or repo, target being its slug/name
+TEAM_TARGET_OPERATIONS = (
+    "revoke_membership",
+    "add_membership",
+    "change_membership_role",
+    "add_team_repo",
+)
+REPO_TARGET_OPERATIONS = (
+    "add_collaborator",
+    "remove_collaborator",
+    "cancel_invitation",
+    "create_branch",
+    "set_default_branch",
+)
+
+
+class Operation:
+    """A single change to apply to GitHub.
+
+    `target` is the slug of the team or the name of the repository
+    the operation applies to.
+    `requires` holds the keys of the operations that must be applied before.
+    `entry` is the key of the conf entry the operation comes from.
+    """
+
+    def __init__(self, kind, target, requires=(), entry=None, **params):
+        self.kind = kind
+        self.target = target
+        self.entry = entry
+        self.params = params
+        self.requires = {x.key if isinstance(x, Operation) else x for x in requires}
+
+    @property
+    def unit(self):
+        """Operations of the same unit must be applied sequentially."""
+        if self.kind in TEAM_OPERATIONS:
+            return f"team:{self.target}"
+        if self.kind == "add_team_repo":
+            return f"repo:{self.params['repo']}"
+        if self.kind == "create_branch":
+            return f"branch:{self.target}:{self.params['branch']}"
+        return f"repo:{self.target}"
+
+    @property
+    def key(self):
+        """Unique identifier of the operation."""
+        return ":".join(
+            [self.kind, self.target] + [str(x) for x in self.params.values()]
+        )
+
+    def __str__(self):
+        params = " ".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{self.kind} {self.target} {params}".strip()
+
+    def __repr__(self):
+        return f"<Operation {self}>"
+
+
+class Plan:
+    """Ordered list of operations.
+
+    `costs` overrides the estimated API calls of each kind of operation.
+    `entries` holds the keys of the conf entries planned,
+    see `start_entry`.
+    """
+
+    def __init__(self, costs=None):
+        self.operations = []
+        self.costs = dict(API_CALLS, **(costs or {}))
+        self.entries = []
+
+    def start_entry(self, key):
+        """Next operations come from the conf entry `key`."""
+        self.entries.append(key)
+
+    def add(self, kind, target, requires=(), **params):
+        op = Operation(
+            kind,
+            target,
+            requires=[x for x in requires if x],
+            entry=self.entries[-1] if self.entries else None,
+            **params,
+        )
+        self.operations.append(op)
+        return op
+
+    def __iter__(self):
+        return iter(self.operations)
+
+    def __len__(self):
+        return len(self.operations)
+
+    @property
+    def api_calls(self):
+        return sum(self.costs[op.kind] for op in self.operations)
+
+    def render(self):
+        lines = [f"Plan: {len(self)} operations, ~{self.api_calls} API calls"]
+        lines.extend(f"  {op}" for op in self.operations)
+        return "\n".join(lines)
+
+
+class MembershipDiff:
+    """Changes needed to turn actual team memberships into desired ones.
+
+    `desired` and `current` map logins to their role in the team,
+    `pending` maps logins already invited to the team to their role
+    (None if unknown). Pending invitations are not sent again, unless
+    they are revoked or have the wrong role: those are sent again
+    w/ the right role (`reinvite`) once the previous ones are canceled.
+    """
+
+    def __init__(self, desired, current, pending=None):
+        pending = {
+            login: role
+            for login, role in (pending or {}).items()
+            if login not in current
+        }
+        self.remove = (set(current) | set(pending)) - set(desired)
+        self.add = {
+            login: role
+            for login, role in desired.items()
+            if login not in current and login not in pending
+        }
+        self.change_role = {
+            login: role
+            for login, role in desired.items()
+            if login in current and current[login] != role
+        }
+        self.reinvite = {
+            login: role
+            for login, role in desired.items()
+            if login in pending and pending[login] not in (None, role)
+        }
+
+
+class Planner:
+    """Compare the configuration w/ the actual state of the organization.
+
+    The actual state is read via `fetcher`, see `gh_state`.
+    The configuration is made of `conf_model` objects.
+    When `prune_collaborators` is enabled, direct collaborators
+    and invitations not matching repo's maintainers are removed.
+    """
+
+    def __init__(self, conf_global, fetcher, prune_collaborators=False):
+        self.conf_global = conf_global
+        self.fetcher = fetcher
+        self.prune_collaborators = prune_collaborators
+        # operations creating teams, by slug
+        self.new_teams = {}
+
+    def desired_roles(self, team):
+        """Map logins to their role in the team, according to `team` conf."""
+        roles = {}
+        for login in team.members + self.conf_global.maintainers:
+            roles[login] = "member"
+        for login in team.representatives:
+            roles[login] = "maintainer"
+        return roles
+
+    def plan_teams(self, plan, conf_psc):
+        # NOTE: membership operations belong to the same unit as team creation,
+        # no explicit dependency is needed.
+        for team, data in conf_psc.items():
+            plan.start_entry(f"psc/{team}")
+            team_state = self.fetcher.team(team, members=True)
+            if team_state is None:
+                self.new_teams[team] = plan.add("create_team", team)
+                diff = MembershipDiff(self.desired_roles(data), {})
+            else:
+                diff = MembershipDiff(
+                    self.desired_roles(data), team_state.roles, team_state.pending
+                )
+            for login in sorted(diff.remove):
+                plan.add("revoke_membership", team, user=login)
+            for login, role in diff.change_role.items():
+                plan.add("change_membership_role", team, user=login, role=role)
+            for login, role in diff.add.items():
+                plan.add("add_membership", team, user=login, role=role)
+            for login, role in diff.reinvite.items():
+                cancel_op = plan.add("revoke_membership", team, user=login)
+                plan.add(
+                    "add_membership",
+                    team,
+                    requires=[cancel_op],
+                    user=login,
+                    role=role,
+                )
+        return plan
+
+    def plan_repositories(self, plan, conf_repo):
+        """Add the operations syncing repos in `conf_repo` to `plan`."""
+        # repos each team has access to, read once per team of the synced repos
+        team_repos = {}
+        for team in sorted({data.psc for data in conf_repo.values() if data.psc}):
+            if team in self.new_teams:
+                continue
+            team_state = self.fetcher.team(team, repos=True)
+            team_repos[team] = team_state.repos if team_state is not None else {}
+        for repo, repo_data in conf_repo.items():
+            plan.start_entry(f"repo/{repo}")
+            repo_state = self.fetcher.repository(repo, branches=True)
+            create_op = None
+            if repo_state is None:
+                owner = self.conf_global.owner
+                create_op = plan.add(
+                    "create_repo", repo, requires=[self.new_teams.get(owner)]
+                )
+                for maintainer_team in self.conf_global.team_maintainers:
+                    plan.add(
+                        "add_team_repo",
+                        maintainer_team,
+                        requires=[create_op, self.new_teams.get(maintainer_team)],
+                        repo=repo,
+                        permission="admin",
+                    )
+                repo_branches = set()
+                default_branch = None
+            else:
+                repo_branches = repo_state.branches
+                default_branch = repo_state.default_branch
+            team = repo_data.psc
+            if repo not in team_repos.get(team, {}):
+                plan.add(
+                    "add_team_repo",
+                    team,
+                    requires=[create_op, self.new_teams.get(team)],
+                    repo=repo,
+                    permission="push",
+                )
+            self.plan_collaborators(plan, repo, repo_data, create_op=create_op)
+            branch_ops = {}
+            for branch in sorted(repo_data.branches):
+                if branch not in repo_branches:
+                    branch_ops[branch] = plan.add(
+                        "create_branch", repo, requires=[create_op], branch=branch
+                    )
+            branch = repo_data.default_branch
+            if branch and default_branch != branch:
+                plan.add(
+                    "set_default_branch",
+                    repo,
+                    requires=[create_op, branch_ops.get(branch)],
+                    branch=branch,
+                )
+        return plan
+
+    def plan_collaborators(self, plan, repo, repo_data, create_op=None):
+        # keep conf order, w/o duplicates
+        maintainers = list(dict.fromkeys(repo_data.maintainers))
+        collaborators = set()
+        invitations = {}
+        if create_op is None and (maintainers or self.prune_collaborators):
+            collaborators = self.fetcher.repository(
+                repo, collaborators=True
+            ).collaborators
+            missing = [x for x in maintainers if x not in collaborators]
+            if missing or self.prune_collaborators:
+                invitations = self.fetcher.repo_invitations(repo)
+        for login in maintainers:
+            if login not in collaborators and login not in invitations:
+                plan.add("add_collaborator", repo, requires=[create_op], user=login)
+        if not self.prune_collaborators:
+            return plan
+        for login in sorted(collaborators.difference(maintainers)):
+            plan.add("remove_collaborator", repo, user=login)
+        for login in sorted(set(invitations).difference(maintainers)):
+            plan.add(
+                "cancel_invitation", repo, user=login, invitation=invitations[login]
+            )
+        return plan
@@ -0,0 +1,221 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Render the new repo template once per version.
+
+The template is fetched once and pinned to the ref copier would use:
+its latest PEP 440 tag, its current commit if it has no tags. For each version
+it's rendered twice with different placeholder answers: files identical in
+both renders do not depend on the repo, the others must be reproducible by
+replacing placeholders with actual values. Each repo then gets a copy of the
+render with its own values. If a template transforms answers (eg: filters
+on them) renders do not match and the template is rendered for each repo,
+like without cache. Conditions comparing answers to a value
+(eg: `{% if repo_slug == "x" %}`) render identically for both placeholders
+and are NOT detected: templates must not depend on specific repos.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+import copier
+from packaging.version import InvalidVersion, Version
+
+_logger = logging.getLogger(__name__)
+
+# Answers depending on the repo
+REPO_ANSWERS = ("repo_name", "repo_slug", "repo_description")
+
+
+def _placeholders(variant):
+    return {key: f"oca-tpl-placeholder-{variant}-{key}" for key in REPO_ANSWERS}
+
+
+class TemplateCache:
+    """Render copier template `template` reusing renders of the same version."""
+
+    def __init__(self, template):
+        self.template = template
+        self._work_dir = tempfile.TemporaryDirectory(prefix="oca-template-")
+        self.work_dir = Path(self._work_dir.name)
+        self._src_path = None
+        self._vcs_ref = None
+        # version: list of (path, templated) or None when not cacheable
+        self._versions = {}
+
+    def _resolve(self):
+        """Fetch the template once and pin it to the ref copier would use."""
+        if self._src_path is not None:
+            return
+        url = self.template
+        if url.startswith("git+"):
+            url = url[len("git+") :]
+        if os.path.isdir(url) and not os.path.isdir(os.path.join(url, ".git")):
+            # local template, not versioned
+            self._src_path = url
+            return
+        clone_dir = self.work_dir / "template"
+        subprocess.run(
+            ["git", "clone", "--quiet", url, clone_dir.as_posix()],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        self._vcs_ref = self._latest_tag(clone_dir)
+        if self._vcs_ref is None:
+            self._vcs_ref = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=clone_dir, universal_newlines=True
+            ).strip()
+        self._src_path = clone_dir.as_posix()
+        _logger.info("Template %s pinned at %s", self.template, self._vcs_ref)
+
+    def _latest_tag(self, clone_dir):
+        """Return the latest tag of the clone as copier sorts them, if any.
+
+        Tags that are not PEP 440 versions and prereleases are ignored.
+        """
+        tags = subprocess.check_output(
+            ["git", "tag", "--list"], cwd=clone_dir, universal_newlines=True
+        ).split()
+        versions = {}
+        for tag in tags:
+            try:
+                version = Version(tag)
+            except InvalidVersion:
+                continue
+            if not version.is_prerelease:
+                versions[tag] = version
+        if not versions:
+            return None
+        return max(versions, key=versions.get)
+
+    def _run_copy(self, dest_dir, data):
+        copier.run_copy(
+            self._src_path,
+            dest_dir,
+            defaults=True,
+            unsafe=True,
+            vcs_ref=self._vcs_ref,
+            data=data,
+        )
+
+    def render(self, dest_dir, data):
+        """Render the template in `dest_dir` w/ answers `data`."""
+        self._resolve()
+        version = data["odoo_version"]
+        if version not in self._versions:
+            self._versions[version] = self._render_version(version, data)
+        files = self._versions[version]
+        # the local clone must not leak in copier answers
+        values = {self._src_path: self.template}
+        if files is None:
+            self._run_copy(dest_dir, data)
+            self._replace_in_tree(Path(dest_dir), values)
+            return
+        placeholders = _placeholders("a")
+        values.update({placeholders[key]: str(data[key]) for key in REPO_ANSWERS})
+        src_root = self.work_dir / version / "a"
+        dest_root = Path(dest_dir)
+        for rel_path, templated in files:
+            src = src_root / rel_path
+            dest = dest_root / self._replace(rel_path, values)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if src.is_symlink():
+                os.symlink(self._replace(os.readlink(src), values), dest)
+            elif templated:
+                dest.write_bytes(self._replace_bytes(src.read_bytes(), values))
+                shutil.copymode(src, dest)
+            else:
+                shutil.copy2(src, dest)
+
+    def _render_version(self, version, data):
+        """Render `version` and find out which files depend on the repo.
+
+        Return a list of (relative path, templated) or None
+        if the template can't be rendered once for all repos.
+        """
+        renders = {}
+        for variant in ("a", "b"):
+            render_dir = self.work_dir / version / variant
+            render_dir.mkdir(parents=True)
+            self._run_copy(render_dir.as_posix(), dict(data, **_placeholders(variant)))
+            renders[variant] = render_dir
+        a_to_b = {
+            _placeholders("a")[key]: _placeholders("b")[key] for key in REPO_ANSWERS
+        }
+        files_a = self._list_files(renders["a"])
+        files_b = self._list_files(renders["b"])
+        if sorted(self._replace(x, a_to_b) for x in files_a) != sorted(files_b):
+            _logger.info("Version %s: rendered files depend on the repo", version)
+            return None
+        files = []
+        for rel_path in files_a:
+            src_a = renders["a"] / rel_path
+            src_b = renders["b"] / self._replace(rel_path, a_to_b)
+            if src_a.is_symlink():
+                target_a = os.readlink(src_a)
+                if not src_b.is_symlink() or (
+                    self._replace(target_a, a_to_b) != os.readlink(src_b)
+                ):
+                    return None
+                files.append((rel_path, target_a != os.readlink(src_b)))
+                continue
+            content_a = src_a.read_bytes()
+            content_b = src_b.read_bytes()
+            if content_a == content_b:
+                files.append((rel_path, False))
+            elif self._replace_bytes(content_a, a_to_b) == content_b:
+                files.append((rel_path, True))
+            else:
+                _logger.info(
+                    "Version %s: %s can't be rendered once for all repos",
+                    version,
+                    rel_path,
+                )
+                return None
+        _logger.info(
+            "Version %s rendered: %s files, %s depending on the repo",
+            version,
+            len(files),
+            len([x for x in files if x[1]]),
+        )
+        return files
+
+    def _list_files(self, root):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in list(dirnames):
+                if os.path.islink(os.path.join(dirpath, name)):
+                    dirnames.remove(name)
+                    filenames.append(name)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                files.append(os.path.relpath(path, root))
+        return sorted(files)
+
+    def _replace(self, text, values):
+        for old, new in values.items():
+            text = text.replace(old, new)
+        return text
+
+    def _replace_bytes(self, content, values):
+        for old, new in values.items():
+            content = content.replace(old.encode(), new.encode())
+        return content
+
+    def _replace_in_tree(self, root, values):
+        for rel_path in self._list_files(root):
+            path = root / rel_path
+            if path.is_symlink():
+                continue
+            content = path.read_bytes()
+            new_content = self._replace_bytes(content, values)
+            if new_content != content:
+                path.write_bytes(new_content)
+
+    def cleanup(self):
+        self._work_dir.cleanup()
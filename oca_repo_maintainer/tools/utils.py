@@ -5,93 +5,264 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
 import hashlib
+import json
 import logging
+import os
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import yaml
 
+from .cache import DiskCache
+from .conf_model import build_model
+from .yaml_patch import patch_yaml
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:  # pragma: no cover - PyYAML built without libyaml
+    from yaml import SafeLoader as YamlLoader
+
 _logger = logging.getLogger(__name__)
 
+# Below this amount of files spawning worker processes costs more than parsing
+PARALLEL_THRESHOLD = 32
+# Bump this when the way conf is parsed changes, to invalidate cached conf
+LOADER_VERSION = f"1-{yaml.__version__}"
+
+
+def yaml_load(content):
+    """Parse YAML content using libyaml when available."""
+    return yaml.load(content, Loader=YamlLoader)
+
+
+def make_md5(content):
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def _current_umask():
+    # reading the umask means setting it: read it once
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Mode of new files, like `open` would create them
+NEW_FILE_MODE = 0o666 & ~_current_umask()
+
+
+def write_if_changed(content, path):
+    """Write `content` to `path` atomically, unless it's already there.
 
-class SmartDict(dict):
-    """Dotted notation dict."""
+    The mode of an existing file is kept.
+    Return True if the file has been written.
+    """
+    data = content.encode()
+    mode = NEW_FILE_MODE
+    try:
+        with path.open("rb") as fd:
+            if hashlib.md5(fd.read()).digest() == hashlib.md5(data).digest():
+                return False
+            mode = os.fstat(fd.fileno()).st_mode
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        # temp files are only readable by their owner
+        os.chmod(tmp_path, stat.S_IMODE(mode))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
 
-    def __getattr__(self, attrib):
-        val = self.get(attrib)
-        return self.__class__(val) if type(val) is dict else val
+
+def dump_conf(conf):
+    """Serialize `conf` from scratch."""
+    # at least keep the quotes consistent, you silly pyyaml
+    return yaml.dump(conf).replace(*"'", *'"')
+
+
+def render_conf(content, conf):
+    """Return the new content of a conf file holding `content` for `conf`.
+
+    The original layout is preserved when possible.
+    """
+    if content:
+        new_content = patch_yaml(content, conf, loader=YamlLoader)
+        if new_content is not None:
+            return new_content
+    return dump_conf(conf)
 
 
 class ConfLoader:
-    def __init__(self, conf_dir):
+    def __init__(self, conf_dir, max_workers=None, cache_dir=None):
         self.conf_dir = Path(conf_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = DiskCache(cache_dir, "conf", LOADER_VERSION) if cache_dir else None
+        self._conf_files = None
+        # all entries by conf name, see `full_conf`
+        self._full_conf = {}
+        self._loaded_keys = set()
         self.checksum = self._load_checksum()
 
     def _load_checksum(self):
         return self.load_conf("checksum", checksum=False)
 
     def load_conf(self, name, checksum=True, by_filepath=False):
+        """Load the conf for `name`.
+
+        When `checksum` is enabled only the entries (teams, repos...)
+        that changed since the last saved checksum are returned:
+        the full conf stays available via `full_conf`.
+        """
         conf = {}
-        path = self.conf_dir / name
-        filepath = path.with_suffix(".yml")
-        if filepath.exists():
-            # direct yml files
-            data = self._load_conf_from_file(filepath, checksum=checksum)
+        full_conf = self._full_conf.setdefault(name, {})
+        filepaths = self._conf_filepaths(name)
+        for filepath, data in zip(filepaths, self._load_conf_files(filepaths)):
+            full_conf.update(data)
+            if checksum:
+                data = self._changed_entries(name, data)
             if by_filepath:
                 conf[filepath] = data
             else:
                 conf.update(data)
-        else:
-            # folders containing ymls
-            for filepath in path.rglob("*.yml"):
-                data = self._load_conf_from_file(filepath, checksum=checksum)
-                if by_filepath:
-                    conf[filepath] = data
-                else:
-                    conf.update(data)
-        return SmartDict(conf)
+        if checksum:
+            self._prune_checksum(name)
+            _logger.info(
+                "%s: %s of %s entries changed",
+                name,
+                sum(len(x) for x in conf.values()) if by_filepath else len(conf),
+                len(full_conf),
+            )
+        return conf
 
-    def save_conf(self, filepath, conf):
-        # TODO Use ruamel.yaml to keep the original format of the file.
-        # Yet, is not critical for now, because the pre-commit conf
-        # on repo-maintainer-conf will take care of it.
-        # However, it would be nice to have it here too.
-        with filepath.open("w") as f:
-            # at least keep the quotes consistent, you silly pyyaml
-            txt = yaml.dump(conf).replace(*"'", *'"')
-            f.write(txt)
-
-    def _load_conf_from_file(self, filepath, checksum=True):
-        conf = {}
-        with filepath.open() as fd:
-            content = fd.read()
+    def load_model(self, name, checksum=True):
+        """Load the conf for `name` as model objects, see `conf_model`."""
+        return build_model(name, self.load_conf(name, checksum=checksum))
+
+    def _conf_filepaths(self, name):
+        """Return the files holding the conf for `name`.
+
+        Either a direct `name.yml` file or all the yml files
+        found in the `name` folder.
+        """
+        path = self.conf_dir / name
+        filepath = path.with_suffix(".yml")
+        if filepath.exists():
+            return [filepath]
+        # Filtering the full scan keeps the same order of `path.rglob`
+        return [x for x in self._scan_conf_dir() if path in x.parents]
+
+    def _scan_conf_dir(self):
+        """List all yml files in the conf dir, scanning it only once."""
+        if self._conf_files is None:
+            self._conf_files = list(self.conf_dir.rglob("*.yml"))
+        return self._conf_files
+
+    def _load_conf_files(self, filepaths):
+        """Load conf from given files, preserving their order."""
+        confs = []
+        to_parse = []
+        for filepath in filepaths:
+            conf = {}
+            confs.append(conf)
+            with filepath.open() as fd:
+                content = fd.read()
             if not content:
-                return conf
-            if checksum and self._file_changed(filepath, content):
-                conf.update(yaml.safe_load(content))
-                self._store_checksum(filepath, content)
-            elif not checksum:
-                conf.update(yaml.safe_load(content))
+                continue
+            md5 = self._make_md5(content)
+            data = self.cache.get(md5) if self.cache else None
+            if data is None:
+                to_parse.append((conf, md5, content))
             else:
-                _logger.info(
-                    "%s not changed: skipping", self._filepath_for_checksum(filepath)
+                conf.update(data)
+        parsed = self._parse_contents([x[2] for x in to_parse])
+        for (conf, md5, __), data in zip(to_parse, parsed):
+            conf.update(data)
+            if self.cache:
+                self.cache.set(md5, data)
+        return confs
+
+    def _parse_contents(self, contents):
+        workers = min(self.max_workers, len(contents))
+        if workers <= 1 or len(contents) < PARALLEL_THRESHOLD:
+            return list(map(yaml_load, contents))
+        chunksize = max(1, len(contents) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(yaml_load, contents, chunksize=chunksize))
+
+    def save_conf(self, filepath, conf):
+        return self.save_confs([(filepath, conf)])
+
+    def save_confs(self, confs):
+        """Save (filepath, conf) pairs.
+
+        Only changed values are rewritten, keeping the format of the files,
+        see `yaml_patch`. Files are written atomically and only if changed.
+        Return the paths of written files.
+        """
+        contents = []
+        for filepath, __ in confs:
+            try:
+                contents.append(filepath.read_text())
+            except FileNotFoundError:
+                contents.append("")
+        confs_data = [x[1] for x in confs]
+        workers = min(self.max_workers, len(confs))
+        if workers <= 1 or len(confs) < PARALLEL_THRESHOLD:
+            new_contents = list(map(render_conf, contents, confs_data))
+        else:
+            chunksize = max(1, len(confs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                new_contents = list(
+                    executor.map(render_conf, contents, confs_data, chunksize=chunksize)
                 )
-        return conf
+        written = []
+        for (filepath, __), content in zip(confs, new_contents):
+            if write_if_changed(content, filepath):
+                written.append(filepath)
+        return written
+
+    def _load_conf_from_file(self, filepath):
+        return self._load_conf_files([filepath])[0]
 
-    def _file_changed(self, filepath, content):
-        return self._make_md5(content) != self.checksum.get(
-            self._filepath_for_checksum(filepath)
-        )
+    def full_conf(self, name):
+        """Return all the entries of `name` loaded so far, changed or not."""
+        return dict(self._full_conf.get(name, {}))
+
+    def _changed_entries(self, name, data):
+        """Filter `data` keeping only entries changed since last checksum."""
+        changed = {}
+        for slug, entry in data.items():
+            key = self._entry_key(name, slug)
+            md5 = self._make_md5(json.dumps(entry, sort_keys=True, default=str))
+            self._loaded_keys.add(key)
+            if md5 == self.checksum.get(key):
+                _logger.debug("%s not changed: skipping", key)
+                continue
+            changed[slug] = entry
+            self.checksum[key] = md5
+        return changed
+
+    def _prune_checksum(self, name):
+        """Drop checksums of entries of `name` that do not exist anymore."""
+        prefix = f"{name}/"
+        for key in list(self.checksum):
+            if key.startswith(prefix) and key not in self._loaded_keys:
+                del self.checksum[key]
+
+    def _entry_key(self, name, slug):
+        return f"{name}/{slug}"
 
     def _make_md5(self, content):
-        return hashlib.md5(content.encode()).hexdigest()
+        return make_md5(content)
 
     def save_checksum(self):
         if self.checksum:
             with open(self.conf_dir / "checksum.yml", "w") as f:
                 yaml.dump(dict(self.checksum), f)
-
-    def _store_checksum(self, filepath, content):
-        self.checksum[self._filepath_for_checksum(filepath)] = self._make_md5(content)
-
-    def _filepath_for_checksum(self, filepath):
-        return filepath.relative_to(self.conf_dir).as_posix()
@@ -0,0 +1,207 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Check the configuration before using it.
+
+Each file is checked against the schema of its conf (global, psc, repo):
+results are cached by content, so that only changed files are parsed
+and checked again. Cross-references between files (eg: the team of a repo)
+are checked on the whole tree at each run.
+"""
+
+import logging
+
+import yaml
+
+from .cache import DiskCache
+from .utils import ConfLoader, make_md5, yaml_load
+
+_logger = logging.getLogger(__name__)
+
+# Bump this when checks change, to invalidate cached results
+VALIDATOR_VERSION = f"1-{yaml.__version__}"
+
+# Keys of each conf entry: required keys and their expected type
+STR = (str,)
+OPTIONAL_STR = (str, type(None))
+STR_LIST = "str_list"
+SCHEMAS = {
+    "global": {
+        "required": {},
+        "optional": {
+            "org": STR,
+            "owner": STR,
+            "template": STR,
+            "team_maintainers": STR_LIST,
+            "maintainers": STR_LIST,
+        },
+    },
+    "psc": {
+        "required": {
+            "name": STR,
+            "members": STR_LIST,
+            "representatives": STR_LIST,
+        },
+        "optional": {},
+    },
+    "repo": {
+        "required": {
+            "name": OPTIONAL_STR,
+            "psc": STR,
+            "branches": STR_LIST,
+        },
+        "optional": {
+            "description": OPTIONAL_STR,
+            "category": STR,
+            "psc_rep": STR,
+            "maintainers": STR_LIST,
+            "default_branch": STR,
+            "manual_branch_mgmt": (bool,),
+        },
+    },
+}
+
+
+class Problem:
+    """Something wrong in `filepath`, about conf `entry` if any."""
+
+    __slots__ = ("filepath", "entry", "message")
+
+    def __init__(self, filepath, entry, message):
+        self.filepath = filepath
+        self.entry = entry
+        self.message = message
+
+    def __str__(self):
+        if self.entry is None:
+            return f"{self.filepath}: {self.message}"
+        return f"{self.filepath}: {self.entry}: {self.message}"
+
+    def __repr__(self):
+        return f"<Problem {self}>"
+
+
+class ConfValidator:
+    """Validate the configuration stored in `conf_dir`."""
+
+    def __init__(self, conf_dir, cache_dir=None):
+        self.conf_loader = ConfLoader(conf_dir, cache_dir=cache_dir)
+        self.conf_dir = self.conf_loader.conf_dir
+        self.cache = (
+            DiskCache(cache_dir, "validate", VALIDATOR_VERSION) if cache_dir else None
+        )
+
+    def validate(self):
+        """Return the list of problems found in the whole configuration."""
+        problems = []
+        confs = {}
+        for name in SCHEMAS:
+            confs[name] = {}
+            # entry slug: relative path of the file defining it
+            sources = {}
+            for filepath in self.conf_loader._conf_filepaths(name):
+                rel_path = filepath.relative_to(self.conf_dir).as_posix()
+                data, file_problems = self._check_file(name, filepath, rel_path)
+                problems.extend(file_problems)
+                if name == "global":
+                    confs[name] = data
+                    continue
+                for slug, entry in data.items():
+                    if slug in sources:
+                        problems.append(
+                            Problem(
+                                rel_path, slug, f"already defined in {sources[slug]}"
+                            )
+                        )
+                        continue
+                    sources[slug] = rel_path
+                    confs[name][slug] = (rel_path, entry)
+        problems.extend(self._check_references(confs))
+        return sorted(problems, key=str)
+
+    def _check_file(self, name, filepath, rel_path):
+        """Return data and problems of the file.
+
+        Results are cached by content.
+        """
+        content = filepath.read_text()
+        key = f"{name}-{make_md5(content)}"
+        result = self.cache.get(key) if self.cache else None
+        if result is None:
+            result = self._check_content(name, content)
+            if self.cache:
+                self.cache.set(key, result)
+        data, messages = result
+        return data, [Problem(rel_path, entry, msg) for entry, msg in messages]
+
+    def _check_content(self, name, content):
+        """Return data and (entry, message) problems of `content`."""
+        try:
+            data = yaml_load(content) if content else {}
+        except yaml.YAMLError as err:
+            return {}, [(None, f"invalid YAML: {err}".replace("\n", " "))]
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            return {}, [(None, "must be a mapping")]
+        if name == "global":
+            return data, [(None, msg) for msg in self._check_entry(name, data)]
+        messages = []
+        valid = {}
+        for slug, entry in data.items():
+            if not isinstance(entry, dict):
+                messages.append((slug, "must be a mapping"))
+                continue
+            valid[slug] = entry
+            messages.extend((slug, msg) for msg in self._check_entry(name, entry))
+        return valid, messages
+
+    def _check_entry(self, name, entry):
+        schema = SCHEMAS[name]
+        messages = []
+        for key, expected in schema["required"].items():
+            if key not in entry:
+                messages.append(f"missing {key}")
+        for key, value in entry.items():
+            expected = schema["required"].get(key) or schema["optional"].get(key)
+            if expected is not None:
+                messages.extend(self._check_value(key, value, expected))
+        return messages
+
+    def _check_value(self, key, value, expected):
+        if expected == STR_LIST:
+            if not isinstance(value, list):
+                return [f"{key} must be a list"]
+            return [msg for x in value for msg in self._check_value(key, x, STR)]
+        if isinstance(value, expected):
+            return []
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if str in expected:
+                return [f"{key}: {value} must be quoted to be a string"]
+        return [f"{key}: invalid value {value!r}"]
+
+    def _check_references(self, confs):
+        problems = []
+        # w/o psc conf, teams are not managed: nothing to check
+        teams = confs["psc"]
+        for slug, (rel_path, entry) in confs["repo"].items():
+            for key in ("psc", "psc_rep"):
+                team = entry.get(key)
+                if teams and isinstance(team, str) and team not in teams:
+                    problems.append(Problem(rel_path, slug, f"unknown {key} {team}"))
+            branches = entry.get("branches")
+            default_branch = entry.get("default_branch")
+            if (
+                isinstance(branches, list)
+                and branches
+                and default_branch is not None
+                and default_branch not in branches
+            ):
+                problems.append(
+                    Problem(
+                        rel_path,
+                        slug,
+                        f"default_branch {default_branch} not in branches",
+                    )
+                )
+        return problems
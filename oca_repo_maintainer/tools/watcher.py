@@ -0,0 +1,105 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Watch conf files for changes.
+
+Filesystem notifications are used when `watchdog` is installed,
+otherwise conf files are polled.
+"""
+
+import logging
+import threading
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover
+    Observer = None
+
+_logger = logging.getLogger(__name__)
+
+# Seconds between two scans of the conf dir when polling
+POLL_INTERVAL = 0.5
+# Seconds to wait for more changes before notifying them: editors
+# often write files in several steps
+SETTLE_DELAY = 0.1
+
+
+class ConfWatcher:
+    """Notify changes of yml files in `conf_dir`."""
+
+    def __init__(self, conf_dir, interval=None, use_notifications=None):
+        self.conf_dir = Path(conf_dir)
+        self.interval = interval or POLL_INTERVAL
+        if use_notifications is None:
+            use_notifications = Observer is not None
+        self.use_notifications = use_notifications
+
+    def changes(self, stop=None):
+        """Yield the set of changed files each time the conf changes.
+
+        Stop when the `stop` event is set.
+        """
+        stop = stop or threading.Event()
+        if self.use_notifications:
+            yield from self._notified_changes(stop)
+        else:
+            yield from self._polled_changes(stop)
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in self.conf_dir.rglob("*.yml"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path.as_posix()] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _polled_changes(self, stop):
+        _logger.info("Polling %s for changes", self.conf_dir)
+        previous = self._snapshot()
+        while not stop.wait(self.interval):
+            current = self._snapshot()
+            changed = {
+                path
+                for path in set(previous) | set(current)
+                if previous.get(path) != current.get(path)
+            }
+            previous = current
+            if changed:
+                yield changed
+
+    def _notified_changes(self, stop):
+        _logger.info("Watching %s for changes", self.conf_dir)
+        changed = set()
+        lock = threading.Lock()
+        event = threading.Event()
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, fs_event):
+                paths = [fs_event.src_path, getattr(fs_event, "dest_path", "")]
+                paths = {x for x in paths if str(x).endswith(".yml")}
+                if not paths:
+                    return
+                with lock:
+                    changed.update(paths)
+                event.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), self.conf_dir.as_posix(), recursive=True)
+        observer.start()
+        try:
+            while not stop.is_set():
+                if not event.wait(self.interval):
+                    continue
+                stop.wait(SETTLE_DELAY)
+                with lock:
+                    event.clear()
+                    paths = set(changed)
+                    changed.clear()
+                yield paths
+        finally:
+            observer.stop()
+            observer.join()
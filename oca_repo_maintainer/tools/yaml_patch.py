@@ -0,0 +1,245 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+"""Apply changes to YAML documents preserving their layout.
+
+Instead of dumping the whole data again, the nodes of the original
+document are compared w/ the new data and only the text of changed values
+is replaced: comments, quotes, indentation and key order are kept.
+Supported changes are new scalar values, items appended to or removed
+from sequences and keys added to or removed from mappings, which is what
+conf tools do. Other changes are not patched.
+"""
+
+import json
+
+import yaml
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+
+
+class Unsupported(Exception):
+    """The change can't be applied by patching the document."""
+
+
+class _Dumper(yaml.SafeDumper):
+    """Dump block sequences indented under their key."""
+
+    indentless_sequences = False
+
+    def increase_indent(self, flow=False, indentless=False):
+        return super().increase_indent(flow, indentless and self.indentless_sequences)
+
+
+class _IndentlessDumper(_Dumper):
+    """Dump block sequences at the column of their key."""
+
+    indentless_sequences = True
+
+
+def patch_yaml(content, data, loader=yaml.SafeLoader):
+    """Return `content` changed to hold `data`.
+
+    Return None if changes are not supported.
+    """
+    node = yaml.compose(content, Loader=loader)
+    if node is None:
+        return None
+    old = yaml.load(content, Loader=loader)
+    edits = []
+    try:
+        _diff(node, old, data, edits, content)
+    except Unsupported:
+        return None
+    edits.sort()
+    if any(b[0] < a[1] for a, b in zip(edits, edits[1:])):
+        return None
+    for start, end, text in reversed(edits):
+        content = content[:start] + text + content[end:]
+    # never write something that would not load the same data
+    if yaml.load(content, Loader=loader) != data:
+        return None
+    return content
+
+
+def _diff(node, old, new, edits, content):
+    if old == new and type(old) is type(new):
+        return
+    if isinstance(node, ScalarNode):
+        if isinstance(new, (dict, list)):
+            raise Unsupported()
+        edits.append(
+            (node.start_mark.index, node.end_mark.index, format_scalar(new, node.style))
+        )
+    elif isinstance(node, MappingNode):
+        if not isinstance(new, dict) or len(node.value) != len(old):
+            raise Unsupported()
+        kept = [key for key in old if key in new]
+        if kept != [key for key in new if key in old]:
+            # moved keys
+            raise Unsupported()
+        # w/o duplicated keys, nodes follow the order of parsed keys
+        last_kept = None
+        for (key_node, value_node), key in zip(node.value, old):
+            if key in new:
+                _diff(value_node, old[key], new[key], edits, content)
+                last_kept = value_node
+            else:
+                edits.append(_entry_range(key_node, value_node, content) + ("",))
+        added = {key: value for key, value in new.items() if key not in old}
+        if added:
+            _insert(node, last_kept, added, edits, content)
+    elif isinstance(node, SequenceNode):
+        if not isinstance(new, list) or len(node.value) != len(old):
+            raise Unsupported()
+        if len(new) < len(old):
+            _remove(node, old, new, edits, content)
+            return
+        for item_node, old_item, new_item in zip(node.value, old, new):
+            _diff(item_node, old_item, new_item, edits, content)
+        if len(new) > len(old):
+            _append(node, new[len(old) :], edits, content)
+    else:
+        raise Unsupported()
+
+
+def _last_leaf(node):
+    """Return the last scalar or flow node of block `node`."""
+    while not isinstance(node, ScalarNode) and not node.flow_style and node.value:
+        node = node.value[-1]
+        if isinstance(node, tuple):
+            # mapping item
+            node = node[1]
+    return node
+
+
+def _line_end(content, index):
+    end = content.find("\n", index)
+    return len(content) if end == -1 else end
+
+
+def _entry_range(start_node, last_node, content, indicator=""):
+    """Return (start, end) of the lines from `start_node` to `last_node`.
+
+    Only `indicator` can precede `start_node` on its line.
+    """
+    start = content.rfind("\n", 0, start_node.start_mark.index) + 1
+    if content[start : start_node.start_mark.index].strip() != indicator:
+        raise Unsupported()
+    end = _line_end(content, _last_leaf(last_node).end_mark.index)
+    return start, min(end + 1, len(content))
+
+
+def _remove(node, old, new, edits, content):
+    """Remove the items of `old` missing from `new`, if they are all kept in order."""
+    removed = []
+    pos = 0
+    for item_node, item in zip(node.value, old):
+        if pos < len(new) and new[pos] == item and type(new[pos]) is type(item):
+            pos += 1
+        else:
+            removed.append(item_node)
+    if pos != len(new):
+        raise Unsupported()
+    if node.flow_style:
+        kept = [x for x in node.value if x not in removed]
+        text = ", ".join(content[x.start_mark.index : x.end_mark.index] for x in kept)
+        edits.append((node.start_mark.index, node.end_mark.index, f"[{text}]"))
+        return
+    if not new:
+        # `key:` alone would load as None
+        raise Unsupported()
+    for item_node in removed:
+        edits.append(_entry_range(item_node, item_node, content, "-") + ("",))
+
+
+def _indentless_sequences(node):
+    """Return True if block sequences of `node` are not indented under their key."""
+    nodes = [node]
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, MappingNode):
+            for key_node, value_node in node.value:
+                if isinstance(value_node, SequenceNode) and not value_node.flow_style:
+                    return value_node.start_mark.column == key_node.start_mark.column
+                nodes.append(value_node)
+        elif isinstance(node, SequenceNode):
+            nodes.extend(node.value)
+    return False
+
+
+def _insert(node, last_kept, values, edits, content):
+    """Add `values` to block mapping `node`, after the value `last_kept`."""
+    if node.flow_style or last_kept is None:
+        raise Unsupported()
+    indent = " " * node.value[0][0].start_mark.column
+    # sequences indented like the ones of the document
+    dumper = _Dumper
+    if _indentless_sequences(yaml.compose(content)):
+        dumper = _IndentlessDumper
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, (dict, list)) and value:
+            text = yaml.dump(
+                {key: value},
+                Dumper=dumper,
+                default_flow_style=False,
+                allow_unicode=True,
+                sort_keys=False,
+            ).replace("'", '"')
+        else:
+            text = f"{format_scalar(key)}: {format_value(value)}"
+        lines.extend(indent + x for x in text.splitlines())
+    end = _line_end(content, _last_leaf(last_kept).end_mark.index)
+    if end == len(content):
+        edits.append((end, end, "".join(f"\n{x}" for x in lines)))
+        return
+    # at the start of the next line: removed lines can't swallow the new ones
+    edits.append((end + 1, end + 1, "".join(f"{x}\n" for x in lines)))
+
+
+def _append(node, items, edits, content):
+    if any(isinstance(x, (dict, list)) for x in items):
+        raise Unsupported()
+    style = '"'
+    if node.value:
+        if not isinstance(node.value[-1], ScalarNode):
+            raise Unsupported()
+        # quote like the last item
+        style = node.value[-1].style
+    values = [format_scalar(x, style) for x in items]
+    if node.flow_style:
+        # eg: `[]` or `["16.0"]`
+        end = node.end_mark.index - 1
+        if content[end] != "]":
+            raise Unsupported()
+        prefix = ", " if node.value else ""
+        edits.append((end, end, prefix + ", ".join(values)))
+        return
+    indent = " " * node.start_mark.column
+    # after the last item, on its line: trailing comments stay where they are
+    end = _line_end(content, node.value[-1].end_mark.index)
+    edits.append((end, end, "".join(f"\n{indent}- {x}" for x in values)))
+
+
+def format_scalar(value, style=None):
+    """Return `value` formatted as a YAML scalar.
+
+    Strings keep the quote `style` of the value they replace when possible.
+    """
+    if isinstance(value, str):
+        if style == "'":
+            return "'{}'".format(value.replace("'", "''"))
+        if style is None and yaml.safe_load(value) == value and value.strip() == value:
+            if not any(x in value for x in ("#", ": ", "\n", '"', "'")):
+                return value
+        return json.dumps(value, ensure_ascii=False)
+    return yaml.safe_dump(value).splitlines()[0]
+
+
+def format_value(value):
+    """Return scalar or empty container `value` formatted as YAML."""
+    if isinstance(value, dict):
+        return "{}"
+    if isinstance(value, list):
+        return "[]"
+    return format_scalar(value)
@@ -7,16 +7,33 @@
 
 You must run this once to generate configuration files
 out of existing OCA repos.
+
+Teams are read at once via GraphQL w/ their members and repos, to know
+the teams of each repo w/o reading them repo by repo. Use `--jobs` to read
+branches w/ concurrent requests and `--incremental` to refresh existing
+conf files: only values owned by GitHub are updated and branches are read
+again only for repos pushed or updated since the last run.
 """
 import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-import github3
 import yaml
 
+from oca_repo_maintainer.cli.common import cache_options, metrics_options
+from oca_repo_maintainer.tools.gh_client import github_login
+from oca_repo_maintainer.tools.gh_state import GraphQLStateFetcher
+from oca_repo_maintainer.tools.utils import ConfLoader, write_if_changed
+
 TOKEN = os.getenv("GITHUB_TOKEN")
 
+# Repo timestamps of the last run, see `--incremental`
+STATE_FILENAME = "bootstrap.yml"
+IGNORED_REPOS = (".github", "repo-maintainer", "repo-maintainer-conf")
+IGNORED_TEAMS = ("oca-contributors", "oca-members")
+IGNORED_USERS = ("oca-travis", "oca-transbot", "OCA-git-bot")
+
 
 def safe_name(repo):
     name = repo.description or repo.name
@@ -30,85 +47,203 @@ def is_valid_branch(string):
         return False
 
 
-def prepare_psc(gh_org, conf_dir, whitelist=None):
+def read_all(func, items, jobs=1):
+    """Return `func` results for all `items`, w/ up to `jobs` concurrent calls."""
+    if jobs <= 1:
+        return [func(x) for x in items]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, items))
+
+
+def merge_conf(existing, entries, default_path, removed=(), refresh=(), defaults=()):
+    """Merge `entries` (slug: data) into `existing` confs (filepath: conf).
+
+    New entries are added to the file returned by `default_path(slug, data)`.
+    Existing ones are curated by hand: only `refresh` keys are updated
+    and `defaults` keys are set when missing. `removed` entries are dropped.
+    """
+    confs = {path: dict(conf) for path, conf in existing.items()}
+    where = {slug: path for path, conf in confs.items() for slug in conf}
+    for slug in removed:
+        if slug in where:
+            del confs[where.pop(slug)][slug]
+    for slug, data in entries.items():
+        if slug in where:
+            conf = confs[where[slug]]
+            entry = conf[slug] = dict(conf[slug])
+            for key in refresh:
+                entry[key] = data[key]
+            for key in defaults:
+                if entry.get(key) is None:
+                    entry[key] = data[key]
+        else:
+            confs.setdefault(default_path(slug, data), {})[slug] = data
+    return confs
+
+
+def save_confs(conf_dir, confs):
+    """Save `confs` (filepath: conf), removing files left w/o entries."""
+    loader = ConfLoader(conf_dir)
+    for filepath, conf in sorted(confs.items()):
+        if not conf and filepath.exists():
+            filepath.unlink()
+            print("Removed", filepath.as_posix())
+    confs = sorted((path, conf) for path, conf in confs.items() if conf)
+    for filepath in loader.save_confs(confs):
+        print("Written", filepath.as_posix())
+
+
+def read_teams_state(gh, gh_org, teams):
+    """Return the state of `teams`, w/ their members and repos, by slug.
+
+    All the teams are read at once, w/ both roles of their members.
+    """
+    fetcher = GraphQLStateFetcher(gh, gh_org)
+    return {x.slug: fetcher.team(x.slug, members=True, repos=True) for x in teams}
+
+
+def prepare_psc(teams, conf_dir, teams_state, whitelist=None, incremental=False):
     dest_dir = conf_dir / "psc"
-    if not dest_dir.exists():
-        os.makedirs(dest_dir.as_posix())
-    teams = gh_org.teams()
-    by_category = {}
+    all_slugs = {x.slug for x in teams}
+    teams = [
+        x
+        for x in teams
+        if not whitelist or any([x.slug.startswith(y) for y in whitelist])
+    ]
+    teams_data = {}
     for team in teams:
-        if team.slug in ["oca-contributors", "oca-members"]:
-            continue
-        if whitelist and not any([team.slug.startswith(x) for x in whitelist]):
-            continue
         print("Processing team", team.slug)
-        team_data = {"name": safe_name(team), "representatives": [], "members": []}
-        for member in team.members(role="member"):
-            if member.login in ["oca-travis", "oca-transbot", "OCA-git-bot"]:
-                continue
-            team_data["members"].append(member.login)
-        for member in team.members(role="maintainer"):
-            if member.login in ["oca-travis", "oca-transbot", "OCA-git-bot"]:
-                continue
-            team_data["representatives"].append(member.login)
+        state = teams_state[team.slug]
+        teams_data[team.slug] = {
+            "name": safe_name(team),
+            "representatives": sorted(state.maintainers.difference(IGNORED_USERS)),
+            "members": sorted(state.members.difference(IGNORED_USERS)),
+        }
+    existing = {}
+    if incremental:
+        existing = ConfLoader(conf_dir).load_conf(
+            "psc", checksum=False, by_filepath=True
+        )
+
+    def default_path(slug, data):
+        category_slug = slug.split("-")[0]
+        return dest_dir / f"{category_slug}.yml"
+
+    # teams gone from GitHub
+    removed = {slug for conf in existing.values() for slug in conf} - all_slugs
+    save_confs(
+        conf_dir,
+        merge_conf(
+            existing,
+            teams_data,
+            default_path,
+            removed,
+            refresh=("members", "representatives"),
+        ),
+    )
+
 
-        category_slug = team.slug.split("-")[0]
-        if category_slug not in by_category:
-            by_category[category_slug] = {}
-        by_category[category_slug][team.slug] = team_data
+def repo_teams(team_repos):
+    """Return team slugs of each repo."""
+    res = {}
+    for slug, repos in sorted(team_repos.items()):
+        for repo in repos:
+            res.setdefault(repo, []).append(slug)
+    return res
 
-    for category_slug, teams_data in by_category.items():
-        with open(dest_dir / f"{category_slug}.yml", "w") as f:
-            yaml.dump(teams_data, f)
 
+def repo_timestamps(repo):
+    data = repo.as_dict()
+    return {"pushed_at": data.get("pushed_at"), "updated_at": data.get("updated_at")}
 
-def prepare_repo(gh_org, conf_dir, whitelist=None):
+
+def prepare_repo(
+    gh_org, conf_dir, team_repos, whitelist=None, jobs=1, incremental=False
+):
     dest_dir = conf_dir / "repo"
-    if not dest_dir.exists():
-        os.makedirs(dest_dir.as_posix())
-    by_category = {}
+    state_path = conf_dir / STATE_FILENAME
+    teams_by_repo = repo_teams(team_repos)
     teams = []
-    for repo in sorted(gh_org.repositories(), key=lambda x: x.name):
-        if repo.name in (".github", "repo-maintainer", "repo-maintainer-conf"):
-            continue
-        if whitelist and not any([repo.name.startswith(x) for x in whitelist]):
-            continue
+    existing = {}
+    previous_state = {}
+    if incremental:
+        existing = ConfLoader(conf_dir).load_conf(
+            "repo", checksum=False, by_filepath=True
+        )
+        if state_path.exists():
+            previous_state = yaml.safe_load(state_path.read_text()) or {}
+    existing_branches = {
+        slug: data.get("branches")
+        for conf in existing.values()
+        for slug, data in conf.items()
+    }
+    all_repos = sorted(gh_org.repositories(), key=lambda x: x.name)
+    repos = [
+        repo
+        for repo in all_repos
+        if repo.name not in IGNORED_REPOS
+        and (not whitelist or any([repo.name.startswith(x) for x in whitelist]))
+    ]
+    state = dict(previous_state)
+    to_refresh = []
+    for repo in repos:
+        state[repo.name] = repo_timestamps(repo)
+        if (
+            existing_branches.get(repo.name) is None
+            or previous_state.get(repo.name) != state[repo.name]
+        ):
+            to_refresh.append(repo)
+
+    def read_branches(repo):
         print("Processing repo", repo.name)
+        return repo.name, [b.name for b in repo.branches() if is_valid_branch(b.name)]
+
+    branches = dict(read_all(read_branches, to_refresh, jobs=jobs))
+    repos_data = {}
+    for repo in repos:
         psc = "board"
         psc_rep = "board"
-        try:
-            for team in repo.teams():
-                if "core" in team.slug:
-                    continue
-                if "maintainers" in team.slug and "representative" not in team.slug:
-                    psc = team.slug
-                    teams.append(psc)
-                    continue
-                if "maintainers" in team.slug and "representative" in team.slug:
-                    psc_rep = team.slug
-                    teams.append(psc_rep)
-                    continue
-        except github3.exceptions.NotFoundError:
-            pass
-        name = safe_name(repo)
-        branches = [b.name for b in repo.branches() if is_valid_branch(b.name)]
+        for team in teams_by_repo.get(repo.name, []):
+            if "core" in team:
+                continue
+            if "maintainers" in team and "representative" not in team:
+                psc = team
+                teams.append(psc)
+                continue
+            if "maintainers" in team and "representative" in team:
+                psc_rep = team
+                teams.append(psc_rep)
+                continue
         category = repo.name.split("-")[0].capitalize()
-        category_slug = category.lower()
-        if category_slug not in by_category:
-            by_category[category_slug] = {}
-        by_category[category_slug][repo.name] = {
-            "name": name,
+        repos_data[repo.name] = {
+            "name": safe_name(repo),
             "category": category,
             "psc": psc,
             "psc_rep": psc_rep,
-            "branches": branches,
+            "branches": branches.get(repo.name, existing_branches.get(repo.name)),
             "default_branch": repo.default_branch,
         }
 
-    for category_slug, repos in by_category.items():
-        with open(dest_dir / f"{category_slug}.yml", "w") as f:
-            yaml.dump(repos, f)
+    def default_path(slug, data):
+        return dest_dir / f"{data['category'].lower()}.yml"
 
+    # repos gone from GitHub
+    removed = set(existing_branches).difference(x.name for x in all_repos)
+    save_confs(
+        conf_dir,
+        merge_conf(
+            existing,
+            repos_data,
+            default_path,
+            removed,
+            refresh=("branches",),
+            defaults=("default_branch",),
+        ),
+    )
+    for name in removed:
+        state.pop(name, None)
+    write_if_changed(yaml.safe_dump(state), state_path)
+    print(f"{len(to_refresh)} of {len(repos)} repos refreshed")
     return dict(teams=teams)
 
 
@@ -124,17 +259,58 @@ def prepare_repo(gh_org, conf_dir, whitelist=None):
     "--token", required=True, prompt="Your github token", envvar="GITHUB_TOKEN"
 )
 @click.option("--repo-whitelist", envvar="REPO_WHITELIST")
-def generate(conf_dir, org, token, repo_whitelist=None):
-    gh = github3.login(token=token)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="How many requests can be sent concurrently.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Update existing conf files, reading branches only of repos changed "
+    "since the last run.",
+)
+@cache_options
+@metrics_options
+def generate(
+    conf_dir,
+    org,
+    token,
+    repo_whitelist=None,
+    jobs=1,
+    incremental=False,
+    cache_dir=None,
+    metrics=None,
+):
+    gh = github_login(token, jobs=jobs, cache_dir=cache_dir, metrics=metrics)
     gh_org = gh.organization(org)
     conf_dir = pathlib.Path(conf_dir)
     if repo_whitelist:
         repo_whitelist = [x.strip() for x in repo_whitelist.split(",")]
-    repo_result = prepare_repo(gh_org, conf_dir, whitelist=repo_whitelist)
+    teams = [x for x in gh_org.teams() if x.slug not in IGNORED_TEAMS]
+    teams_state = read_teams_state(gh, gh_org, teams)
+    with metrics.phase("prepare_repo"):
+        repo_result = prepare_repo(
+            gh_org,
+            conf_dir,
+            {x.slug: sorted(teams_state[x.slug].repos) for x in teams},
+            whitelist=repo_whitelist,
+            jobs=jobs,
+            incremental=incremental,
+        )
     team_whitelist = None
     if repo_whitelist:
         team_whitelist = repo_result["teams"]
-    prepare_psc(gh_org, conf_dir, whitelist=team_whitelist)
+    with metrics.phase("prepare_psc"):
+        prepare_psc(
+            teams,
+            conf_dir,
+            teams_state,
+            whitelist=team_whitelist,
+            incremental=incremental,
+        )
 
 
 if __name__ == "__main__":
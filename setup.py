@@ -10,6 +10,7 @@ from setuptools import setup
 install_requires = [
     "copier",
     "github3.py",
+    "packaging",
     "PyYAML",
     "click",
     "sphinx",
@@ -38,7 +39,7 @@ setup(
     url="http://github.com/OCA/repo-maintainer",
     install_requires=install_requires,
     tests_require=tests_require,
-    extras_require={"test": tests_require},
+    extras_require={"test": tests_require, "watch": ["watchdog"]},
     # package_dir={"": ""},
     packages=[
         "oca_repo_maintainer",
@@ -62,7 +63,9 @@ setup(
         "console_scripts": [
             "oca-repo-manage = oca_repo_maintainer.cli.manage:manage",
             "oca-repo-add-branch = oca_repo_maintainer.cli.manage:add_branch",
+            "oca-repo-edit = oca_repo_maintainer.cli.manage:edit",
             "oca-repo-pages = oca_repo_maintainer.cli.pages:pages",
+            "oca-repo-validate = oca_repo_maintainer.cli.validate:validate",
         ]
     },
 )
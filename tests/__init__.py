@@ -1,2 +1,20 @@
 from . import test_manager
 from . import test_conf_file_manager
+from . import test_utils
+from . import test_cache
+from . import test_gh_state
+from . import test_executor
+from . import test_http_cache
+from . import test_template_cache
+from . import test_planner
+from . import test_journal
+from . import test_benchmarks
+from . import test_metrics
+from . import test_gh_pages
+from . import test_yaml_patch
+from . import test_conf_model
+from . import test_validator
+from . import test_conf_index
+from . import test_gh_registry
+from . import test_gh_client
+from . import test_bootstrap
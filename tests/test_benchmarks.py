@@ -0,0 +1,52 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import tempfile
+from unittest import TestCase
+
+from benchmarks.fake_github import FakeGitHub
+from benchmarks.run import run_benchmarks
+
+
+class TestBenchmarks(TestCase):
+    def _run(self, **kw):
+        with tempfile.TemporaryDirectory() as work_dir:
+            return {
+                x["tool"]: x
+                for x in run_benchmarks(
+                    work_dir, repos=4, branches=2, teams=3, drift=0.3, **kw
+                )
+            }
+
+    def _writes(self, endpoints):
+        return [
+            x for x in endpoints if not x.startswith("GET") and x != "POST /graphql"
+        ]
+
+    def test_run(self):
+        for state_backend in ("graphql", "rest"):
+            results = self._run(state_backend=state_backend)
+            self.assertEqual(
+                list(results), ["manage", "manage (in sync)", "pages", "add-branch"]
+            )
+            self.assertTrue(self._writes(results["manage"]["endpoints"]))
+            # the 1st run synced everything
+            self.assertFalse(self._writes(results["manage (in sync)"]["endpoints"]))
+            self.assertFalse(results["pages"]["requests"])
+
+    def test_jobs(self):
+        # state is read w/ concurrent requests
+        results = self._run(state_backend="rest", jobs=4)
+        self.assertTrue(self._writes(results["manage"]["endpoints"]))
+        self.assertFalse(self._writes(results["manage (in sync)"]["endpoints"]))
+
+    def test_rate_limit(self):
+        fake = FakeGitHub(rate_limit=1).start()
+        self.addCleanup(fake.stop)
+        status, headers, __ = fake.handle("GET", "/api/v3/orgs/OCA", {}, None)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["X-RateLimit-Remaining"], "0")
+        status, __, body = fake.handle("GET", "/api/v3/orgs/OCA", {}, None)
+        self.assertEqual(status, 403)
+        self.assertEqual(fake.reset_stats(), {"GET /orgs/{org}": 2})
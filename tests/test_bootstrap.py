@@ -0,0 +1,130 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import yaml
+from click.testing import CliRunner
+
+from benchmarks.fake_github import FakeGitHub, FakeOrg
+from benchmarks.run import fake_login
+from scripts.bootstrap_data import generate
+
+
+class TestBootstrap(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.org = FakeOrg()
+        self.org.add_team(
+            "web-maintainers",
+            members={"john": "member", "jane": "maintainer", "OCA-git-bot": "member"},
+            repos={"web": "push", "web-api": "push"},
+        )
+        self.org.add_team("web-maintainers-representative", repos={"web": "pull"})
+        self.org.add_team("oca-members", members={"john": "member"})
+        self.org.add_repo("web", default_branch="17.0", branches=["16.0", "17.0"])
+        self.org.add_repo("web-api", default_branch="17.0", branches=["17.0", "wip"])
+        self.org.add_repo("server-tools", default_branch="16.0", branches=["16.0"])
+        self.org.add_repo(".github", default_branch="main", branches=["main"])
+        self.fake = FakeGitHub(self.org).start()
+        self.addCleanup(self.fake.stop)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.conf_dir = Path(tmp_dir.name)
+
+    def _generate(self, *args):
+        with fake_login(self.fake):
+            result = CliRunner().invoke(
+                generate,
+                [
+                    "--org",
+                    "OCA",
+                    "--conf-dir",
+                    str(self.conf_dir),
+                    "--token",
+                    "TOKEN",
+                    "--no-cache",
+                    "--jobs",
+                    "4",
+                    *args,
+                ],
+            )
+        self.assertEqual(result.exit_code, 0, result.output)
+        return self.fake.reset_stats()
+
+    def _load(self, path):
+        return yaml.safe_load((self.conf_dir / path).read_text())
+
+    def test_generate(self):
+        stats = self._generate()
+        # teams are read at once instead of reading teams of each repo
+        self.assertNotIn("GET /repos/{org}/{repo}/teams", stats)
+        self.assertFalse([x for x in stats if x.endswith("/members")])
+        self.assertEqual(stats["POST /graphql"], 1)
+        self.assertEqual(stats["GET /repos/{org}/{repo}/branches"], 3)
+        web = self._load("repo/web.yml")
+        self.assertEqual(
+            web["web"],
+            {
+                "name": "Web",
+                "category": "Web",
+                "psc": "web-maintainers",
+                "psc_rep": "web-maintainers-representative",
+                "branches": ["16.0", "17.0"],
+                "default_branch": "17.0",
+            },
+        )
+        self.assertEqual(web["web-api"]["branches"], ["17.0"])
+        self.assertEqual(self._load("repo/server.yml")["server-tools"]["psc"], "board")
+        psc = self._load("psc/web.yml")
+        self.assertEqual(
+            psc["web-maintainers"],
+            {
+                "name": "Web Maintainers",
+                "members": ["john"],
+                "representatives": ["jane"],
+            },
+        )
+        self.assertFalse((self.conf_dir / "psc" / "oca.yml").exists())
+        self.assertIn("web", self._load("bootstrap.yml"))
+
+    def test_incremental(self):
+        self.org.add_team("server-maintainers", members={"john": "maintainer"})
+        self._generate()
+        web_path = self.conf_dir / "repo" / "web.yml"
+        web_path.write_text(
+            web_path.read_text()
+            .replace("web-api:\n", "web-api:\n  manual_branch_mgmt: true\n")
+            .replace("name: Web\n", "name: Web (curated)\n")
+            .replace("psc: web-maintainers\n", "psc: board\n")
+            .replace('  default_branch: "17.0"\n', "", 1)
+        )
+        psc_path = self.conf_dir / "psc" / "web.yml"
+        psc_path.write_text(psc_path.read_text().replace("Web Maintainers", "Web"))
+        self.org.teams["web-maintainers"].members["jim"] = "member"
+        del self.org.teams["server-maintainers"]
+        self.org.repos["web"].branches.add("18.0")
+        self.org.repos["web"].pushed_at = "2024-02-01T00:00:00Z"
+        self.org.repos["web-api"].branches.add("18.0")
+        del self.org.repos["server-tools"]
+        stats = self._generate("--incremental")
+        # only the pushed repo is read again
+        self.assertEqual(stats["GET /repos/{org}/{repo}/branches"], 1)
+        web = self._load("repo/web.yml")
+        self.assertEqual(web["web"]["branches"], ["16.0", "17.0", "18.0"])
+        # curated values are kept, missing ones are filled
+        self.assertEqual(web["web"]["name"], "Web (curated)")
+        self.assertEqual(web["web"]["psc"], "board")
+        self.assertEqual(web["web"]["default_branch"], "17.0")
+        psc = self._load("psc/web.yml")
+        self.assertEqual(psc["web-maintainers"]["name"], "Web")
+        self.assertEqual(psc["web-maintainers"]["members"], ["jim", "john"])
+        # gone from GitHub
+        self.assertFalse((self.conf_dir / "psc" / "server.yml").exists())
+        self.assertEqual(web["web-api"]["branches"], ["17.0"])
+        self.assertTrue(web["web-api"]["manual_branch_mgmt"])
+        self.assertFalse((self.conf_dir / "repo" / "server.yml").exists())
+        self.assertNotIn("server-tools", self._load("bootstrap.yml"))
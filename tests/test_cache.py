@@ -0,0 +1,76 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from oca_repo_maintainer.tools.cache import DiskCache
+
+
+class TestDiskCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_get_set(self):
+        cache = DiskCache(self.temp_dir.name, "test", "1")
+        self.assertIsNone(cache.get("foo"))
+        cache.set("foo", {"a": [1, 2]})
+        self.assertEqual(cache.get("foo"), {"a": [1, 2]})
+        # other versions do not see the value
+        self.assertIsNone(DiskCache(self.temp_dir.name, "test", "2").get("foo"))
+
+    def test_evict_lru(self):
+        cache = DiskCache(self.temp_dir.name, "test", "1")
+        for i, key in enumerate(("a", "b", "c")):
+            cache.set(key, "x" * 100)
+            # make access times deterministic
+            os.utime(cache._entry_path(key), (i, i))
+        cache.get("a")
+        cache.prune(max_size=cache.size() - 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_evict_other_versions(self):
+        DiskCache(self.temp_dir.name, "test", "1").set("a", "old")
+        cache = DiskCache(self.temp_dir.name, "test", "2")
+        cache.set("a", "new")
+        cache.prune()
+        self.assertEqual(len(cache._entries()), 1)
+        self.assertEqual(cache.get("a"), "new")
+
+    def test_size_overwrite(self):
+        cache = DiskCache(self.temp_dir.name, "test", "1")
+        cache.set("a", "x" * 100)
+        size = cache.size()
+        cache.set("a", "y" * 100)
+        self.assertEqual(cache.size(), size)
+        self.assertEqual(cache.size(), sum(x.stat().st_size for x in cache._entries()))
+
+    def test_prune_removed_entries(self):
+        cache = DiskCache(self.temp_dir.name, "test", "1")
+        cache.set("a", "x" * 100)
+        entries = cache._entries() + [cache._entry_path("gone")]
+        # entries dropped by another process meanwhile
+        with mock.patch.object(cache, "_entries", return_value=entries):
+            cache.prune(max_size=0)
+            cache._size = None
+            self.assertEqual(cache.size(), 0)
+        self.assertEqual(cache._entries(), [])
+
+    def test_concurrent(self):
+        cache = DiskCache(self.temp_dir.name, "test", "1", max_size=2000)
+
+        def work(i):
+            cache.set(str(i % 10), "x" * 100)
+            cache.get(str((i + 1) % 10))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(work, range(200)))
+        self.assertEqual(cache.size(), sum(x.stat().st_size for x in cache._entries()))
+        self.assertLessEqual(cache.size(), 2000)
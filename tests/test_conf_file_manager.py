@@ -2,11 +2,18 @@
 # @author: Simone Orsi
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
 
+import difflib
 import shutil
 import tempfile
-from unittest import TestCase
+from pathlib import Path
+from unittest import TestCase, mock
 
-from oca_repo_maintainer.tools.conf_file_manager import ConfFileManager
+import yaml
+from click.testing import CliRunner
+
+from oca_repo_maintainer.cli.manage import edit
+from oca_repo_maintainer.tools import utils
+from oca_repo_maintainer.tools.conf_file_manager import ConfFileManager, EditError
 
 from .common import conf_path, conf_path_with_tools
 
@@ -115,7 +122,8 @@ class TestManager(TestCase):
 
             manager.add_branch("100.0")
 
-            conf = manager.conf_loader.load_conf("repo")
+            # unchanged repos are not returned when checking checksums
+            conf = manager.conf_loader.load_conf("repo", checksum=False)
 
             self.assertEqual(
                 conf["test-repo-for-addons"]["branches"], ["16.0", "15.0", "100.0"]
@@ -127,3 +135,135 @@ class TestManager(TestCase):
             self.assertEqual(
                 conf["test-repo-for-addons-manual"]["default_branch"], "16.0"
             )
+
+    def test_add_branch_preserve_format(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(
+                conf_path_with_tools.as_posix(), temp_dir, dirs_exist_ok=True
+            )
+            filepath = Path(temp_dir) / "repo" / "repo_for_addons.yml"
+            original = filepath.read_text()
+            ConfFileManager(temp_dir).add_branch("100.0")
+            diff = list(
+                difflib.unified_diff(
+                    original.splitlines(), filepath.read_text().splitlines(), n=0
+                )
+            )
+            # only changed values are written, comments are preserved
+            self.assertEqual(
+                [x for x in diff if x[0] in "+-" and x[:3] not in ("+++", "---")],
+                [
+                    '-  default_branch: "16.0"',
+                    '+  default_branch: "100.0"',
+                    '+    - "100.0"',
+                ],
+            )
+            self.assertTrue(filepath.read_text().startswith("#"))
+
+    def test_remove_branch_preserve_format(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(
+                conf_path_with_tools.as_posix(), temp_dir, dirs_exist_ok=True
+            )
+            filepath = Path(temp_dir) / "repo" / "repo_for_addons.yml"
+            original = filepath.read_text()
+            manager = ConfFileManager(temp_dir)
+            manager.edit([{"action": "remove_branch", "branch": "15.0"}])
+            # only the line of the branch is removed
+            self.assertEqual(
+                filepath.read_text(), original.replace('    - "15.0"\n', "", 1)
+            )
+
+    def test_add_branch_parallel(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(conf_path.as_posix(), temp_dir, dirs_exist_ok=True)
+            repo_dir = Path(temp_dir) / "repo"
+            conf = {}
+            for i in range(4):
+                conf = {f"repo-{i}": {"branches": ["16.0"], "default_branch": "16.0"}}
+                (repo_dir / f"repo-{i}.yml").write_text(yaml.safe_dump(conf))
+            manager = ConfFileManager(temp_dir)
+            manager.conf_loader.max_workers = 2
+            with mock.patch.object(utils, "PARALLEL_THRESHOLD", 2):
+                manager.add_branch("100.0")
+            conf = manager.conf_loader.load_conf("repo", checksum=False)
+            for i in range(4):
+                self.assertEqual(conf[f"repo-{i}"]["branches"], ["16.0", "100.0"])
+
+    def test_edit(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(
+                conf_path_with_tools.as_posix(), temp_dir, dirs_exist_ok=True
+            )
+            manager = ConfFileManager(temp_dir)
+            with mock.patch.object(
+                manager.conf_loader,
+                "save_confs",
+                wraps=manager.conf_loader.save_confs,
+            ) as save_confs:
+                counts = manager.edit(
+                    [
+                        {"action": "add_branch", "branch": 17.0, "default": False},
+                        {"action": "set_default_branch", "branch": "17.0"},
+                        {"action": "remove_branch", "branch": "15.0"},
+                        {
+                            "action": "set_psc",
+                            "psc": "test-team-1",
+                            "repos": "test-repo-for-tools-1",
+                        },
+                    ]
+                )
+            # one save for all the files
+            save_confs.assert_called_once()
+            self.assertEqual(counts, [1, 1, 1, 1])
+            conf = manager.conf_loader.load_conf("repo", checksum=False)
+            self.assertEqual(conf["test-repo-for-addons"]["branches"], ["16.0", "17.0"])
+            self.assertEqual(conf["test-repo-for-addons"]["default_branch"], "17.0")
+            # manual_branch_mgmt
+            self.assertEqual(
+                conf["test-repo-for-addons-manual"]["branches"], ["16.0", "15.0"]
+            )
+            self.assertEqual(conf["test-repo-for-tools-1"]["psc"], "test-team-1")
+            self.assertEqual(conf["test-repo-for-tools-2"]["psc"], "test-team-2")
+
+    def test_edit_invalid(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(conf_path.as_posix(), temp_dir, dirs_exist_ok=True)
+            manager = ConfFileManager(temp_dir)
+            for operations, error in (
+                ([{"action": "drop_repo"}], "Invalid operation"),
+                ([{"action": "add_branch"}], "missing branch"),
+                ([{"action": "set_psc", "psc": "test-team-1"}], "filter repos"),
+                (
+                    [{"action": "set_psc", "psc": "nope", "repos": ["test-repo-1"]}],
+                    "unknown team",
+                ),
+            ):
+                with self.assertRaisesRegex(EditError, error):
+                    manager.edit(operations)
+
+    def test_edit_cli(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(conf_path.as_posix(), temp_dir, dirs_exist_ok=True)
+            batch_path = Path(temp_dir) / "batch.yml"
+            batch_path.write_text(
+                "- action: add_branch\n"
+                '  branch: "18.0"\n'
+                "  categories: [Logistics]\n"
+            )
+            result = CliRunner().invoke(
+                edit,
+                ["--conf-dir", temp_dir, "--batch", batch_path, "--no-cache"],
+            )
+            self.assertEqual(result.exit_code, 0, result.output)
+            conf = ConfFileManager(temp_dir).conf_loader.load_conf(
+                "repo", checksum=False
+            )
+            self.assertEqual(conf["test-repo-1"]["branches"], ["16.0", "15.0", "18.0"])
+            self.assertEqual(conf["test-repo-2"]["branches"], ["13.0", "12.0"])
+            batch_path.write_text("- action: nope\n")
+            result = CliRunner().invoke(
+                edit, ["--conf-dir", temp_dir, "--batch", batch_path, "--no-cache"]
+            )
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn("Invalid operation", result.output)
@@ -0,0 +1,97 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase
+
+from oca_repo_maintainer.tools.conf_index import ConfIndex
+from oca_repo_maintainer.tools.conf_model import build_model
+from oca_repo_maintainer.tools.utils import ConfLoader
+
+from .common import conf_path
+
+
+class TestConfIndex(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        loader = ConfLoader(conf_path)
+        conf_repo = loader.load_model("repo", checksum=False)
+        conf_repo.update(
+            build_model(
+                "repo",
+                {
+                    "test-repo-3": {
+                        "name": "Test repo 3",
+                        "psc": "test-team-1",
+                        "psc_rep": "test-team-2",
+                        "maintainers": ["etobella", "etobella"],
+                        "branches": [],
+                    }
+                },
+            )
+        )
+        cls.index = ConfIndex(loader.load_model("psc", checksum=False), conf_repo)
+
+    def test_repos(self):
+        self.assertEqual(
+            self.index.repos_by_psc,
+            {
+                "test-team-1": ["test-repo-1", "test-repo-3"],
+                "test-team-2": ["test-repo-2"],
+            },
+        )
+        self.assertEqual(self.index.repos_by_psc_rep, {"test-team-2": ["test-repo-3"]})
+        self.assertEqual(
+            self.index.repos_by_category,
+            {
+                "Logistics": ["test-repo-1"],
+                "Accounting": ["test-repo-2"],
+                None: ["test-repo-3"],
+            },
+        )
+        self.assertEqual(
+            self.index.repos_by_maintainer,
+            {"simahawk": ["test-repo-2"], "etobella": ["test-repo-3"]},
+        )
+
+    def test_teams(self):
+        self.assertEqual(self.index.team_name("test-team-1"), "Test team 1")
+        self.assertIsNone(self.index.team_name("unknown"))
+        self.assertEqual(
+            self.index.teams_by_member,
+            {"simahawk": ["test-team-1", "test-team-2"], "etobella": ["test-team-2"]},
+        )
+
+    def test_users(self):
+        self.assertEqual(self.index.users(), ["etobella", "simahawk"])
+        self.assertEqual(
+            self.index.user_roles("etobella"),
+            {
+                "maintains": ["test-repo-3"],
+                "member_of": ["test-team-2"],
+                "represents": ["test-team-2"],
+            },
+        )
+        self.assertEqual(
+            self.index.user_roles("unknown"),
+            {"maintains": [], "member_of": [], "represents": []},
+        )
+
+    def test_select_repos(self):
+        self.assertEqual(
+            self.index.select_repos(),
+            {"test-repo-1", "test-repo-2", "test-repo-3"},
+        )
+        self.assertEqual(
+            self.index.select_repos(categories=["Logistics", "Accounting"]),
+            {"test-repo-1", "test-repo-2"},
+        )
+        self.assertEqual(
+            self.index.select_repos(psc_in=["test-team-1"], categories=["Logistics"]),
+            {"test-repo-1"},
+        )
+        self.assertEqual(
+            self.index.select_repos(repos=["test-repo-2", "unknown"]),
+            {"test-repo-2"},
+        )
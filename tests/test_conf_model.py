@@ -0,0 +1,71 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase
+
+from oca_repo_maintainer.tools.conf_model import (
+    GlobalConf,
+    RepoConf,
+    TeamConf,
+    build_model,
+)
+from oca_repo_maintainer.tools.utils import ConfLoader
+
+from .common import conf_path
+
+
+class TestConfModel(TestCase):
+    def test_repo(self):
+        data = {
+            "name": "Test repo",
+            "psc": "test-team",
+            "branches": [16.0, "15.0"],
+            "default_branch": 16.0,
+            "custom": {"key": "value"},
+        }
+        repo = RepoConf.from_dict(data, slug="test-repo")
+        self.assertEqual(repo.slug, "test-repo")
+        self.assertEqual(repo.branches, ("16.0", "15.0"))
+        self.assertEqual(repo.default_branch, "16.0")
+        self.assertEqual(repo.maintainers, ())
+        self.assertIsNone(repo.category)
+        self.assertIsNone(repo.manual_branch_mgmt)
+        self.assertEqual(repo.extra, {"custom": {"key": "value"}})
+        self.assertEqual(
+            repo.to_dict(),
+            dict(
+                data, branches=["16.0", "15.0"], default_branch="16.0", maintainers=[]
+            ),
+        )
+        self.assertFalse(hasattr(repo, "__dict__"))
+        with self.assertRaises(AttributeError):
+            repo.unknown = True
+
+    def test_interning(self):
+        conf = build_model(
+            "psc",
+            {
+                "team-1": {"members": ["simahawk"]},
+                "team-2": {"representatives": ["".join(["sima", "hawk"])]},
+            },
+        )
+        self.assertIs(conf["team-1"].members[0], conf["team-2"].representatives[0])
+
+    def test_eq(self):
+        self.assertEqual(
+            TeamConf.from_dict({"name": "Team", "members": ["simahawk"]}, slug="t"),
+            TeamConf(slug="t", name="Team", members=("simahawk",)),
+        )
+        self.assertNotEqual(TeamConf(slug="t"), TeamConf(slug="t", name="Team"))
+        self.assertNotEqual(TeamConf(slug="t"), RepoConf(slug="t"))
+
+    def test_load_model(self):
+        loader = ConfLoader(conf_path)
+        conf_global = loader.load_model("global", checksum=False)
+        self.assertIsInstance(conf_global, GlobalConf)
+        self.assertEqual(conf_global.owner, "board")
+        self.assertEqual(conf_global.team_maintainers, ())
+        conf_repo = loader.load_model("repo", checksum=False)
+        self.assertEqual(sorted(conf_repo), ["test-repo-1", "test-repo-2"])
+        self.assertEqual(conf_repo["test-repo-1"].psc, "test-team-1")
@@ -0,0 +1,118 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import logging
+import threading
+import time
+from unittest import TestCase
+
+from oca_repo_maintainer.tools.executor import Executor
+from oca_repo_maintainer.tools.planner import Plan
+
+_logger = logging.getLogger(__name__)
+
+
+class TestExecutor(TestCase):
+    def _plan(self):
+        plan = Plan()
+        create_team = plan.add("create_team", "team-1")
+        plan.add("add_membership", "team-1", user="john", role="member")
+        create_repo = plan.add("create_repo", "repo-1")
+        plan.add(
+            "add_team_repo",
+            "team-1",
+            requires=[create_repo, create_team],
+            repo="repo-1",
+            permission="push",
+        )
+        branch_op = plan.add(
+            "create_branch", "repo-1", requires=[create_repo], branch="16.0"
+        )
+        plan.add("create_branch", "repo-1", requires=[create_repo], branch="15.0")
+        plan.add(
+            "set_default_branch",
+            "repo-1",
+            requires=[create_repo, branch_op],
+            branch="16.0",
+        )
+        return plan
+
+    def _run(self, plan, jobs, fail=None):
+        done = []
+        lock = threading.Lock()
+
+        def func(op):
+            # the slower the earlier: dependencies must hold anyway
+            time.sleep(0.01 * (len(plan) - plan.operations.index(op)) / len(plan))
+            if op.key == fail:
+                raise ValueError("Boom")
+            _logger.info("applied %s", op)
+            with lock:
+                done.append(op.key)
+
+        Executor(jobs=jobs).run(plan, func)
+        return done
+
+    def test_sequential(self):
+        plan = self._plan()
+        self.assertEqual(self._run(plan, 1), [op.key for op in plan])
+
+    def test_parallel_dependencies(self):
+        plan = self._plan()
+        done = self._run(plan, 4)
+        self.assertCountEqual(done, [op.key for op in plan])
+        for op in plan:
+            for required in op.requires:
+                self.assertLess(done.index(required), done.index(op.key))
+        # same unit, plan order
+        self.assertLess(
+            done.index("create_team:team-1"),
+            done.index("add_membership:team-1:john:member"),
+        )
+
+    def test_parallel_error(self):
+        plan = self._plan()
+        with self.assertRaisesRegex(ValueError, "Boom"):
+            self._run(plan, 4, fail="create_repo:repo-1")
+        done = self._run(plan, 4)
+        self.assertTrue(done)
+
+    def test_parallel_error_skip_dependents(self):
+        plan = self._plan()
+        done = []
+
+        def func(op):
+            if op.kind == "create_repo":
+                raise ValueError("Boom")
+            done.append(op.kind)
+
+        with self.assertRaises(ValueError):
+            Executor(jobs=4).run(plan, func)
+        self.assertNotIn("create_branch", done)
+        self.assertNotIn("add_team_repo", done)
+
+    def test_parallel_logs_by_unit(self):
+        plan = self._plan()
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        root = logging.getLogger()
+        root.addHandler(handler)
+        level = root.level
+        root.setLevel(logging.INFO)
+        try:
+            self._run(plan, 4)
+        finally:
+            root.removeHandler(handler)
+            root.setLevel(level)
+        units = []
+        for record in records:
+            if record.name != __name__:
+                continue
+            op_str = record.getMessage().split("applied ")[1]
+            op = next(x for x in plan if str(x) == op_str)
+            if not units or units[-1] != op.unit:
+                units.append(op.unit)
+        # each unit logs in one block, in plan order
+        self.assertEqual(units, list(dict.fromkeys(op.unit for op in plan)))
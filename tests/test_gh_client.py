@@ -0,0 +1,68 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import tempfile
+from unittest import TestCase
+
+from benchmarks.fake_github import FakeGitHub, FakeOrg
+from benchmarks.run import fake_login
+from oca_repo_maintainer.tools.gh_client import MIN_POOL_SIZE, github_login
+from oca_repo_maintainer.tools.gh_state import RestStateFetcher
+from oca_repo_maintainer.tools.http_cache import CachingHTTPAdapter
+from oca_repo_maintainer.tools.metrics import Metrics
+
+
+class TestGHClient(TestCase):
+    def setUp(self):
+        super().setUp()
+        org = FakeOrg()
+        for i in range(5):
+            org.add_team(f"team-{i}", members={"john": "member"})
+            org.add_repo(f"repo-{i}", branches=["16.0"], collaborators=["john"])
+        self.fake = FakeGitHub(org).start()
+        self.addCleanup(self.fake.stop)
+
+    def _login(self, **kw):
+        with fake_login(self.fake):
+            return github_login("TOKEN", **kw)
+
+    def test_login(self):
+        metrics = Metrics()
+        gh = self._login(jobs=32, metrics=metrics)
+        adapter = gh.session.get_adapter(self.fake.url)
+        self.assertEqual(adapter._pool_maxsize, 32)
+        gh.organization("OCA")
+        self.assertEqual(metrics.report()["requests"]["total"], 1)
+        gh = self._login()
+        self.assertEqual(
+            gh.session.get_adapter(self.fake.url)._pool_maxsize, MIN_POOL_SIZE
+        )
+        with tempfile.TemporaryDirectory() as cache_dir:
+            gh = self._login(jobs=16, cache_dir=cache_dir)
+            adapter = gh.session.get_adapter(self.fake.url)
+            self.assertIsInstance(adapter, CachingHTTPAdapter)
+            self.assertEqual(adapter._pool_maxsize, 16)
+
+    def test_prefetch(self):
+        gh = self._login(jobs=4)
+        fetcher = RestStateFetcher(gh, gh.organization("OCA"))
+        teams = [f"team-{i}" for i in range(5)]
+        repos = [f"repo-{i}" for i in range(5)]
+        fetcher.prefetch(
+            teams=teams,
+            team_repos=teams,
+            repos=repos + ["new-repo"],
+            collaborators=repos,
+            jobs=4,
+        )
+        self.fake.reset_stats()
+        for slug in teams:
+            team = fetcher.team(slug, members=True, repos=True)
+            self.assertEqual(team.members, {"john"})
+        for name in repos:
+            repo = fetcher.repository(name, branches=True, collaborators=True)
+            self.assertEqual(repo.branches, {"16.0"})
+            self.assertEqual(repo.collaborators, {"john"})
+        # everything was read already
+        self.assertEqual(self.fake.reset_stats(), {})
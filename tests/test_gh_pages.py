@@ -0,0 +1,197 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+import yaml
+
+from oca_repo_maintainer.tools import watcher
+from oca_repo_maintainer.tools.gh_pages import GHPageGenerator
+
+from .common import conf_path2
+
+
+class TestGHPages(TestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.conf_dir = Path(temp_dir.name) / "conf"
+        shutil.copytree(conf_path2, self.conf_dir)
+        self.page_dir = Path(temp_dir.name) / "docsource"
+
+    def _run(self, **kw):
+        GHPageGenerator(self.conf_dir.as_posix(), "OCA", self.page_dir, **kw).run()
+        return {x.name: x.read_text() for x in self.page_dir.iterdir()}
+
+    def _mtimes(self):
+        return {x.name: x.stat().st_mtime_ns for x in self.page_dir.iterdir()}
+
+    def test_pages(self):
+        pages = self._run()
+        self.assertEqual(
+            sorted(pages), ["accounting.rst", "logistics.rst", "repos.rst", "teams.rst"]
+        )
+        self.assertEqual(
+            pages["logistics.rst"],
+            "\n".join(
+                [
+                    "Logistics",
+                    "=========",
+                    "Test repo 1",
+                    "***********",
+                    "",
+                    "https://github.com/OCA/test-repo-1",
+                    "",
+                    "Team: `Test team 1 <teams.html#test-team-1>`_",
+                    "",
+                ]
+            ),
+        )
+        self.assertIn("   accounting.rst\n   logistics.rst\n", pages["repos.rst"])
+        self.assertEqual(self._run(jobs=4), pages)
+
+    def test_write_if_changed(self):
+        self._run()
+        # move pages back in time: a rewrite would change their mtime
+        for path in self.page_dir.iterdir():
+            os.utime(path, ns=(0, 0))
+        mtimes = self._mtimes()
+        self._run()
+        self.assertEqual(self._mtimes(), mtimes)
+        repo_file = self.conf_dir / "repo" / "repo2.yml"
+        conf = yaml.safe_load(repo_file.read_text())
+        conf["test-repo-2"]["maintainers"].append("etobella")
+        repo_file.write_text(yaml.safe_dump(conf))
+        pages = self._run()
+        self.assertIn("etobella", pages["accounting.rst"])
+        changed = [x for x, mtime in self._mtimes().items() if mtimes[x] != mtime]
+        self.assertEqual(changed, ["accounting.rst"])
+        self.assertEqual(
+            [x.name for x in self.page_dir.iterdir() if x.suffix == ".tmp"], []
+        )
+
+    def test_search_index(self):
+        pages = self._run(search_index=True)
+        index = json.loads(pages["search-index.json"])
+        self.assertEqual(index["org"], "OCA")
+        self.assertEqual(
+            index["categories"],
+            {"Accounting": ["test-repo-2"], "Logistics": ["test-repo-1"]},
+        )
+        self.assertEqual(
+            index["repos"]["test-repo-2"],
+            {
+                "name": "Repository 2",
+                "category": "Accounting",
+                "url": "https://github.com/OCA/test-repo-2",
+                "page": "accounting.html",
+                "maintainers": ["simahawk"],
+                "psc": "test-team-2",
+            },
+        )
+        self.assertEqual(
+            index["teams"]["test-team-2"],
+            {
+                "name": "Test team 2",
+                "members": ["simahawk", "etobella"],
+                "representatives": ["etobella"],
+                "repos": ["test-repo-2"],
+            },
+        )
+        self.assertEqual(
+            index["users"],
+            {
+                "simahawk": {
+                    "maintains": ["test-repo-2"],
+                    "member_of": ["test-team-1", "test-team-2"],
+                    "represents": ["test-team-1"],
+                },
+                "etobella": {
+                    "maintains": [],
+                    "member_of": ["test-team-2"],
+                    "represents": ["test-team-2"],
+                },
+            },
+        )
+        # compact
+        self.assertNotIn('", "', pages["search-index.json"])
+        self.assertNotIn('": ', pages["search-index.json"])
+
+    def _edit_conf(self, filename, slug, **values):
+        conf_file = self.conf_dir / filename
+        conf = yaml.safe_load(conf_file.read_text())
+        conf[slug].update(values)
+        conf_file.write_text(yaml.safe_dump(conf))
+
+    def test_incremental(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        kw = dict(cache_dir=temp_dir.name)
+        generator = GHPageGenerator(self.conf_dir, "OCA", self.page_dir, **kw)
+        generator.run()
+        self.assertEqual(len(generator.rebuilt), 4)
+        generator = GHPageGenerator(self.conf_dir, "OCA", self.page_dir, **kw)
+        generator.run()
+        self.assertEqual(generator.rebuilt, [])
+        # the name of a team is shown in the pages of its repos
+        self._edit_conf("psc/psc2.yml", "test-team-2", name="Team 2")
+        generator.load_conf()
+        generator.run()
+        self.assertEqual(sorted(generator.rebuilt), ["accounting.rst", "teams.rst"])
+        # a page removed by hand is built again
+        (self.page_dir / "logistics.rst").unlink()
+        generator.run()
+        self.assertEqual(generator.rebuilt, ["logistics.rst"])
+        # pages of categories w/o repos are removed
+        self._edit_conf("repo/repo1.yml", "test-repo-1", category="Accounting")
+        generator.load_conf()
+        generator.run()
+        self.assertEqual(sorted(generator.rebuilt), ["accounting.rst", "repos.rst"])
+        self.assertEqual(
+            sorted(x.name for x in self.page_dir.iterdir()),
+            ["accounting.rst", "repos.rst", "teams.rst"],
+        )
+
+    def test_watch(self):
+        self._test_watch(notifications=False)
+
+    @unittest.skipIf(watcher.Observer is None, "watchdog not installed")
+    def test_watch_notifications(self):
+        self._test_watch(notifications=True)
+
+    def _test_watch(self, notifications):
+        generator = GHPageGenerator(self.conf_dir, "OCA", self.page_dir)
+        stop = threading.Event()
+        rebuilt = []
+        run = generator.run
+
+        def run_and_notify():
+            run()
+            rebuilt.append(generator.rebuilt)
+            if len(rebuilt) == 2:
+                stop.set()
+
+        with mock.patch.object(generator, "run", run_and_notify), mock.patch.object(
+            watcher, "Observer", watcher.Observer if notifications else None
+        ):
+            thread = threading.Thread(
+                target=generator.watch, kwargs=dict(interval=0.05, stop=stop)
+            )
+            thread.start()
+            while not rebuilt:
+                time.sleep(0.01)
+            self._edit_conf("repo/repo2.yml", "test-repo-2", name="Repo 2")
+            thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(rebuilt[1], ["accounting.rst"])
+        self.assertIn("Repo 2", (self.page_dir / "accounting.rst").read_text())
@@ -0,0 +1,94 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase, mock
+
+import github3
+from github3.exceptions import NotFoundError
+
+from benchmarks.fake_github import FakeGitHub, FakeOrg
+from oca_repo_maintainer.tools.gh_registry import LISTING_THRESHOLD, GHRegistry
+from oca_repo_maintainer.tools.gh_state import RestStateFetcher
+from oca_repo_maintainer.tools.manager import RepoManager
+from oca_repo_maintainer.tools.planner import Plan
+
+from .common import conf_path
+
+
+class TestGHRegistry(TestCase):
+    def setUp(self):
+        super().setUp()
+        org = FakeOrg()
+        for i in range(LISTING_THRESHOLD + 5):
+            org.add_team(f"team-{i}")
+            org.add_repo(f"repo-{i}")
+        self.fake = FakeGitHub(org).start()
+        self.addCleanup(self.fake.stop)
+        gh = github3.GitHubEnterprise(self.fake.url, token="TOKEN")
+        self.registry = GHRegistry(gh, gh.organization("OCA"))
+        self.fake.reset_stats()
+
+    def test_identity(self):
+        gh_team = self.registry.team("team-1")
+        self.assertIs(self.registry.team("team-1"), gh_team)
+        gh_repo = self.registry.repository("repo-1")
+        self.assertIs(self.registry.repository("repo-1"), gh_repo)
+        # listed objects do not replace the ones already loaded
+        self.assertIs(self.registry.teams()["team-1"], gh_team)
+        self.assertIs(self.registry.repositories()["repo-1"], gh_repo)
+        self.assertIs(self.registry.me(), self.registry.me())
+        self.assertEqual(
+            self.fake.reset_stats(),
+            {
+                "GET /orgs/{org}/teams/{slug}": 1,
+                "GET /repos/{org}/{repo}": 1,
+                "GET /orgs/{org}/teams": 1,
+                "GET /orgs/{org}/repos": 1,
+                "GET /user": 1,
+            },
+        )
+        with self.assertRaises(NotFoundError):
+            self.registry.team("unknown")
+
+    def test_prefetch(self):
+        # few objects: loaded on demand
+        self.registry.prefetch(teams=["team-1"], repos=["repo-1"])
+        self.assertEqual(self.fake.reset_stats(), {})
+        teams = [f"team-{i}" for i in range(LISTING_THRESHOLD + 5)]
+        repos = [f"repo-{i}" for i in range(LISTING_THRESHOLD + 5)]
+        self.registry.prefetch(teams=teams, repos=repos)
+        for slug in teams:
+            self.registry.team(slug)
+        for name in repos:
+            self.registry.repository(name)
+        self.assertEqual(
+            self.fake.reset_stats(),
+            {"GET /orgs/{org}/teams": 1, "GET /orgs/{org}/repos": 1},
+        )
+
+    def test_fetcher(self):
+        fetcher = RestStateFetcher(
+            self.registry.gh, self.registry.gh_org, registry=self.registry
+        )
+        self.assertIs(fetcher.team("team-1").gh_team, self.registry.team("team-1"))
+        self.assertIs(
+            fetcher.repository("repo-1").gh_repo, self.registry.repository("repo-1")
+        )
+        self.assertIsNone(fetcher.team("unknown"))
+
+    def test_manager_prefetch(self):
+        manager = RepoManager(conf_path, "OCA", "TOKEN")
+        manager.registry = mock.Mock()
+        plan = Plan()
+        plan.add("create_team", "new-team")
+        plan.add("add_membership", "new-team", user="john", role="member")
+        plan.add("add_membership", "team-1", user="john", role="member")
+        plan.add("create_repo", "new-repo")
+        plan.add("add_team_repo", "team-2", repo="new-repo", permission="push")
+        plan.add("create_branch", "new-repo", branch="16.0")
+        plan.add("set_default_branch", "repo-1", branch="16.0")
+        manager._prefetch_gh_objects(list(plan))
+        manager.registry.prefetch.assert_called_once_with(
+            teams={"team-1", "team-2", manager.conf_global.owner}, repos={"repo-1"}
+        )
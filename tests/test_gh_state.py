@@ -0,0 +1,184 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase, mock
+
+from oca_repo_maintainer.tools import gh_state
+from oca_repo_maintainer.tools.gh_state import GraphQLError, GraphQLStateFetcher
+
+
+def _page(items, key="nodes", cursor=None):
+    return {
+        "pageInfo": {"hasNextPage": bool(cursor), "endCursor": cursor},
+        key: items,
+    }
+
+
+class TestGraphQLStateFetcher(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.gh = mock.Mock()
+        self.gh._build_url.return_value = "https://api.github.com/graphql"
+        self.gh_org = mock.Mock(login="OCA")
+        self.responses = {}
+        self.gh._post.side_effect = self._post
+
+    def _post(self, url, data=None):
+        key = (data["query"], data["variables"].get("after"))
+        response = mock.Mock()
+        response.json.return_value = {"data": {"organization": self.responses[key]}}
+        return response
+
+    def test_repositories(self):
+        query = gh_state.REPOSITORIES_QUERY
+        branches_query = gh_state.REPOSITORY_BRANCHES_QUERY
+        self.responses[(query, None)] = {
+            "repositories": _page(
+                [
+                    {
+                        "name": "repo-1",
+                        "defaultBranchRef": {"name": "16.0"},
+                        "refs": _page([{"name": "16.0"}], cursor="b1"),
+                        "collaborators": _page([{"login": "simahawk"}], cursor="c1"),
+                    }
+                ],
+                cursor="r1",
+            )
+        }
+        self.responses[(query, "r1")] = {
+            "repositories": _page(
+                [
+                    {
+                        "name": "repo-2",
+                        "defaultBranchRef": None,
+                        "refs": _page([]),
+                        "collaborators": None,
+                    }
+                ]
+            )
+        }
+        self.responses[(branches_query, "b1")] = {
+            "repository": {"refs": _page([{"name": "15.0"}])}
+        }
+        self.responses[(gh_state.REPOSITORY_COLLABORATORS_QUERY, "c1")] = {
+            "repository": {"collaborators": _page([{"login": "etobella"}])}
+        }
+        self.gh._iter.return_value = [mock.Mock(login="john")]
+        fetcher = GraphQLStateFetcher(self.gh, self.gh_org)
+        repos = fetcher.repositories()
+        self.assertEqual(sorted(repos), ["repo-1", "repo-2"])
+        self.assertEqual(repos["repo-1"].branches, {"16.0", "15.0"})
+        self.assertEqual(repos["repo-1"].default_branch, "16.0")
+        self.assertEqual(repos["repo-2"].branches, set())
+        self.assertIsNone(repos["repo-2"].default_branch)
+        self.assertEqual(repos["repo-1"].collaborators, {"simahawk", "etobella"})
+        # not readable via GraphQL
+        self.assertIsNone(repos["repo-2"].collaborators)
+        # loaded once
+        self.assertIs(fetcher.repository("repo-1", branches=True), repos["repo-1"])
+        self.assertEqual(self.gh._post.call_count, 4)
+        # REST fallback for collaborators
+        repo = fetcher.repository("repo-2", collaborators=True)
+        self.assertEqual(repo.collaborators, {"john"})
+        self.assertEqual(
+            self.gh._iter.call_args.kwargs["params"], {"affiliation": "direct"}
+        )
+
+    def test_teams(self):
+        query = gh_state.TEAMS_QUERY
+        members_query = gh_state.TEAM_MEMBERS_QUERY
+        self.responses[(query, None)] = {
+            "teams": _page(
+                [
+                    {
+                        "slug": "team-1",
+                        "members": _page(
+                            [
+                                {"role": "MEMBER", "node": {"login": "simahawk"}},
+                                {"role": "MAINTAINER", "node": {"login": "etobella"}},
+                            ],
+                            key="edges",
+                            cursor="m1",
+                        ),
+                        "repositories": _page(
+                            [{"permission": "WRITE", "node": {"name": "repo-1"}}],
+                            key="edges",
+                        ),
+                        "invitations": _page(
+                            [{"invitee": {"login": "jane"}}, {"invitee": None}]
+                        ),
+                    }
+                ]
+            )
+        }
+        self.responses[(members_query, "m1")] = {
+            "team": {
+                "members": _page(
+                    [{"role": "MEMBER", "node": {"login": "john"}}], key="edges"
+                )
+            }
+        }
+        gh_team = self.gh_org.team_by_name.return_value
+        gh_team.membership_for.return_value = {"role": "maintainer", "state": "pending"}
+        fetcher = GraphQLStateFetcher(self.gh, self.gh_org)
+        team = fetcher.team("team-1", members=True, repos=True)
+        self.assertEqual(team.members, {"simahawk", "john"})
+        self.assertEqual(team.maintainers, {"etobella"})
+        self.assertEqual(team.repos, {"repo-1": "push"})
+        # the role in the team is read from the pending membership
+        self.assertEqual(team.pending, {"jane": "maintainer"})
+        gh_team.membership_for.assert_called_once_with("jane")
+        self.assertIsNone(fetcher.team("team-2"))
+        self.assertEqual(self.gh._post.call_count, 2)
+
+    def test_errors(self):
+        response = mock.Mock()
+        response.json.return_value = {"errors": [{"message": "Boom"}]}
+        self.gh._post.side_effect = None
+        self.gh._post.return_value = response
+        fetcher = GraphQLStateFetcher(self.gh, self.gh_org)
+        with self.assertRaisesRegex(GraphQLError, "Boom"):
+            fetcher.repositories()
+
+    def test_errors_forbidden_collaborators(self):
+        response = mock.Mock()
+        response.json.return_value = {
+            "data": {
+                "organization": {
+                    "repositories": _page(
+                        [
+                            {
+                                "name": "repo-1",
+                                "defaultBranchRef": {"name": "16.0"},
+                                "refs": _page([{"name": "16.0"}]),
+                                "collaborators": None,
+                            }
+                        ]
+                    )
+                }
+            },
+            "errors": [
+                {
+                    "type": "FORBIDDEN",
+                    "path": [
+                        "organization",
+                        "repositories",
+                        "nodes",
+                        0,
+                        "collaborators",
+                    ],
+                    "message": "Must have push access to view repository collaborators.",
+                }
+            ],
+        }
+        self.gh._post.side_effect = None
+        self.gh._post.return_value = response
+        self.gh._iter.return_value = [mock.Mock(login="john")]
+        fetcher = GraphQLStateFetcher(self.gh, self.gh_org)
+        repos = fetcher.repositories()
+        self.assertEqual(repos["repo-1"].branches, {"16.0"})
+        self.assertIsNone(repos["repo-1"].collaborators)
+        # REST fallback for collaborators
+        repo = fetcher.repository("repo-1", collaborators=True)
+        self.assertEqual(repo.collaborators, {"john"})
@@ -0,0 +1,65 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+
+from oca_repo_maintainer.tools.http_cache import install_http_cache
+
+
+class TestHTTPCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.session = requests.Session()
+        self.cache = install_http_cache(self.session, temp_dir.name)
+        self.sent = []
+        patcher = mock.patch.object(HTTPAdapter, "send", self._send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _send(self, request, **kw):
+        self.sent.append(dict(request.headers))
+        response = Response()
+        response.url = request.url
+        response.request = request
+        if request.headers.get("If-None-Match") == '"v1"':
+            response.status_code = 304
+            response.headers["X-RateLimit-Remaining"] = "4999"
+            response._content = b""
+        else:
+            response.status_code = 200
+            response.headers["ETag"] = '"v1"'
+            response.headers["Content-Type"] = "application/json; charset=utf-8"
+            response.headers["X-RateLimit-Remaining"] = "4998"
+            response._content = b'{"name": "test-repo-1"}'
+        return response
+
+    def test_revalidate(self):
+        url = "https://api.github.com/repos/OCA/test-repo-1"
+        first = self.session.get(url)
+        self.assertEqual(first.json(), {"name": "test-repo-1"})
+        self.assertNotIn("If-None-Match", self.sent[0])
+        second = self.session.get(url)
+        self.assertEqual(self.sent[1]["If-None-Match"], '"v1"')
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.json(), {"name": "test-repo-1"})
+        self.assertEqual(second.headers["X-RateLimit-Remaining"], "4999")
+
+    def test_vary_on_token(self):
+        url = "https://api.github.com/repos/OCA/test-repo-1"
+        self.session.get(url, headers={"Authorization": "token A"})
+        self.session.get(url, headers={"Authorization": "token B"})
+        self.assertNotIn("If-None-Match", self.sent[1])
+
+    def test_no_cache_for_writes(self):
+        url = "https://api.github.com/repos/OCA/test-repo-1"
+        self.session.patch(url, json={"name": "test-repo-1"})
+        self.assertFalse(self.cache._entries())
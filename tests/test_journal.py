@@ -0,0 +1,48 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from oca_repo_maintainer.tools.journal import Journal
+from oca_repo_maintainer.tools.planner import Operation
+
+
+class TestJournal(TestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = Path(temp_dir.name) / "journal.jsonl"
+
+    def test_record_and_load(self):
+        journal = Journal(self.path)
+        journal.open()
+        journal.record_operation(Operation("create_team", "team-1"))
+        journal.record_checksum("psc/team-1", "abc")
+        journal.close()
+        # killed while writing
+        with self.path.open("a") as fd:
+            fd.write('{"op": "create_te')
+        journal = Journal(self.path).load()
+        self.assertEqual(journal.done, {"create_team:team-1"})
+        self.assertEqual(journal.checksum, {"psc/team-1": "abc"})
+        # resume keeps previous records
+        journal.open(resume=True)
+        journal.record_operation(Operation("create_team", "team-2"))
+        journal.close()
+        self.assertEqual(len(Journal(self.path).load().done), 2)
+        # new run
+        journal.open()
+        journal.close()
+        self.assertFalse(Journal(self.path).load().done)
+        journal.discard()
+        self.assertFalse(self.path.exists())
+
+    def test_not_open(self):
+        journal = Journal(self.path)
+        journal.record_operation(Operation("create_team", "team-1"))
+        self.assertFalse(self.path.exists())
+        self.assertEqual(journal.done, {"create_team:team-1"})
@@ -7,12 +7,18 @@
 import hashlib
 import json
 import os
+import shutil
 import tempfile
+from pathlib import Path
 from unittest import TestCase, mock
 
 import copier
+import yaml
 
+from oca_repo_maintainer.tools.conf_model import GlobalConf, build_model
+from oca_repo_maintainer.tools.gh_state import RepoState
 from oca_repo_maintainer.tools.manager import RepoManager
+from oca_repo_maintainer.tools.planner import Plan
 
 from .common import conf_path, conf_path2, vcr
 
@@ -26,78 +32,165 @@ class TestManager(TestCase):
         # SUPER IMPORTANT: after you do that,
         # replace the real token everywhere before staging changes
         self.token = "ghp_fake_test_token"
-        self.manager = RepoManager(conf_path.as_posix(), self.org, self.token)
+        # cassettes have been recorded w/ REST calls
+        self.manager = RepoManager(
+            conf_path.as_posix(), self.org, self.token, state_backend="rest"
+        )
 
     def test_init(self):
         self.assertEqual(self.manager.org, self.org)
         self.assertEqual(self.manager.token, self.token)
         self.assertEqual(
             self.manager.conf_global,
-            {
-                "owner": "board",
-                "template": "git+https://github.com/OCA/oca-addons-repo-template",
-                "team_maintainers": [],
-                "maintainers": [],
-            },
+            GlobalConf.from_dict(
+                {
+                    "owner": "board",
+                    "template": "git+https://github.com/OCA/oca-addons-repo-template",
+                    "team_maintainers": [],
+                    "maintainers": [],
+                }
+            ),
         )
         self.assertEqual(
             self.manager.conf_psc,
-            {
-                "test-team-1": {
-                    "name": "Test team 1",
-                    "members": ["simahawk"],
-                    "representatives": ["simahawk"],
-                },
-                "test-team-2": {
-                    "name": "Test team 2",
-                    "members": ["simahawk", "etobella"],
-                    "representatives": ["etobella"],
+            build_model(
+                "psc",
+                {
+                    "test-team-1": {
+                        "name": "Test team 1",
+                        "members": ["simahawk"],
+                        "representatives": ["simahawk"],
+                    },
+                    "test-team-2": {
+                        "name": "Test team 2",
+                        "members": ["simahawk", "etobella"],
+                        "representatives": ["etobella"],
+                    },
                 },
-            },
+            ),
         )
         self.assertEqual(
             self.manager.conf_repo,
-            {
-                "test-repo-1": {
-                    "name": "Test repo 1",
-                    "description": "Repo used to run real tests on oca-repo-manage tool.",
-                    "psc": "test-team-1",
-                    "maintainers": [],
-                    "default_branch": "16.0",
-                    "branches": ["16.0", "15.0"],
-                    "category": "Logistics",
-                },
-                "test-repo-2": {
-                    "name": "Repository 2",
-                    "description": "Repo used to run real tests on oca-repo-manage tool.",
-                    "psc": "test-team-2",
-                    "maintainers": ["simahawk"],
-                    "branches": ["13.0", "12.0"],
-                    "category": "Accounting",
+            build_model(
+                "repo",
+                {
+                    "test-repo-1": {
+                        "name": "Test repo 1",
+                        "description": "Repo used to run real tests on oca-repo-manage tool.",
+                        "psc": "test-team-1",
+                        "maintainers": [],
+                        "default_branch": "16.0",
+                        "branches": ["16.0", "15.0"],
+                        "category": "Logistics",
+                    },
+                    "test-repo-2": {
+                        "name": "Repository 2",
+                        "description": "Repo used to run real tests on oca-repo-manage tool.",
+                        "psc": "test-team-2",
+                        "maintainers": ["simahawk"],
+                        "branches": ["13.0", "12.0"],
+                        "category": "Accounting",
+                    },
                 },
-            },
+            ),
         )
         self.assertEqual(
-            self.manager.new_repo_template, self.manager.conf_global["template"]
+            self.manager.new_repo_template, self.manager.conf_global.template
         )
 
     def test_checksum(self):
         cs_filepath = conf_path / "checksum.yml"
         if cs_filepath.exists():
             os.remove(cs_filepath.as_posix())
-        for fname in ("psc/psc1", "psc/psc2", "repo/repo1", "repo/repo2"):
-            filepath = conf_path / f"{fname}.yml"
-            with filepath.open() as fd:
+        checksum = self.manager.conf_loader.checksum
+        for name in ("psc", "repo"):
+            conf = getattr(self.manager, f"conf_{name}")
+            for slug, data in conf.items():
                 self.assertEqual(
-                    self.manager.conf_loader.checksum[
-                        filepath.relative_to(conf_path).as_posix()
-                    ],
-                    hashlib.md5(fd.read().encode()).hexdigest(),
+                    checksum[f"{name}/{slug}"],
+                    hashlib.md5(
+                        json.dumps(data.to_dict(), sort_keys=True).encode()
+                    ).hexdigest(),
                 )
         self.manager._save_checksum()
         self.assertTrue(cs_filepath.exists())
         os.remove(cs_filepath.as_posix())
 
+    def test_checksum_per_entry(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(conf_path2.as_posix(), temp_dir, dirs_exist_ok=True)
+            manager = RepoManager(temp_dir, self.org, self.token)
+            manager._save_checksum()
+            filepath = Path(temp_dir) / "repo" / "repo1.yml"
+            conf = yaml.safe_load(filepath.read_text())
+            conf["test-repo-1"]["maintainers"] = ["simahawk"]
+            conf["test-repo-3"] = dict(conf["test-repo-1"], name="Test repo 3")
+            filepath.write_text(yaml.safe_dump(conf))
+            manager = RepoManager(temp_dir, self.org, self.token)
+            self.assertFalse(manager.conf_psc)
+            self.assertEqual(list(manager.conf_repo), ["test-repo-1", "test-repo-3"])
+            # the full conf is still available
+            self.assertEqual(
+                sorted(manager.conf_loader.full_conf("repo")),
+                ["test-repo-1", "test-repo-2", "test-repo-3"],
+            )
+            manager._save_checksum()
+            # removed entries are dropped from checksums
+            del conf["test-repo-3"]
+            filepath.write_text(yaml.safe_dump(conf))
+            manager = RepoManager(temp_dir, self.org, self.token)
+            self.assertFalse(manager.conf_repo)
+            self.assertNotIn("repo/test-repo-3", manager.conf_loader.checksum)
+
+    def _resume_plan(self, manager):
+        plan = Plan()
+        if "test-team-1" in manager.conf_psc:
+            plan.start_entry("psc/test-team-1")
+            plan.add("add_membership", "test-team-1", user="john", role="member")
+        plan.start_entry("psc/test-team-2")
+        plan.add("add_membership", "test-team-2", user="jane", role="member")
+        plan.add("add_membership", "test-team-2", user="john", role="member")
+        plan.start_entry("repo/test-repo-1")
+        return plan
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(conf_path2.as_posix(), temp_dir, dirs_exist_ok=True)
+            os.remove(os.path.join(temp_dir, "checksum.yml"))
+            journal_path = Path(temp_dir) / "journal.jsonl"
+            manager = RepoManager(temp_dir, self.org, self.token)
+
+            def add_membership(op):
+                if op.params["user"] == "john" and op.target == "test-team-2":
+                    raise Exception("Rate limit exceeded")
+
+            with mock.patch.object(RepoManager, "_setup_gh"), mock.patch.object(
+                RepoManager, "plan", autospec=True, side_effect=self._resume_plan
+            ):
+                with mock.patch.object(
+                    RepoManager, "_apply_add_membership", side_effect=add_membership
+                ):
+                    with self.assertRaisesRegex(Exception, "Rate limit"):
+                        manager.run()
+            self.assertFalse((Path(temp_dir) / "checksum.yml").exists())
+            self.assertTrue(journal_path.exists())
+            manager = RepoManager(temp_dir, self.org, self.token, resume=True)
+            # completed entries are not loaded again
+            self.assertEqual(list(manager.conf_psc), ["test-team-2"])
+            self.assertEqual(list(manager.conf_repo), ["test-repo-2"])
+            with mock.patch.object(RepoManager, "_setup_gh"), mock.patch.object(
+                RepoManager, "plan", autospec=True, side_effect=self._resume_plan
+            ):
+                with mock.patch.object(RepoManager, "_apply_add_membership") as apply:
+                    manager.run()
+            # jane was already added
+            self.assertEqual(
+                [call.args[0].params["user"] for call in apply.call_args_list],
+                ["john"],
+            )
+            self.assertFalse(journal_path.exists())
+            self.assertEqual(len(manager.conf_loader.checksum), 4)
+
     @vcr.use_cassette("setup_gh")
     def test_setup_gh(self):
         self.manager._setup_gh()
@@ -107,7 +200,12 @@ class TestManager(TestCase):
     def test_process_psc(self):
         with vcr.use_cassette("setup_gh"):
             self.manager._setup_gh()
-        with vcr.use_cassette("process_psc") as cassette:
+        # bodies are matched too: requests not sent anymore must not be recorded
+        with vcr.use_cassette(
+            "process_psc",
+            match_on=["method", "path", "query", "body"],
+            allow_playback_repeats=False,
+        ) as cassette:
             self.manager._process_psc()
         # check reques to get existing team
         expected_requests = (
@@ -126,12 +224,12 @@ class TestManager(TestCase):
                 "url": "https://api.github.com/organizations/119798021/team/8630739/members?role=maintainer&per_page=100",  # noqa
                 "method": "GET",
             },
-            # set simahawk as member
+            # get pending invitations
             {
-                "url": "https://api.github.com/organizations/119798021/team/8630739/memberships/simahawk",  # noqa
-                "method": "PUT",
-                "body": {"role": "member"},
+                "url": "https://api.github.com/organizations/119798021/team/8630739/invitations?per_page=100",  # noqa
+                "method": "GET",
             },
+            # simahawk is already a maintainer of team 1: nothing to change
             # get team 2 which does NOT exist
             {
                 "url": "https://api.github.com/orgs/OCA/teams/test-team-2",  # noqa
@@ -149,35 +247,23 @@ class TestManager(TestCase):
                     "privacy": "closed",
                 },
             },
-            # get members
-            {
-                "url": "https://api.github.com/organizations/119798021/team/8630747/members?role=member&per_page=100",  # noqa
-                "method": "GET",
-            },
-            # get maintainers
-            {
-                "url": "https://api.github.com/organizations/119798021/team/8630747/members?role=maintainer&per_page=100",  # noqa
-                "method": "GET",
-            },
+            # the new team has no member to read
             # set simahawk as member
             {
                 "url": "https://api.github.com/organizations/119798021/team/8630747/memberships/simahawk",  # noqa
                 "method": "PUT",
                 "body": {"role": "member"},
             },
-            # set etobella as member
-            {
-                "url": "https://api.github.com/organizations/119798021/team/8630747/memberships/etobella",  # noqa
-                "method": "PUT",
-                "body": {"role": "member"},
-            },
-            # set etobella as maintainer
+            # set etobella as maintainer, w/o setting etobella as member first
             {
                 "url": "https://api.github.com/organizations/119798021/team/8630747/memberships/etobella",  # noqa
                 "method": "PUT",
                 "body": {"role": "maintainer"},
             },
         )
+        # all the recorded requests, and only them, have been sent once
+        self.assertTrue(cassette.all_played)
+        self.assertEqual(len(cassette.requests), len(expected_requests))
         for req, expected in zip(cassette.requests, expected_requests):
             for k in ("url", "method"):
                 self.assertEqual(getattr(req, k), expected[k])
@@ -198,14 +284,12 @@ class TestManager(TestCase):
             return clone_dir_2
 
         with vcr.use_cassette("process_repositories") as cassette:
-            with (
-                mock.patch.object(tempfile, "mkdtemp", mkdtemp),
-                mock.patch.object(RepoManager, "_run_cmd") as run_cmd,
-                # FIXME: this must be tested too
-                mock.patch.object(RepoManager, "_setup_user"),
-                mock.patch.object(copier, "run_copy") as run_copy,
-            ):
-                self.manager._process_repositories()
+            with mock.patch.object(tempfile, "mkdtemp", mkdtemp):
+                with mock.patch.object(RepoManager, "_run_cmd") as run_cmd:
+                    # FIXME: this must be tested too
+                    with mock.patch.object(RepoManager, "_setup_user"):
+                        with mock.patch.object(copier, "run_copy") as run_copy:
+                            self.manager._process_repositories()
 
         # check 2 calls to copier, 1 for branch 13 and one for branch 12
         expected_copier_cmd = (
@@ -318,6 +402,111 @@ class TestManager(TestCase):
             if expected.get("body"):
                 self.assertEqual(json.loads(req.body), expected["body"])
 
+    def _assert_read_only(self, cassette):
+        for i, (req, __) in enumerate(cassette.data):
+            if cassette.play_counts[i]:
+                self.assertEqual(req.method, "GET", f"{req.uri} must not be called")
+
+    def test_plan_psc(self):
+        with vcr.use_cassette("setup_gh"):
+            self.manager._setup_gh()
+        with vcr.use_cassette("process_psc") as cassette:
+            plan = self.manager._plan_psc(Plan())
+        self._assert_read_only(cassette)
+        self.assertEqual(
+            [str(op) for op in plan],
+            [
+                # simahawk is already maintainer of test-team-1
+                "create_team test-team-2",
+                "add_membership test-team-2 user=simahawk role=member",
+                "add_membership test-team-2 user=etobella role=maintainer",
+            ],
+        )
+        self.assertEqual(plan.api_calls, 3)
+
+    def test_plan_repositories(self):
+        with vcr.use_cassette("setup_gh"):
+            self.manager._setup_gh()
+        with vcr.use_cassette("process_repositories") as cassette:
+            plan = self.manager._plan_repositories(Plan())
+        self._assert_read_only(cassette)
+        # repos order depends on the file system
+        self.assertCountEqual(
+            [str(op) for op in plan],
+            [
+                "set_default_branch test-repo-1 branch=16.0",
+                "create_repo test-repo-2",
+                "add_team_repo test-team-2 repo=test-repo-2 permission=push",
+                "add_collaborator test-repo-2 user=simahawk",
+                "create_branch test-repo-2 branch=12.0",
+                "create_branch test-repo-2 branch=13.0",
+            ],
+        )
+
+    def test_create_branch_via_api(self):
+        manager = RepoManager(
+            conf_path.as_posix(),
+            self.org,
+            self.token,
+            state_backend="rest",
+            branch_backend="api",
+        )
+        manager.fetcher = mock.Mock()
+        repo_state = RepoState("test-repo-2", branches=[])
+        manager.fetcher.repository.return_value = repo_state
+        gh_repo = mock.Mock()
+        gh_repo.name = "test-repo-2"
+        gh_repo.create_blob.return_value = "blob-sha"
+        gh_repo.create_tree.return_value.sha = "tree-sha"
+        gh_repo.create_commit.return_value.sha = "commit-sha"
+
+        def run_copy(template, dest_dir, **kw):
+            with open(os.path.join(dest_dir, "README.md"), "w") as fd:
+                fd.write("# test-repo-2")
+            os.makedirs(os.path.join(dest_dir, "setup"))
+            with open(os.path.join(dest_dir, "setup", "logo.png"), "wb") as fd:
+                fd.write(b"\x89PNG\xff")
+
+        with mock.patch.object(copier, "run_copy", run_copy), mock.patch.object(
+            RepoManager, "_run_cmd"
+        ) as run_cmd:
+            manager._create_branch(gh_repo, "16.0")
+        run_cmd.assert_not_called()
+        # empty repo: initialized before using the API
+        gh_repo.create_file.assert_called_once_with(
+            ".gitkeep", "Initialize repository", b"\n", branch="16.0"
+        )
+        self.assertEqual(repo_state.branches, {"16.0"})
+        gh_repo.create_blob.assert_called_once_with("iVBOR/8=", "base64")
+        self.assertEqual(
+            gh_repo.create_tree.call_args.args[0],
+            [
+                {
+                    "path": "README.md",
+                    "type": "blob",
+                    "mode": "100644",
+                    "content": "# test-repo-2",
+                },
+                {
+                    "path": "setup/logo.png",
+                    "type": "blob",
+                    "mode": "100644",
+                    "sha": "blob-sha",
+                },
+            ],
+        )
+        gh_repo.create_commit.assert_called_once_with("Initial commit", "tree-sha", [])
+        gh_repo.ref.assert_called_once_with("heads/16.0")
+        gh_repo.ref.return_value.update.assert_called_once_with(
+            "commit-sha", force=True
+        )
+        # not empty anymore: the branch is created directly
+        gh_repo.reset_mock()
+        with mock.patch.object(copier, "run_copy", run_copy):
+            manager._create_branch(gh_repo, "15.0")
+        gh_repo.create_file.assert_not_called()
+        gh_repo.create_ref.assert_called_once_with("refs/heads/15.0", "commit-sha")
+
     def _expected_copier_cmd(self, clone_dir, branch):
         return {
             "cmd": ("git+https://github.com/OCA/oca-addons-repo-template", clone_dir),
@@ -0,0 +1,118 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+from click.testing import CliRunner
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+
+from oca_repo_maintainer.cli.manage import add_branch
+from oca_repo_maintainer.tools.metrics import Metrics, endpoint_template
+
+from .common import conf_path
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = Metrics(command="test")
+        self.session = self.metrics.install(requests.Session())
+        patcher = mock.patch.object(HTTPAdapter, "send", self._send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _send(self, request, **kw):
+        response = Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = 404 if "missing" in request.url else 200
+        response.headers["X-RateLimit-Limit"] = "5000"
+        response.headers["X-RateLimit-Remaining"] = str(4999 - len(request.url))
+        response._content = b"{}"
+        return response
+
+    def test_endpoint_template(self):
+        for url, expected in (
+            ("https://api.github.com/orgs/OCA", "/orgs/{org}"),
+            ("https://api.github.com/orgs/OCA/teams/web", "/orgs/{org}/teams/{team}"),
+            (
+                "https://api.github.com/organizations/1/team/2/members?role=member",
+                "/organizations/{org_id}/team/{team_id}/members",
+            ),
+            (
+                "https://api.github.com/repos/OCA/web/branches/16.0",
+                "/repos/{owner}/{repo}/branches/{branch}",
+            ),
+            (
+                "https://ghe.example.com/api/v3/repos/OCA/web/git/ref/heads/16.0",
+                "/repos/{owner}/{repo}/git/ref/{ref}",
+            ),
+            ("https://api.github.com/graphql", "/graphql"),
+        ):
+            self.assertEqual(endpoint_template(url), expected)
+
+    def test_requests(self):
+        self.session.get("https://api.github.com/repos/OCA/web")
+        self.session.get("https://api.github.com/repos/OCA/server-tools")
+        self.session.get("https://api.github.com/repos/OCA/missing")
+        self.session.post("https://api.github.com/graphql")
+        report = self.metrics.report()
+        self.assertEqual(report["command"], "test")
+        self.assertEqual(report["requests"]["total"], 4)
+        self.assertEqual(report["requests"]["errors"], 1)
+        self.assertEqual(
+            [
+                (x["method"], x["endpoint"], x["count"])
+                for x in report["requests"]["endpoints"]
+            ],
+            [("GET", "/repos/{owner}/{repo}", 3), ("POST", "/graphql", 1)],
+        )
+        self.assertEqual(
+            report["rate_limit"],
+            {
+                "remaining": 4999 - len("https://api.github.com/graphql"),
+                "min_remaining": 4999
+                - len("https://api.github.com/repos/OCA/server-tools"),
+                "limit": 5000,
+            },
+        )
+
+    def test_phase(self):
+        with self.metrics.phase("plan"):
+            pass
+        with self.assertRaises(ValueError):
+            with self.metrics.phase("plan"):
+                raise ValueError()
+        self.assertEqual(self.metrics.report()["phases"]["plan"]["count"], 2)
+
+    def test_cli(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        conf_dir = os.path.join(temp_dir.name, "conf")
+        shutil.copytree(conf_path, conf_dir)
+        metrics_path = os.path.join(temp_dir.name, "metrics.json")
+        result = CliRunner().invoke(
+            add_branch,
+            [
+                "--conf-dir",
+                conf_dir,
+                "--branch",
+                "18.0",
+                "--no-cache",
+                "--metrics-out",
+                metrics_path,
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(metrics_path) as fd:
+            report = json.load(fd)
+        self.assertEqual(report["command"], "add-branch")
+        self.assertEqual(sorted(report["phases"]), ["add_branch", "load_conf"])
+        self.assertEqual(report["requests"]["total"], 0)
@@ -0,0 +1,155 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase, mock
+
+from oca_repo_maintainer.tools.conf_model import GlobalConf, build_model
+from oca_repo_maintainer.tools.gh_state import RepoState, TeamState
+from oca_repo_maintainer.tools.planner import MembershipDiff, Plan, Planner
+
+
+class TestMembershipDiff(TestCase):
+    def test_diff(self):
+        diff = MembershipDiff(
+            {"john": "member", "jane": "maintainer", "joe": "member", "max": "member"},
+            {"john": "maintainer", "jane": "maintainer", "old": "member"},
+            pending={"joe": "member", "gone": "member"},
+        )
+        self.assertEqual(diff.add, {"max": "member"})
+        self.assertEqual(diff.change_role, {"john": "member"})
+        # pending invitations not wanted anymore are revoked too
+        self.assertEqual(diff.remove, {"old", "gone"})
+        self.assertEqual(diff.reinvite, {})
+
+    def test_diff_pending_role(self):
+        diff = MembershipDiff(
+            {"joe": "maintainer", "jane": "member", "max": "member"},
+            {},
+            pending={"joe": "member", "jane": "member", "max": None},
+        )
+        # invited w/ the wrong role: invited again
+        self.assertEqual(diff.reinvite, {"joe": "maintainer"})
+        # right or unknown role: left alone
+        self.assertEqual(diff.add, {})
+        self.assertEqual(diff.remove, set())
+
+
+class TestPlanner(TestCase):
+    def test_plan_teams(self):
+        fetcher = mock.Mock()
+        fetcher.team.side_effect = lambda slug, **kw: {
+            "team-1": TeamState(
+                "team-1",
+                members=["simahawk", "old"],
+                maintainers=["etobella"],
+                pending=["john"],
+            )
+        }.get(slug)
+        planner = Planner(GlobalConf(maintainers=["simahawk"]), fetcher)
+        conf_psc = build_model(
+            "psc",
+            {
+                "team-1": {
+                    "members": ["simahawk", "john", "jane"],
+                    "representatives": ["simahawk"],
+                },
+                "team-2": {"members": ["jane"]},
+            },
+        )
+        plan = planner.plan_teams(Plan(), conf_psc)
+        self.assertEqual(
+            [str(op) for op in plan],
+            [
+                "revoke_membership team-1 user=etobella",
+                "revoke_membership team-1 user=old",
+                "change_membership_role team-1 user=simahawk role=maintainer",
+                "add_membership team-1 user=jane role=member",
+                "create_team team-2",
+                "add_membership team-2 user=jane role=member",
+                "add_membership team-2 user=simahawk role=member",
+            ],
+        )
+
+    def test_plan_teams_pending_role(self):
+        fetcher = mock.Mock()
+        fetcher.team.return_value = TeamState(
+            "team-1",
+            members=[],
+            maintainers=[],
+            pending={"john": "member", "jane": "member"},
+        )
+        planner = Planner(GlobalConf(), fetcher)
+        conf_psc = build_model(
+            "psc",
+            {"team-1": {"members": ["jane"], "representatives": ["john"]}},
+        )
+        plan = planner.plan_teams(Plan(), conf_psc)
+        self.assertEqual(
+            [str(op) for op in plan],
+            [
+                "revoke_membership team-1 user=john",
+                "add_membership team-1 user=john role=maintainer",
+            ],
+        )
+        # the invitation is sent again once the wrong one is canceled
+        cancel_op, invite_op = plan
+        self.assertEqual(invite_op.requires, {cancel_op.key})
+
+    def _repo_fetcher(self):
+        fetcher = mock.Mock()
+        repo_state = RepoState(
+            "repo-1",
+            default_branch="16.0",
+            branches=["16.0"],
+            collaborators=["simahawk", "old"],
+        )
+        fetcher.repository.return_value = repo_state
+        fetcher.repo_invitations.return_value = {"john": 1, "gone": 2}
+        fetcher.team.return_value = TeamState("team-1", repos={"repo-1": "push"})
+        return fetcher
+
+    def test_plan_collaborators(self):
+        conf_repo = build_model(
+            "repo",
+            {
+                "repo-1": {
+                    "psc": "team-1",
+                    "maintainers": ["simahawk", "john", "jane", "jane"],
+                    "branches": ["16.0"],
+                }
+            },
+        )
+        fetcher = self._repo_fetcher()
+        plan = Planner(GlobalConf(), fetcher).plan_repositories(Plan(), conf_repo)
+        self.assertEqual(
+            [str(op) for op in plan], ["add_collaborator repo-1 user=jane"]
+        )
+        fetcher = self._repo_fetcher()
+        planner = Planner(GlobalConf(), fetcher, prune_collaborators=True)
+        plan = planner.plan_repositories(Plan(), conf_repo)
+        self.assertEqual(
+            [str(op) for op in plan],
+            [
+                "add_collaborator repo-1 user=jane",
+                "remove_collaborator repo-1 user=old",
+                "cancel_invitation repo-1 user=gone invitation=2",
+            ],
+        )
+
+    def test_plan_collaborators_no_change(self):
+        conf_repo = build_model(
+            "repo",
+            {
+                "repo-1": {
+                    "psc": "team-1",
+                    "maintainers": ["simahawk"],
+                    "branches": ["16.0"],
+                }
+            },
+        )
+        fetcher = self._repo_fetcher()
+        plan = Planner(GlobalConf(), fetcher).plan_repositories(Plan(), conf_repo)
+        self.assertFalse(len(plan))
+        # invitations are checked only when somebody is missing
+        fetcher.repo_invitations.assert_not_called()
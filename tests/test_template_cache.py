@@ -0,0 +1,146 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import filecmp
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import copier
+
+from oca_repo_maintainer.tools.template_cache import TemplateCache
+
+COPIER_YML = """
+repo_name:
+  type: str
+repo_slug:
+  type: str
+repo_description:
+  type: str
+odoo_version:
+  type: str
+_subdirectory: template
+"""
+
+
+class TestTemplateCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name)
+        self.template = self.root / "template-repo"
+
+    def _make_template(self, files):
+        tmpl_dir = self.template / "template"
+        tmpl_dir.mkdir(parents=True)
+        (self.template / "copier.yml").write_text(COPIER_YML)
+        (tmpl_dir / "{{ _copier_conf.answers_file }}.jinja").write_text(
+            "{{ _copier_answers|to_nice_yaml }}"
+        )
+        for name, content in files.items():
+            path = tmpl_dir / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@test"]
+        for cmd in (["init", "-q"], ["add", "-A"], ["commit", "-q", "-m", "init"]):
+            subprocess.run(git + cmd, cwd=self.template, check=True)
+
+    def _data(self, repo):
+        return {
+            "repo_name": repo,
+            "repo_slug": repo,
+            "repo_description": repo,
+            "odoo_version": "16.0",
+        }
+
+    def _render(self, cache, repo):
+        dest = self.root / "cached" / repo
+        dest.mkdir(parents=True)
+        cache.render(dest.as_posix(), self._data(repo))
+        return dest
+
+    def _render_plain(self, cache, repo):
+        dest = self.root / "plain" / repo
+        copier.run_copy(
+            cache._src_path,
+            dest.as_posix(),
+            defaults=True,
+            unsafe=True,
+            vcs_ref=cache._vcs_ref,
+            data=self._data(repo),
+        )
+        # same as cached renders
+        cache._replace_in_tree(dest, {cache._src_path: cache.template})
+        return dest
+
+    def _assert_same_tree(self, left, right):
+        cmp = filecmp.dircmp(left, right)
+        self.assertFalse(cmp.left_only or cmp.right_only or cmp.diff_files)
+        for sub in cmp.common_dirs:
+            self._assert_same_tree(left / sub, right / sub)
+
+    def test_render_once(self):
+        self._make_template(
+            {
+                "README.md.jinja": "# {{ repo_name }}\n\nOdoo {{ odoo_version }}\n",
+                "setup/{{ repo_slug }}/README.jinja": "{{ repo_description }}\n",
+                "LICENSE": "AGPL\n",
+            }
+        )
+        cache = TemplateCache(f"git+{self.template.as_posix()}")
+        self.addCleanup(cache.cleanup)
+        with mock.patch.object(copier, "run_copy", wraps=copier.run_copy) as run:
+            renders = [self._render(cache, x) for x in ("repo-1", "repo-2", "repo-3")]
+        # rendered twice for the version, then copied
+        self.assertEqual(run.call_count, 2)
+        for dest in renders:
+            self._assert_same_tree(dest, self._render_plain(cache, dest.name))
+        self.assertEqual((renders[1] / "setup/repo-2/README").read_text(), "repo-2\n")
+        answers = (renders[0] / ".copier-answers.yml").read_text()
+        self.assertIn(f"_src_path: git+{self.template.as_posix()}", answers)
+
+    def test_render_transformed_answers(self):
+        self._make_template({"README.md.jinja": "# {{ repo_name|upper }}\n"})
+        cache = TemplateCache(self.template.as_posix())
+        self.addCleanup(cache.cleanup)
+        with mock.patch.object(copier, "run_copy", wraps=copier.run_copy) as run:
+            renders = [self._render(cache, x) for x in ("repo-1", "repo-2")]
+        # fallback: rendered for each repo
+        self.assertEqual(run.call_count, 4)
+        self.assertEqual((renders[1] / "README.md").read_text(), "# REPO-2\n")
+
+    def test_render_latest_tag(self):
+        self._make_template({"README.md.jinja": "# {{ repo_name }} 1\n"})
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@test"]
+        readme = self.template / "template" / "README.md.jinja"
+        for content, tag in (
+            (None, "v1.0.0"),
+            ("# {{ repo_name }} 2\n", "v2.0.0a1"),
+            ("# {{ repo_name }} 3\n", "not-a-version"),
+        ):
+            if content:
+                readme.write_text(content)
+                subprocess.run(
+                    git + ["commit", "-q", "-am", content],
+                    cwd=self.template,
+                    check=True,
+                )
+            subprocess.run(git + ["tag", tag], cwd=self.template, check=True)
+        cache = TemplateCache(f"git+{self.template.as_posix()}")
+        self.addCleanup(cache.cleanup)
+        dest = self._render(cache, "repo-1")
+        # like copier w/o vcs_ref: latest release, not HEAD
+        self.assertEqual(cache._vcs_ref, "v1.0.0")
+        self.assertEqual((dest / "README.md").read_text(), "# repo-1 1\n")
+        plain = self.root / "plain" / "repo-1"
+        copier.run_copy(
+            self.template.as_posix(),
+            plain.as_posix(),
+            defaults=True,
+            unsafe=True,
+            data=self._data("repo-1"),
+        )
+        self.assertEqual((plain / "README.md").read_text(), "# repo-1 1\n")
@@ -0,0 +1,80 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import stat
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import yaml
+
+from oca_repo_maintainer.tools import utils
+from oca_repo_maintainer.tools.utils import ConfLoader
+
+from .common import conf_path
+
+
+class TestConfLoader(TestCase):
+    def _legacy_load(self, name):
+        conf = {}
+        for filepath in (conf_path / name).rglob("*.yml"):
+            with filepath.open() as fd:
+                conf.update(yaml.safe_load(fd.read()))
+        return conf
+
+    def test_load_conf_merge_order(self):
+        loader = ConfLoader(conf_path)
+        for name in ("psc", "repo"):
+            conf = loader.load_conf(name, checksum=False)
+            expected = self._legacy_load(name)
+            self.assertEqual(conf, expected)
+            self.assertEqual(list(conf), list(expected))
+
+    def test_load_conf_single_scan(self):
+        loader = ConfLoader(conf_path)
+        loader._scan_conf_dir()
+        with mock.patch.object(
+            type(conf_path), "rglob", side_effect=AssertionError("rescan")
+        ):
+            loader.load_conf("psc", checksum=False)
+            loader.load_conf("repo", checksum=False)
+
+    def test_load_conf_parallel(self):
+        sequential = ConfLoader(conf_path).load_conf("repo", checksum=False)
+        loader = ConfLoader(conf_path, max_workers=2)
+        with mock.patch.object(utils, "PARALLEL_THRESHOLD", 0):
+            parallel = loader.load_conf("repo", by_filepath=True)
+        self.assertEqual(list(parallel), loader._conf_filepaths("repo"))
+        merged = {}
+        for data in parallel.values():
+            merged.update(data)
+        self.assertEqual(merged, sequential)
+        self.assertEqual(len(loader.checksum), len(sequential))
+
+    def test_load_conf_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            expected = ConfLoader(conf_path).load_conf("repo", checksum=False)
+            conf = ConfLoader(conf_path, cache_dir=cache_dir).load_conf(
+                "repo", checksum=False
+            )
+            self.assertEqual(conf, expected)
+            loader = ConfLoader(conf_path, cache_dir=cache_dir)
+            with mock.patch.object(utils, "yaml_load") as yaml_load:
+                conf = loader.load_conf("repo", checksum=False)
+            yaml_load.assert_not_called()
+            self.assertEqual(conf, expected)
+
+
+class TestWriteIfChanged(TestCase):
+    def test_mode(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "conf.yml"
+            self.assertTrue(utils.write_if_changed("a: 1\n", path))
+            self.assertEqual(stat.S_IMODE(path.stat().st_mode), utils.NEW_FILE_MODE)
+            path.chmod(0o640)
+            self.assertTrue(utils.write_if_changed("a: 2\n", path))
+            self.assertEqual(path.read_text(), "a: 2\n")
+            # the mode of the replaced file is kept
+            self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o640)
+            self.assertFalse(utils.write_if_changed("a: 2\n", path))
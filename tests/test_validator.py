@@ -0,0 +1,125 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from click.testing import CliRunner
+
+from oca_repo_maintainer.cli.manage import manage
+from oca_repo_maintainer.cli.validate import validate
+from oca_repo_maintainer.tools.validator import ConfValidator
+
+from .common import conf_path, conf_path_with_tools
+
+
+class TestValidator(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.conf_dir = self.tmp_dir / "conf"
+        shutil.copytree(conf_path, self.conf_dir)
+        self.cache_dir = self.tmp_dir / "cache"
+
+    def _validate(self, **kw):
+        return [str(x) for x in ConfValidator(self.conf_dir, **kw).validate()]
+
+    def _break_conf(self):
+        (self.conf_dir / "repo" / "broken.yml").write_text(
+            "broken-repo:\n"
+            "  name: Broken\n"
+            "  psc: unknown-team\n"
+            "  branches: [16.0, '17.0']\n"
+            "  default_branch: '18.0'\n"
+            "no-psc-repo:\n"
+            "  name: No psc\n"
+            "  branches: []\n"
+        )
+        (self.conf_dir / "psc" / "broken.yml").write_text(
+            "broken-team:\n  name: Broken\n  members: []\n"
+        )
+
+    def test_valid(self):
+        self.assertEqual(self._validate(), [])
+        self.assertEqual(ConfValidator(conf_path_with_tools).validate(), [])
+
+    def test_problems(self):
+        self._break_conf()
+        self.assertEqual(
+            self._validate(),
+            [
+                "psc/broken.yml: broken-team: missing representatives",
+                "repo/broken.yml: broken-repo: branches: 16.0 must be quoted "
+                "to be a string",
+                "repo/broken.yml: broken-repo: default_branch 18.0 not in branches",
+                "repo/broken.yml: broken-repo: unknown psc unknown-team",
+                "repo/broken.yml: no-psc-repo: missing psc",
+            ],
+        )
+
+    def test_invalid_yaml(self):
+        (self.conf_dir / "repo" / "broken.yml").write_text("broken: [\n")
+        problems = self._validate()
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(problems[0].startswith("repo/broken.yml: invalid YAML:"))
+        self.assertIn("line", problems[0])
+
+    def test_duplicated_slug(self):
+        repo1 = (self.conf_dir / "repo" / "repo1.yml").read_text()
+        (self.conf_dir / "repo" / "copy.yml").write_text(repo1)
+        problems = self._validate()
+        self.assertTrue(problems)
+        self.assertTrue(all("already defined in repo/" in x for x in problems))
+
+    def test_cache(self):
+        self._break_conf()
+        expected = self._validate(cache_dir=self.cache_dir)
+        with mock.patch.object(ConfValidator, "_check_content") as check:
+            self.assertEqual(self._validate(cache_dir=self.cache_dir), expected)
+        check.assert_not_called()
+        # only changed files are checked again
+        (self.conf_dir / "psc" / "broken.yml").write_text(
+            "broken-team:\n  name: Broken\n  members: []\n  representatives: []\n"
+        )
+        with mock.patch.object(
+            ConfValidator, "_check_content", autospec=True, return_value=({}, [])
+        ) as check:
+            self._validate(cache_dir=self.cache_dir)
+        check.assert_called_once()
+
+    def test_cli(self):
+        runner = CliRunner()
+        result = runner.invoke(
+            validate, ["--conf-dir", str(self.conf_dir), "--no-cache"]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self._break_conf()
+        result = runner.invoke(
+            validate, ["--conf-dir", str(self.conf_dir), "--no-cache"]
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(len(result.output.splitlines()), 5)
+
+    def test_manage_gate(self):
+        self._break_conf()
+        with mock.patch("oca_repo_maintainer.cli.manage.RepoManager") as manager:
+            result = CliRunner().invoke(
+                manage,
+                [
+                    "--conf-dir",
+                    str(self.conf_dir),
+                    "--token",
+                    "TOKEN",
+                    "--org",
+                    "test-org",
+                    "--no-cache",
+                ],
+            )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("Invalid configuration", result.output)
+        self.assertIn("unknown psc unknown-team", result.output)
+        manager.assert_not_called()
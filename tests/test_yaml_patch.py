@@ -0,0 +1,115 @@
+# Copyright 2024 Camptocamp SA
+# @author: Simone Orsi
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl)
+
+from unittest import TestCase
+
+from oca_repo_maintainer.tools.yaml_patch import format_scalar, patch_yaml
+
+CONTENT = """# Repos
+test-repo:
+  name: Test repo  # shown in pages
+  default_branch: '16.0'
+  branches:
+    - "16.0"  # current
+  maintainers: []
+  manual_branch_mgmt: false
+"""
+
+
+class TestYamlPatch(TestCase):
+    def _data(self, **values):
+        data = {
+            "test-repo": {
+                "name": "Test repo",
+                "default_branch": "16.0",
+                "branches": ["16.0"],
+                "maintainers": [],
+                "manual_branch_mgmt": False,
+            }
+        }
+        data["test-repo"].update(values)
+        return data
+
+    def test_unchanged(self):
+        self.assertEqual(patch_yaml(CONTENT, self._data()), CONTENT)
+
+    def test_patch(self):
+        content = patch_yaml(
+            CONTENT,
+            self._data(
+                default_branch="17.0",
+                branches=["16.0", "17.0"],
+                maintainers=["simahawk", "etobella"],
+                manual_branch_mgmt=True,
+            ),
+        )
+        self.assertEqual(
+            content,
+            """# Repos
+test-repo:
+  name: Test repo  # shown in pages
+  default_branch: '17.0'
+  branches:
+    - "16.0"  # current
+    - "17.0"
+  maintainers: ["simahawk", "etobella"]
+  manual_branch_mgmt: true
+""",
+        )
+
+    def test_remove(self):
+        content = CONTENT.replace(
+            '    - "16.0"  # current\n',
+            '    - "15.0"\n    - "16.0"  # current\n    - "14.0"\n',
+        )
+        data = self._data(branches=["16.0"])
+        del data["test-repo"]["maintainers"]
+        self.assertEqual(
+            patch_yaml(content, data), CONTENT.replace("  maintainers: []\n", "")
+        )
+
+    def test_insert(self):
+        data = self._data(psc="test-team", maintainers=["simahawk"])
+        del data["test-repo"]["manual_branch_mgmt"]
+        data["other-repo"] = {"name": "Other repo", "branches": ["16.0"]}
+        self.assertEqual(
+            patch_yaml(CONTENT, data),
+            """# Repos
+test-repo:
+  name: Test repo  # shown in pages
+  default_branch: '16.0'
+  branches:
+    - "16.0"  # current
+  maintainers: ["simahawk"]
+  psc: test-team
+other-repo:
+  name: Other repo
+  branches:
+    - "16.0"
+""",
+        )
+
+    def test_insert_indentless(self):
+        content = CONTENT.replace('    - "16.0"', '  - "16.0"')
+        data = self._data()
+        data["other-repo"] = {"name": "Other repo", "branches": ["16.0"]}
+        self.assertEqual(
+            patch_yaml(content, data),
+            content + 'other-repo:\n  name: Other repo\n  branches:\n  - "16.0"\n',
+        )
+
+    def test_unsupported(self):
+        self.assertIsNone(patch_yaml(CONTENT, self._data(branches=["16.0", ["17.0"]])))
+        self.assertIsNone(patch_yaml(CONTENT, self._data(branches=[])))
+        self.assertIsNone(patch_yaml(CONTENT, self._data(name={"en": "Test"})))
+        self.assertIsNone(patch_yaml("", {}))
+
+    def test_format_scalar(self):
+        self.assertEqual(format_scalar("16.0"), '"16.0"')
+        self.assertEqual(format_scalar("16.0", style="'"), "'16.0'")
+        self.assertEqual(format_scalar("simahawk"), "simahawk")
+        self.assertEqual(format_scalar("a: b"), '"a: b"')
+        self.assertEqual(format_scalar("true"), '"true"')
+        self.assertEqual(format_scalar(True), "true")
+        self.assertEqual(format_scalar(18), "18")